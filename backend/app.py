@@ -4,6 +4,7 @@ from starlette.middleware.sessions import SessionMiddleware
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
 
 from config.settings import get_settings
+from core.executors import ExecutorSaturated, executor_saturated_handler
 from controllers.agent_controller import router as agent_router
 from controllers.course_controller import router as course_router
 from controllers.health_controller import router as health_router
@@ -48,6 +49,9 @@ def create_app() -> FastAPI:
         same_site="none"
     )
 
+    # A saturated backend executor turns requests away with 503 and Retry-After
+    app.add_exception_handler(ExecutorSaturated, executor_saturated_handler)
+
     app.include_router(health_router, prefix=settings.api_prefix)
     app.include_router(user_router, prefix=settings.api_prefix)
     app.include_router(course_router, prefix=settings.api_prefix)
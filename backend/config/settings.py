@@ -1,5 +1,5 @@
 from functools import lru_cache
-from typing import Any
+from typing import Any, Literal
 
 from pydantic import AliasChoices, Field, model_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict  # type: ignore[import-untyped]
@@ -38,11 +38,111 @@ class Settings(BaseSettings):
         default="health_checks",
         description="Collection used for Firestore connectivity checks.",
     )
+    firestore_executor_workers: int = Field(
+        default=64,
+        description="Firestore calls allowed in flight at once.",
+        validation_alias=AliasChoices("FIRESTORE_EXECUTOR_WORKERS"),
+    )
+    firestore_executor_max_queue: int = Field(
+        default=256,
+        description="Firestore calls allowed to wait for a free slot; beyond that requests get a 503.",
+        validation_alias=AliasChoices("FIRESTORE_EXECUTOR_MAX_QUEUE"),
+    )
+    storage_backend: Literal["gcs", "local"] = Field(
+        default="gcs",
+        description="Where agent files are stored: a GCS bucket, or a directory on local disk.",
+        validation_alias=AliasChoices("STORAGE_BACKEND"),
+    )
+    storage_local_root: str | None = Field(
+        default=None,
+        description="Directory holding the files when STORAGE_BACKEND is local.",
+        validation_alias=AliasChoices("STORAGE_LOCAL_ROOT"),
+    )
     gcs_bucket_name: str | None = Field(
         default=None,
         description="Google Cloud Storage bucket name for file uploads.",
         validation_alias=AliasChoices("GCS_BUCKET_NAME", "GOOGLE_CLOUD_STORAGE_BUCKET"),
     )
+    storage_cache_max_bytes: int = Field(
+        default=64 * 1024 * 1024,
+        description="Total byte budget of the in-process blob content cache.",
+        validation_alias=AliasChoices("STORAGE_CACHE_MAX_BYTES"),
+    )
+    storage_cache_max_entry_bytes: int = Field(
+        default=8 * 1024 * 1024,
+        description="Blobs larger than this are never cached.",
+        validation_alias=AliasChoices("STORAGE_CACHE_MAX_ENTRY_BYTES"),
+    )
+    storage_cache_revalidate_seconds: float = Field(
+        default=0.0,
+        description=(
+            "Seconds a cached blob is served without checking its generation against GCS. "
+            "0 checks on every read, so writes from other instances are seen at once."
+        ),
+        validation_alias=AliasChoices("STORAGE_CACHE_REVALIDATE_SECONDS"),
+    )
+    storage_line_index_min_bytes: int = Field(
+        default=256 * 1024,
+        description="Text files at least this large get a line-offset index for ranged line reads.",
+        validation_alias=AliasChoices("STORAGE_LINE_INDEX_MIN_BYTES"),
+    )
+    storage_range_read_max_bytes: int = Field(
+        default=4 * 1024 * 1024,
+        description="Largest byte range returned by a single byte-range file read.",
+        validation_alias=AliasChoices("STORAGE_RANGE_READ_MAX_BYTES"),
+    )
+    storage_search_index_max_file_bytes: int = Field(
+        default=16 * 1024 * 1024,
+        description="Files larger than this are left out of the trigram search index and always scanned.",
+        validation_alias=AliasChoices("STORAGE_SEARCH_INDEX_MAX_FILE_BYTES"),
+    )
+    storage_scan_max_concurrency: int = Field(
+        default=16,
+        description="Blob downloads the content-search scan pool runs at once across all requests.",
+        validation_alias=AliasChoices("STORAGE_SCAN_MAX_CONCURRENCY"),
+    )
+    storage_scan_request_concurrency: int = Field(
+        default=8,
+        description="Blob downloads a single content search may have in flight.",
+        validation_alias=AliasChoices("STORAGE_SCAN_REQUEST_CONCURRENCY"),
+    )
+    storage_executor_workers: int = Field(
+        default=32,
+        description="Threads running blocking storage calls (content-search downloads use the scan pool).",
+        validation_alias=AliasChoices("STORAGE_EXECUTOR_WORKERS"),
+    )
+    storage_executor_max_queue: int = Field(
+        default=512,
+        description="Storage calls allowed to wait for a thread; beyond that requests get a 503.",
+        validation_alias=AliasChoices("STORAGE_EXECUTOR_MAX_QUEUE"),
+    )
+    storage_async_io: bool = Field(
+        default=True,
+        description="Serve plain GCS reads, writes, listings and deletes on the event loop over the JSON API "
+        "instead of a worker thread per call.",
+        validation_alias=AliasChoices("STORAGE_ASYNC_IO"),
+    )
+    storage_async_max_connections: int = Field(
+        default=256,
+        description="Connections the shared async GCS client keeps open at most.",
+        validation_alias=AliasChoices("STORAGE_ASYNC_MAX_CONNECTIONS"),
+    )
+    storage_session_workspaces: bool = Field(
+        default=False,
+        description="Let agent requests carrying X-Agent-Session-ID work on a write-back copy of the course "
+        "workspace that is flushed when the turn ends. Sessions live in one process: needs a single worker.",
+        validation_alias=AliasChoices("STORAGE_SESSION_WORKSPACES"),
+    )
+    storage_session_spool_dir: str | None = Field(
+        default=None,
+        description="Directory journaling unflushed session changes. Defaults to one under the system temp directory.",
+        validation_alias=AliasChoices("STORAGE_SESSION_SPOOL_DIR"),
+    )
+    storage_session_timeout_seconds: float = Field(
+        default=300.0,
+        description="A session is flushed after this many seconds even if its turn has not ended.",
+        validation_alias=AliasChoices("STORAGE_SESSION_TIMEOUT_SECONDS"),
+    )
     llm_api_key: str = Field(
         default="dev-dummy-key",
         description="Secret key for authenticating LLM callbacks.",
@@ -1,12 +1,19 @@
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
 
 from config.settings import Settings, get_settings
-from core.storage import get_storage_client
+from core.background_jobs import BackgroundJobRegistry, get_background_jobs
+from core.blob_cache import get_blob_cache
+from core.executors import get_storage_executor
+from core.storage import get_storage_backend
+from core.scan_pool import get_blob_scan_pool
+from core.session_workspaces import get_session_workspaces
+from core.storage_metrics import get_storage_metrics
 from decorators.auth import required_api_key
-from models.requests.agent import FileSystemCreateRequest, FileSystemEditRequest, FileSystemRewriteRequest, FileSystemSearchContentRequest
-from models.responses.agent import DirectoryListResponse, DirectoryTreeResponse, FileSystemOpResponse, FileSystemSearchResponse, FileSystemSearchContentResponse, FileSystemSearchOffsetResponse, FileContentResponse
+from models.requests.agent import AgentBatchRequest, FileSystemAppendRequest, FileSystemCopyRequest, FileSystemCreateRequest, FileSystemEditRequest, FileSystemGrepRequest, FileSystemRewriteRequest, FileSystemSearchContentRequest
+from models.responses.agent import AgentBatchResponse, BackgroundJobResponse, DirectoryListResponse, DirectoryTreeResponse, FileSystemGrepResponse, FileSystemOpResponse, FileSystemSearchResponse, FileSystemSearchContentResponse, FileSystemSearchOffsetResponse, FileContentResponse, StorageStatsResponse
 from models.responses.error import ErrorResponse
 from repository.storage_repository import StorageRepository
 from services.agent_service import AgentService
@@ -16,23 +23,56 @@ router = APIRouter(prefix="/agent", tags=['Agent'])
 
 def get_storage_repository(
     settings: Settings = Depends(get_settings),
+    session_id: Optional[str] = Header(
+        default=None,
+        alias="X-Agent-Session-ID",
+        description="SESSION_ID of the agent turn; serves the request from the turn's write-back workspace when one is open",
+    ),
 ) -> StorageRepository:
-    if not settings.gcs_bucket_name:
+    try:
+        backend = get_storage_backend(
+            backend=settings.storage_backend,
+            bucket_name=settings.gcs_bucket_name,
+            local_root=settings.storage_local_root,
+            project_id=settings.firebase_project_id,
+            credentials_file=settings.firebase_credentials_file,
+            async_io=settings.storage_async_io,
+            async_max_connections=settings.storage_async_max_connections,
+        )
+    except ValueError as exc:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="GCS_BUCKET_NAME is not configured.",
+            detail=str(exc),
         )
-
-    client = get_storage_client(
-        project_id=settings.firebase_project_id,
-        credentials_file=settings.firebase_credentials_file,
+    cache = get_blob_cache(
+        max_bytes=settings.storage_cache_max_bytes,
+        max_entry_bytes=settings.storage_cache_max_entry_bytes,
+        revalidate_seconds=settings.storage_cache_revalidate_seconds,
+    )
+    repository = StorageRepository(
+        backend=backend,
+        cache=cache,
+        line_index_min_bytes=settings.storage_line_index_min_bytes,
+        metrics=get_storage_metrics(),
+        search_index_max_file_bytes=settings.storage_search_index_max_file_bytes,
+        scan_pool=get_blob_scan_pool(settings.storage_scan_max_concurrency),
+        scan_concurrency=settings.storage_scan_request_concurrency,
+        executor=get_storage_executor(settings.storage_executor_workers, settings.storage_executor_max_queue),
     )
-    return StorageRepository(client=client, bucket_name=settings.gcs_bucket_name)
+    if session_id and settings.storage_session_workspaces:
+        workspace = get_session_workspaces(
+            settings.storage_session_spool_dir,
+            settings.storage_session_timeout_seconds,
+        ).get(session_id)
+        if workspace is not None:
+            return repository.for_session(workspace)
+    return repository
 
 def get_agent_service(
     repository: StorageRepository = Depends(get_storage_repository),
+    jobs: BackgroundJobRegistry = Depends(get_background_jobs),
 ) -> AgentService:
-    return AgentService(repository)
+    return AgentService(repository, jobs)
 
 @router.get(
     '/files/content',
@@ -60,8 +100,15 @@ async def get_file_content(
     start_line: Optional[int] = Query(None, description="Start line of the content"),
     end_line: Optional[int] = Query(None, description="End line of the content"),
     page: Optional[int] = Query(None, description="Page number of the content"),
+    offset: Optional[int] = Query(None, ge=0, description="Byte offset; switches to byte-range mode"),
+    length: Optional[int] = Query(None, gt=0, description="Number of bytes to read in byte-range mode"),
     service: AgentService = Depends(get_agent_service),
+    settings: Settings = Depends(get_settings),
 ) -> FileContentResponse:
+    if offset is not None or length is not None:
+        result = await service.read_file_range(path, offset or 0, length, settings.storage_range_read_max_bytes)
+        return FileContentResponse(**result)
+
     content = await service.read_file(path, start_line, end_line, page)
     return FileContentResponse(content=content)
 
@@ -119,9 +166,12 @@ async def list_directory(
 async def list_directory_as_tree(
     request: Request,
     path: str = Query(..., description="Path to the directory"),
+    max_depth: Optional[int] = Query(None, ge=1, description="Levels to expand; deeper folders are shown collapsed as 'name/ …'"),
+    max_entries: Optional[int] = Query(5000, ge=1, le=50000, description="Entries to show before the tree is cut with a truncation marker"),
+    ignore: Optional[list[str]] = Query(None, description="Glob patterns; matching names or relative paths are left out with their content"),
     service: AgentService = Depends(get_agent_service),
 ) -> DirectoryTreeResponse:
-    tree_str = await service.list_directory_as_tree(path)
+    tree_str = await service.list_directory_as_tree(path, max_depth, max_entries, ignore)
     return DirectoryTreeResponse(tree=tree_str)
 
 @router.post(
@@ -176,15 +226,82 @@ async def create_file_or_folder(
 @required_api_key
 async def delete_file_or_folder(
     request: Request,
-    path: str = Query(..., description="Path to the file or directory to delete"),
-    recursive: Optional[bool] = Query(False, description="Recursively delete folder content (ignored, always force delete for folders)"),
+    path: str = Query(..., description="Path to the file or directory to delete; a folder is deleted with all its content"),
     service: AgentService = Depends(get_agent_service),
 ) -> FileSystemOpResponse:
-    await service.delete_file_or_folder(path, recursive)
+    await service.delete_file_or_folder(path)
     return FileSystemOpResponse(
         message=f"URI {path} successfully deleted."
     )
 
+@router.post(
+    '/filesystem/copy',
+    summary="Copy a file or directory on server-side",
+    response_model=FileSystemOpResponse,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {
+            "model": ErrorResponse,
+            "description": "Invalid request parameters, or a folder copied into itself",
+        },
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": ErrorResponse,
+            "description": "X-LLM-API-Key is not valid or missing",
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "model": ErrorResponse,
+            "description": "Source file or folder not found",
+        },
+        status.HTTP_409_CONFLICT: {
+            "model": ErrorResponse,
+            "description": "A destination file already exists and overwrite is not set",
+        },
+    },
+)
+@required_api_key
+async def copy_file_or_folder(
+    request: Request,
+    payload: FileSystemCopyRequest,
+    service: AgentService = Depends(get_agent_service),
+) -> FileSystemOpResponse:
+    count = await service.copy_path(payload.source, payload.destination, payload.overwrite)
+    return FileSystemOpResponse(
+        message=f"{count} object(s) copied from {payload.source} to {payload.destination}."
+    )
+
+@router.post(
+    '/filesystem/move',
+    summary="Move or rename a file or directory on server-side",
+    response_model=FileSystemOpResponse,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {
+            "model": ErrorResponse,
+            "description": "Invalid request parameters, or a folder moved into itself",
+        },
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": ErrorResponse,
+            "description": "X-LLM-API-Key is not valid or missing",
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "model": ErrorResponse,
+            "description": "Source file or folder not found",
+        },
+        status.HTTP_409_CONFLICT: {
+            "model": ErrorResponse,
+            "description": "A destination file already exists and overwrite is not set, or a source changed while being moved",
+        },
+    },
+)
+@required_api_key
+async def move_file_or_folder(
+    request: Request,
+    payload: FileSystemCopyRequest,
+    service: AgentService = Depends(get_agent_service),
+) -> FileSystemOpResponse:
+    count = await service.copy_path(payload.source, payload.destination, payload.overwrite, move=True)
+    return FileSystemOpResponse(
+        message=f"{count} object(s) moved from {payload.source} to {payload.destination}."
+    )
+
 @router.put(
     '/files/content',
     summary="Rewrite the content of a file",
@@ -215,6 +332,36 @@ async def rewrite_file_content(
         message=f"Change successfully made to {payload.path}."
     )
 
+@router.post(
+    '/files/append',
+    summary="Append content to the end of a file",
+    response_model=FileSystemOpResponse,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {
+            "model": ErrorResponse,
+            "description": "Invalid request parameters",
+        },
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": ErrorResponse,
+            "description": "X-LLM-API-Key is not valid or missing",
+        },
+        status.HTTP_409_CONFLICT: {
+            "model": ErrorResponse,
+            "description": "File kept changing concurrently while the append was retried",
+        },
+    },
+)
+@required_api_key
+async def append_file_content(
+    request: Request,
+    payload: FileSystemAppendRequest,
+    service: AgentService = Depends(get_agent_service),
+) -> FileSystemOpResponse:
+    size = await service.append_file(payload.path, payload.content)
+    return FileSystemOpResponse(
+        message=f"Content appended to {payload.path}, now {size} bytes."
+    )
+
 @router.patch(
     '/files/edit',
     summary="Edit the contents of a file",
@@ -232,6 +379,10 @@ async def rewrite_file_content(
             "model": ErrorResponse,
             "description": "File not found",
         },
+        status.HTTP_409_CONFLICT: {
+            "model": ErrorResponse,
+            "description": "File kept changing concurrently while the edit was retried",
+        },
         status.HTTP_500_INTERNAL_SERVER_ERROR: {
             "model": ErrorResponse,
             "description": "Server configuration error (e.g. missing GCS bucket)",
@@ -282,6 +433,10 @@ async def search_file_paths(
     summary="Search for query in the content within the path",
     response_model=FileSystemSearchContentResponse,
     responses={
+        status.HTTP_200_OK: {
+            "content": {"application/x-ndjson": {}},
+            "description": "JSON page of matches, or an NDJSON stream when stream is true",
+        },
         status.HTTP_400_BAD_REQUEST: {
             "model": ErrorResponse,
             "description": "Invalid request parameters",
@@ -297,12 +452,29 @@ async def search_file_content(
     request: Request,
     payload: FileSystemSearchContentRequest,
     service: AgentService = Depends(get_agent_service),
-) -> FileSystemSearchContentResponse:
-    results = await service.grep_file_content(
+) -> FileSystemSearchContentResponse | StreamingResponse:
+    if payload.stream:
+        # One {"file": ...} line per match, then a {"done": true, ...} summary line, or a
+        # {"done": false, "error": ...} line with a resume cursor when the scan fails part-way
+        return StreamingResponse(
+            await service.stream_file_content(
+                payload.query,
+                payload.search_in_folder,
+                payload.is_regex or False,
+                payload.page,
+                payload.page_size,
+                payload.cursor,
+            ),
+            media_type="application/x-ndjson",
+        )
+
+    results, next_cursor = await service.grep_file_content(
         payload.query, 
         payload.search_in_folder, 
         payload.is_regex or False, 
-        payload.page
+        payload.page,
+        payload.page_size,
+        payload.cursor,
     )
     
     if not results:
@@ -312,7 +484,8 @@ async def search_file_content(
         
     return FileSystemSearchContentResponse(
         files=results,
-        message=message
+        message=message,
+        next_cursor=next_cursor,
     )
 
 @router.get(
@@ -348,4 +521,176 @@ async def search_file_offset(
         matches=results,
         formatted_output="\n".join(formatted_output_lines)
     )
-    
\ No newline at end of file
+
+
+@router.post(
+    '/search/grep',
+    summary="Search every file under the path and return matching lines with context",
+    response_model=FileSystemGrepResponse,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {
+            "model": ErrorResponse,
+            "description": "Invalid request parameters",
+        },
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": ErrorResponse,
+            "description": "X-LLM-API-Key is not valid or missing",
+        },
+    },
+)
+@required_api_key
+async def grep_folder(
+    request: Request,
+    payload: FileSystemGrepRequest,
+    service: AgentService = Depends(get_agent_service),
+) -> FileSystemGrepResponse:
+    files, truncated = await service.grep_folder(
+        payload.query,
+        payload.search_in_folder,
+        payload.is_regex or False,
+        payload.context_lines,
+        payload.max_matches_per_file,
+        payload.max_total_matches,
+    )
+
+    total_matches = sum(len(file["matches"]) for file in files)
+    formatted_output_lines = []
+    for file in files:
+        formatted_output_lines.append(file["path"])
+        for match in file["matches"]:
+            snippet = "\n".join([*match["before"], match["content"], *match["after"]])
+            formatted_output_lines.append(f"Line {match['line']}:\n```\n{snippet}\n```")
+
+    if not files:
+        message = "No result found or regex is invalid"
+    else:
+        message = f"Find {total_matches} matching lines in {len(files)} files in {payload.search_in_folder}"
+        if truncated:
+            message += f" (stopped at the limit of {payload.max_total_matches})"
+
+    return FileSystemGrepResponse(
+        files=files,
+        total_matches=total_matches,
+        truncated=truncated,
+        formatted_output="\n".join(formatted_output_lines),
+        message=message,
+    )
+
+@router.post(
+    '/batch',
+    summary="Run several file operations in one request",
+    response_model=AgentBatchResponse,
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": ErrorResponse,
+            "description": "X-LLM-API-Key is not valid or missing",
+        },
+    },
+)
+@required_api_key
+async def execute_batch(
+    request: Request,
+    payload: AgentBatchRequest,
+    service: AgentService = Depends(get_agent_service),
+    settings: Settings = Depends(get_settings),
+) -> AgentBatchResponse:
+    # Per-operation failures are reported in the results; the request itself still succeeds
+    results = await service.execute_batch(payload.operations, payload.stop_on_error, settings.storage_range_read_max_bytes)
+    return AgentBatchResponse(
+        results=results
+    )
+
+@router.post(
+    '/jobs/delete',
+    summary="Delete a file or folder in the background and report progress",
+    response_model=BackgroundJobResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {
+            "model": ErrorResponse,
+            "description": "Invalid request parameters",
+        },
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": ErrorResponse,
+            "description": "X-LLM-API-Key is not valid or missing",
+        },
+    },
+)
+@required_api_key
+async def start_delete_job(
+    request: Request,
+    path: str = Query(..., description="Path to the file or directory to delete"),
+    service: AgentService = Depends(get_agent_service),
+) -> BackgroundJobResponse:
+    job = service.start_delete_job(path)
+    return BackgroundJobResponse(**job)
+
+
+@router.get(
+    '/jobs/{job_id}',
+    summary="Get the progress of a background job",
+    response_model=BackgroundJobResponse,
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": ErrorResponse,
+            "description": "X-LLM-API-Key is not valid or missing",
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "model": ErrorResponse,
+            "description": "Unknown job, or started by another server instance",
+        },
+    },
+)
+@required_api_key
+async def get_job(
+    request: Request,
+    job_id: str,
+    service: AgentService = Depends(get_agent_service),
+) -> BackgroundJobResponse:
+    job = service.get_job(job_id)
+    return BackgroundJobResponse(**job)
+
+@router.post(
+    '/manifest/rescan',
+    summary="Rebuild the file manifest of a course workspace from a full listing",
+    response_model=FileSystemOpResponse,
+    responses={
+        status.HTTP_400_BAD_REQUEST: {
+            "model": ErrorResponse,
+            "description": "Path is not inside a course workspace",
+        },
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": ErrorResponse,
+            "description": "X-LLM-API-Key is not valid or missing",
+        },
+    },
+)
+@required_api_key
+async def rescan_workspace_manifest(
+    request: Request,
+    path: str = Query(..., description="Any path inside the workspace to rescan"),
+    service: AgentService = Depends(get_agent_service),
+) -> FileSystemOpResponse:
+    count = await service.rescan_workspace(path)
+    return FileSystemOpResponse(
+        message=f"Manifest for {path} rebuilt with {count} entries."
+    )
+
+@router.get(
+    '/storage/stats',
+    summary="Storage round-trip and cache counters of this instance",
+    response_model=StorageStatsResponse,
+    responses={
+        status.HTTP_401_UNAUTHORIZED: {
+            "model": ErrorResponse,
+            "description": "X-LLM-API-Key is not valid or missing",
+        },
+    },
+)
+@required_api_key
+async def get_storage_stats(
+    request: Request,
+    service: AgentService = Depends(get_agent_service),
+) -> StorageStatsResponse:
+    stats = service.get_storage_stats()
+    return StorageStatsResponse(**stats)
@@ -1,10 +1,15 @@
-from typing import Annotated
+from typing import Annotated, Optional
 
-from fastapi import APIRouter, Depends, File, Form, HTTPException, Request, UploadFile, status
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Request, Response, UploadFile, status
 
 from config.settings import Settings, get_settings
-from core.database import get_firestore_client
-from core.storage import get_storage_client
+from core.database import get_async_firestore_client
+from core.executors import get_firestore_executor, get_storage_executor
+from core.blob_cache import get_blob_cache
+from core.storage import get_storage_backend
+from core.scan_pool import get_blob_scan_pool
+from core.session_workspaces import SessionWorkspaceRegistry, get_session_workspaces
+from core.storage_metrics import get_storage_metrics
 from decorators.auth import required_login
 from models.requests.course import CreateMessageRequest
 from models.responses.course import (
@@ -25,49 +30,87 @@ from services.course_service import CourseService
 
 router = APIRouter(prefix="/course", tags=["Courses"])
 
+MAX_MESSAGE_PAGE_SIZE = 500
+
 
 
 def get_course_repository(
     settings: Settings = Depends(get_settings),
 ) -> CourseRepository:
-    client = get_firestore_client(
+    client = get_async_firestore_client(
         project_id=settings.firebase_project_id,
         credentials_file=settings.firebase_credentials_file,
     )
-    return CourseRepository(client=client, collection="course")
+    return CourseRepository(
+        client=client,
+        collection="course",
+        executor=get_firestore_executor(settings.firestore_executor_workers, settings.firestore_executor_max_queue),
+    )
 
 
 def get_storage_repository(
     settings: Settings = Depends(get_settings),
 ) -> StorageRepository:
-    if not settings.gcs_bucket_name:
+    try:
+        backend = get_storage_backend(
+            backend=settings.storage_backend,
+            bucket_name=settings.gcs_bucket_name,
+            local_root=settings.storage_local_root,
+            project_id=settings.firebase_project_id,
+            credentials_file=settings.firebase_credentials_file,
+            async_io=settings.storage_async_io,
+            async_max_connections=settings.storage_async_max_connections,
+        )
+    except ValueError as exc:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="GCS_BUCKET_NAME is not configured.",
+            detail=str(exc),
         )
-
-    client = get_storage_client(
-        project_id=settings.firebase_project_id,
-        credentials_file=settings.firebase_credentials_file,
+    cache = get_blob_cache(
+        max_bytes=settings.storage_cache_max_bytes,
+        max_entry_bytes=settings.storage_cache_max_entry_bytes,
+        revalidate_seconds=settings.storage_cache_revalidate_seconds,
+    )
+    return StorageRepository(
+        backend=backend,
+        cache=cache,
+        line_index_min_bytes=settings.storage_line_index_min_bytes,
+        metrics=get_storage_metrics(),
+        search_index_max_file_bytes=settings.storage_search_index_max_file_bytes,
+        scan_pool=get_blob_scan_pool(settings.storage_scan_max_concurrency),
+        scan_concurrency=settings.storage_scan_request_concurrency,
+        executor=get_storage_executor(settings.storage_executor_workers, settings.storage_executor_max_queue),
     )
-    return StorageRepository(client=client, bucket_name=settings.gcs_bucket_name)
 
 
 def get_message_repository(
     settings: Settings = Depends(get_settings),
 ) -> MessageRepository:
-    client = get_firestore_client(
+    client = get_async_firestore_client(
         project_id=settings.firebase_project_id,
         credentials_file=settings.firebase_credentials_file,
     )
-    return MessageRepository(client=client, collection="message")
+    return MessageRepository(
+        client=client,
+        collection="message",
+        counter_collection="message_counter",
+        executor=get_firestore_executor(settings.firestore_executor_workers, settings.firestore_executor_max_queue),
+    )
+
+def get_session_workspace_registry(
+    settings: Settings = Depends(get_settings),
+) -> SessionWorkspaceRegistry | None:
+    if not settings.storage_session_workspaces:
+        return None
+    return get_session_workspaces(settings.storage_session_spool_dir, settings.storage_session_timeout_seconds)
 
 def get_course_service(
     repository: CourseRepository = Depends(get_course_repository),
     storage_repository: StorageRepository = Depends(get_storage_repository),
     message_repository: MessageRepository = Depends(get_message_repository),
+    sessions: SessionWorkspaceRegistry | None = Depends(get_session_workspace_registry),
 ) -> CourseService:
-    return CourseService(repository, storage_repository, message_repository)
+    return CourseService(repository, storage_repository, message_repository, sessions)
 
 
 @router.post(
@@ -151,6 +194,9 @@ async def get_all_courses(
 async def get_course_by_id(
     request: Request,
     course_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_MESSAGE_PAGE_SIZE, description="Page size; all messages when omitted"),
+    before_index: Optional[int] = Query(None, description="Only messages with a lower index"),
+    after_index: Optional[int] = Query(None, description="Only messages with a higher index"),
     service: CourseService = Depends(get_course_service),
 ) -> CourseDetailResponse:
     
@@ -158,20 +204,28 @@ async def get_course_by_id(
     user = UserModel(**user_dict)
     
     course = await service.get_course_by_id(course_id, user)
-    messages = await service.get_messages_by_course_id(course_id, user)
+    messages, has_more = await service.get_messages_by_course_id(course_id, user, limit, before_index, after_index, course)
     
     return CourseDetailResponse(
         status="success",
         # course is guaranteed to be not None here because service raises 404 otherwise
         course=course, # type: ignore
-        messages=messages
+        messages=messages,
+        has_more=has_more,
     )
 
 @router.get(
     "/{course_id}/message",
-    summary="Get all messages by course ID",
+    summary="Get messages by course ID, optionally one page at a time",
     response_model=MultipleMessageResponse,
     responses={
+        status.HTTP_304_NOT_MODIFIED: {
+            "description": "No messages were added since the ETag in If-None-Match",
+        },
+        status.HTTP_400_BAD_REQUEST: {
+            "model": ErrorResponse,
+            "description": "Both since_index and after_index given",
+        },
         status.HTTP_404_NOT_FOUND: {
             "model": ErrorResponse,
             "description": "Course not found",
@@ -189,15 +243,42 @@ async def get_course_by_id(
 @required_login
 async def get_messages_by_course_id(
     request: Request,
+    response: Response,
     course_id: str,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_MESSAGE_PAGE_SIZE, description="Page size; all messages when omitted"),
+    before_index: Optional[int] = Query(None, description="Only messages with a lower index"),
+    after_index: Optional[int] = Query(None, description="Only messages with a higher index"),
+    since_index: Optional[int] = Query(None, description="Poll for messages newer than this index; same filter as after_index"),
     service: CourseService = Depends(get_course_service),
-) -> MultipleMessageResponse:
+) -> MultipleMessageResponse | Response:
     
     user_dict = request.session["user"]
     user = UserModel(**user_dict)
     
-    messages = await service.get_messages_by_course_id(course_id, user)
-    return MultipleMessageResponse(status="success", messages=messages)
+    if since_index is not None:
+        if after_index is not None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Use either since_index or after_index, not both.",
+            )
+        after_index = since_index
+
+    # Taken before the messages are read, so a reply landing in between is picked up by the next poll
+    course, etag = await service.get_messages_etag(course_id, user, limit, before_index, after_index)
+    if_none_match = _parse_if_none_match(request.headers.get("if-none-match"))
+    if etag in if_none_match or "*" in if_none_match:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    messages, has_more = await service.get_messages_by_course_id(course_id, user, limit, before_index, after_index, course)
+    response.headers["ETag"] = etag
+    return MultipleMessageResponse(status="success", messages=messages, has_more=has_more)
+
+def _parse_if_none_match(header: str | None) -> set[str]:
+    # Weak comparison: W/"3" and "3" name the same version
+    if not header:
+        return set()
+    tags = {tag.strip() for tag in header.split(",")}
+    return tags | {f"W/{tag}" for tag in tags if not tag.startswith("W/")}
 
 @router.post(
     "/{course_id}/message",
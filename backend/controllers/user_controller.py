@@ -4,7 +4,8 @@ from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from fastapi.responses import RedirectResponse
 
 from config.settings import Settings, get_settings
-from core.database import get_firestore_client
+from core.database import get_async_firestore_client
+from core.executors import get_firestore_executor
 from decorators.auth import required_login
 from models.requests.user import UserPreferenceRequest
 from models.responses.error import ErrorResponse
@@ -18,11 +19,15 @@ router = APIRouter(prefix="/user", tags=["Users"])
 def get_user_repository(
     settings: Settings = Depends(get_settings),
 ) -> UserRepository:
-    client = get_firestore_client(
+    client = get_async_firestore_client(
         project_id=settings.firebase_project_id,
         credentials_file=settings.firebase_credentials_file,
     )
-    return UserRepository(client=client, collection="user")
+    return UserRepository(
+        client=client,
+        collection="user",
+        executor=get_firestore_executor(settings.firestore_executor_workers, settings.firestore_executor_max_queue),
+    )
 
 
 def get_user_service(
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Awaitable, Callable
+
+
+@dataclass
+class BackgroundJob:
+    id: str
+    kind: str
+    target: str
+    status: str = "running"
+    processed: int = 0
+    result: Any = None
+    error: str | None = None
+    started_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    finished_at: datetime | None = None
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def advance(self, count: int) -> None:
+        # Called from worker threads as items complete
+        with self._lock:
+            self.processed += count
+
+    def to_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "job_id": self.id,
+                "kind": self.kind,
+                "target": self.target,
+                "status": self.status,
+                "processed": self.processed,
+                "result": self.result,
+                "error": self.error,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class BackgroundJobRegistry:
+    """In-process registry of long-running jobs started by API requests.
+
+    Jobs live in the event loop of the worker that started them, so their
+    progress is only visible from that process. Finished jobs are forgotten
+    oldest-first once more than ``max_jobs`` are kept.
+    """
+
+    def __init__(self, max_jobs: int = 256) -> None:
+        self._max_jobs = max_jobs
+        self._jobs: OrderedDict[str, BackgroundJob] = OrderedDict()
+        # Strong references: the event loop only keeps weak ones to running tasks
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    def start(self, kind: str, target: str, run: Callable[[BackgroundJob], Awaitable[Any]]) -> BackgroundJob:
+
+        job = BackgroundJob(id=uuid.uuid4().hex, kind=kind, target=target)
+        self._jobs[job.id] = job
+        self._prune()
+
+        async def _run() -> None:
+            try:
+                result = await run(job)
+            except Exception as exc:
+                with job._lock:
+                    job.status = "failed"
+                    job.error = str(exc)
+            else:
+                with job._lock:
+                    job.status = "completed"
+                    job.result = result
+            finally:
+                job.finished_at = datetime.now(timezone.utc)
+
+        task = asyncio.get_running_loop().create_task(_run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: str) -> BackgroundJob | None:
+
+        return self._jobs.get(job_id)
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.status != "running"]
+        excess = len(self._jobs) - self._max_jobs
+        for job_id in finished[:max(excess, 0)]:
+            del self._jobs[job_id]
+
+
+@lru_cache(maxsize=1)
+def get_background_jobs() -> BackgroundJobRegistry:
+
+    return BackgroundJobRegistry()
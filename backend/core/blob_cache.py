@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
+
+
+@dataclass
+class _CacheEntry:
+    generation: int
+    content: bytes
+    checked_at: float
+
+
+class BlobContentCache:
+    """Process-wide LRU cache of blob contents keyed by (bucket, path) and GCS generation.
+
+    An entry is served without any GCS call while it is younger than
+    ``revalidate_seconds``; after that the caller is expected to compare the
+    live generation (a metadata-only request) before reusing the bytes. With
+    a window of 0 every read is checked, which is what keeps writes made by
+    other instances visible.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int, revalidate_seconds: float) -> None:
+        self._max_bytes = max_bytes
+        self._max_entry_bytes = max_entry_bytes
+        self._revalidate_seconds = revalidate_seconds
+        self._entries: OrderedDict[tuple[str, str], _CacheEntry] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+
+    def get(self, bucket: str, path: str) -> tuple[bytes, int] | None:
+        """Return cached ``(content, generation)`` if it is still inside the revalidation window."""
+
+        key = (bucket, path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry.checked_at >= self._revalidate_seconds:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.content, entry.generation
+
+    def peek(self, bucket: str, path: str) -> tuple[bytes, int] | None:
+        """Return a cached ``(content, generation)`` however old, for a write conditioned on that generation."""
+
+        with self._lock:
+            entry = self._entries.get((bucket, path))
+            return (entry.content, entry.generation) if entry else None
+
+    def get_generation(self, bucket: str, path: str) -> int | None:
+        """Return the generation of a (possibly stale) entry, or None if absent."""
+
+        with self._lock:
+            entry = self._entries.get((bucket, path))
+            return entry.generation if entry else None
+
+    def revalidate(self, bucket: str, path: str, generation: int) -> bytes | None:
+        """Reuse a stale entry if the live generation still matches it."""
+
+        key = (bucket, path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.generation != generation:
+                self._drop(key)
+                return None
+            entry.checked_at = time.monotonic()
+            self._entries.move_to_end(key)
+            self.revalidations += 1
+            return entry.content
+
+    def record_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def put(self, bucket: str, path: str, generation: int | None, content: bytes) -> None:
+        """Cache ``content`` as ``generation`` of the blob, unless a newer generation is already cached.
+
+        Generations only grow, so a reader finishing a download after a
+        concurrent write cached its result must not put the older bytes back.
+        """
+
+        key = (bucket, path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and generation is not None and entry.generation > generation:
+                return
+            self._drop(key)
+            if generation is None or len(content) > self._max_entry_bytes:
+                return
+            self._entries[key] = _CacheEntry(generation, content, time.monotonic())
+            self._size += len(content)
+            while self._size > self._max_bytes and self._entries:
+                oldest, _ = next(iter(self._entries.items()))
+                self._drop(oldest)
+                self.evictions += 1
+
+    def invalidate(self, bucket: str, path: str) -> None:
+
+        with self._lock:
+            self._drop((bucket, path))
+
+    def invalidate_prefix(self, bucket: str, prefix: str) -> None:
+
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == bucket and key[1].startswith(prefix)]
+            for key in stale:
+                self._drop(key)
+
+    def stats(self) -> dict[str, Any]:
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self._max_bytes,
+            }
+
+    def _drop(self, key: tuple[str, str]) -> None:
+        # Caller must hold the lock
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry.content)
+
+
+@lru_cache(maxsize=1)
+def get_blob_cache(
+    max_bytes: int,
+    max_entry_bytes: int,
+    revalidate_seconds: float,
+) -> BlobContentCache:
+
+    return BlobContentCache(
+        max_bytes=max_bytes,
+        max_entry_bytes=max_entry_bytes,
+        revalidate_seconds=revalidate_seconds,
+    )
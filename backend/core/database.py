@@ -21,6 +21,23 @@ def get_firestore_client(
     return firestore.Client(project=project_id)
 
 
+@lru_cache(maxsize=1)
+def get_async_firestore_client(
+    project_id: str | None,
+    credentials_file: str | None,
+) -> firestore.AsyncClient:
+
+    resolved_credentials_file = _resolve_credentials_path(credentials_file)
+
+    if resolved_credentials_file:
+        return firestore.AsyncClient.from_service_account_json(
+            resolved_credentials_file,
+            project=project_id,
+        )
+
+    return firestore.AsyncClient(project=project_id)
+
+
 def _resolve_credentials_path(explicit_path: str | None) -> str | None:
 
     candidates = [
@@ -0,0 +1,234 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import math
+import threading
+import time
+import weakref
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, TypeVar
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+_T = TypeVar("_T")
+
+# Upper bound of the Retry-After hint, however deep the backlog looks
+_MAX_RETRY_AFTER_SECONDS = 30
+
+_executors: dict[str, InstrumentedExecutor] = {}
+
+
+class ExecutorSaturated(Exception):
+    """The backend's queue is full; the request is turned away instead of waiting in line."""
+
+    def __init__(self, executor: str, retry_after: int) -> None:
+        super().__init__(f"The {executor} backend is overloaded, retry in {retry_after}s.")
+        self.executor = executor
+        self.retry_after = retry_after
+
+
+class InstrumentedExecutor:
+    """Thread pool dedicated to one backend, with a bounded queue.
+
+    Blocking calls for one backend (Firestore, storage) run here instead of
+    the shared default pool, so a slow backend only delays its own callers.
+    At most ``max_queue`` calls wait for a worker; further ones raise
+    ExecutorSaturated at once. Queue depth, wait time and run time are kept
+    for ``stats``.
+
+    Backends with a native asyncio client go through ``run_async`` instead:
+    the same limits apply, but a worker is a slot for an in-flight call on
+    the event loop rather than a thread.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int) -> None:
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        # An asyncio.Semaphore belongs to the loop it first waits on, and the executor is a process-wide
+        # singleton that may outlive a loop (e.g. across tests), so each running loop gets its own
+        self._slots: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._rejected = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._run_seconds = 0.0
+        self._max_run_seconds = 0.0
+
+    async def run(self, func: Callable[..., _T], *args: Any) -> _T:
+        """Run ``func(*args)`` on a worker, in a copy of the caller's context like asyncio.to_thread."""
+
+        self._enqueue()
+        return await self._submit(func, *args)
+
+    async def resume(self, func: Callable[..., _T], *args: Any) -> _T:
+        """Like ``run``, for a later step of a request ``run`` already admitted.
+
+        It waits in line however deep the queue is: a response that has
+        started streaming cannot be turned away any more.
+        """
+
+        self._enqueue(bounded=False)
+        return await self._submit(func, *args)
+
+    async def _submit(self, func: Callable[..., _T], *args: Any) -> _T:
+        context = contextvars.copy_context()
+        enqueued = time.perf_counter()
+
+        def _call() -> _T:
+            started = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._wait_seconds += started - enqueued
+                self._max_wait_seconds = max(self._max_wait_seconds, started - enqueued)
+            try:
+                return context.run(func, *args)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._run_seconds += elapsed
+                    self._max_run_seconds = max(self._max_run_seconds, elapsed)
+
+        future = self._executor.submit(_call)
+        future.add_done_callback(self._forget_cancelled)
+        return await asyncio.wrap_future(future)
+
+    async def run_async(self, func: Callable[[], Awaitable[_T]]) -> _T:
+        """Await ``func()`` once a slot is free, with the queue bound and timings of ``run``."""
+
+        self._enqueue()
+        enqueued = time.perf_counter()
+        slots = self._loop_slots()
+        try:
+            await slots.acquire()
+        except BaseException:
+            # Cancelled while queued
+            with self._lock:
+                self._queued -= 1
+            raise
+
+        started = time.perf_counter()
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._wait_seconds += started - enqueued
+            self._max_wait_seconds = max(self._max_wait_seconds, started - enqueued)
+        try:
+            return await func()
+        finally:
+            slots.release()
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                self._run_seconds += elapsed
+                self._max_run_seconds = max(self._max_run_seconds, elapsed)
+
+    def stats(self) -> dict[str, Any]:
+
+        with self._lock:
+            started = self._completed + self._running
+            return {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "queued": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "avg_wait_ms": round(1000 * self._wait_seconds / started, 3) if started else 0.0,
+                "max_wait_ms": round(1000 * self._max_wait_seconds, 3),
+                "avg_run_ms": round(1000 * self._run_seconds / self._completed, 3) if self._completed else 0.0,
+                "max_run_ms": round(1000 * self._max_run_seconds, 3),
+            }
+
+    def _loop_slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            slots = self._slots.get(loop)
+            if slots is None:
+                slots = self._slots[loop] = asyncio.Semaphore(self.max_workers)
+        return slots
+
+    def _enqueue(self, bounded: bool = True) -> None:
+        with self._lock:
+            if bounded and self._queued >= self.max_queue:
+                self._rejected += 1
+                raise ExecutorSaturated(self.name, self._retry_after())
+            self._queued += 1
+
+    def _forget_cancelled(self, future: Future[Any]) -> None:
+        # A caller cancelled while still queued: the call never reaches a worker
+        if future.cancelled():
+            with self._lock:
+                self._queued -= 1
+
+    def _retry_after(self) -> int:
+        # Time for the workers to drain the current backlog at the average run time so far
+        average = self._run_seconds / self._completed if self._completed else 1.0
+        backlog = average * (self._queued + self._running) / self.max_workers
+        return min(_MAX_RETRY_AFTER_SECONDS, max(1, math.ceil(backlog)))
+
+
+async def run_blocking(executor: InstrumentedExecutor | None, func: Callable[..., _T], *args: Any) -> _T:
+    """Run a blocking call on the backend's executor, or on the default thread pool without one."""
+
+    if executor is None:
+        return await asyncio.to_thread(func, *args)
+    return await executor.run(func, *args)
+
+
+async def resume_blocking(executor: InstrumentedExecutor | None, func: Callable[..., _T], *args: Any) -> _T:
+    """``run_blocking`` for a later step of an admitted request; never raises ExecutorSaturated."""
+
+    if executor is None:
+        return await asyncio.to_thread(func, *args)
+    return await executor.resume(func, *args)
+
+
+async def run_async(executor: InstrumentedExecutor | None, func: Callable[[], Awaitable[_T]]) -> _T:
+    """Await an asyncio client call under the backend's limits, or directly without an executor."""
+
+    if executor is None:
+        return await func()
+    return await executor.run_async(func)
+
+
+async def executor_saturated_handler(request: Request, exc: Exception) -> JSONResponse:
+
+    retry_after = exc.retry_after if isinstance(exc, ExecutorSaturated) else 1
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+def executor_stats() -> dict[str, dict[str, Any]]:
+
+    return {name: executor.stats() for name, executor in sorted(_executors.items())}
+
+
+@lru_cache(maxsize=1)
+def get_firestore_executor(max_workers: int, max_queue: int) -> InstrumentedExecutor:
+
+    executor = InstrumentedExecutor("firestore", max_workers, max_queue)
+    _executors[executor.name] = executor
+    return executor
+
+
+@lru_cache(maxsize=1)
+def get_storage_executor(max_workers: int, max_queue: int) -> InstrumentedExecutor:
+
+    executor = InstrumentedExecutor("storage", max_workers, max_queue)
+    _executors[executor.name] = executor
+    return executor
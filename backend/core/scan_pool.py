@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import contextvars
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Iterable, Iterator, TypeVar
+
+_T = TypeVar("_T")
+_R = TypeVar("_R")
+
+
+class BlobScanPool:
+    """Process-wide thread pool that downloads and scans blobs in parallel.
+
+    The pool size is the global concurrency cap shared by every request; each
+    caller additionally bounds how many of its own items are in flight, so a
+    single large search cannot occupy every worker.
+    """
+
+    def __init__(self, max_workers: int) -> None:
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="blob-scan")
+
+    def map_ordered(self, func: Callable[[_T], _R], items: Iterable[_T], limit: int) -> Iterator[_R]:
+        """Apply ``func`` to ``items`` with at most ``limit`` in flight, yielding results in input order.
+
+        Closing the iterator early cancels the work that has not started yet.
+        """
+
+        limit = max(1, min(limit, self.max_workers))
+        pending: deque[Future[_R]] = deque()
+        source = iter(items)
+        try:
+            for item in source:
+                # Each task runs in a copy of the caller's context so round trips keep their attribution
+                pending.append(self._executor.submit(contextvars.copy_context().run, func, item))
+                if len(pending) >= limit:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+@lru_cache(maxsize=1)
+def get_blob_scan_pool(max_workers: int) -> BlobScanPool:
+
+    return BlobScanPool(max_workers=max_workers)
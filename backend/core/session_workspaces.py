@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import tempfile
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any
+
+from repository.session_workspace import SessionWorkspace, spooled_session_directories
+from repository.storage_repository import StorageRepository
+
+
+@dataclass
+class _OpenSession:
+    workspace: SessionWorkspace
+    repository: StorageRepository
+    holders: int
+    timer: asyncio.TimerHandle
+
+
+class SessionWorkspaceRegistry:
+    """Write-back workspaces of the agent turns running in this process.
+
+    A session is opened before the agent is called and flushed when the last
+    turn holding it ends, or when ``timeout_seconds`` pass first. Agent
+    requests only see a session in the process that opened it, so the mode
+    needs a single worker (or routing that keeps a course on one). Journals
+    left in ``spool_dir`` by a crashed process are flushed by the next open.
+    """
+
+    def __init__(self, spool_dir: str, timeout_seconds: float) -> None:
+        self._spool_dir = spool_dir
+        self._timeout_seconds = timeout_seconds
+        self._sessions: dict[str, _OpenSession] = {}
+        # Strong references: the event loop only keeps weak ones to running tasks
+        self._tasks: set[asyncio.Task[Any]] = set()
+
+    async def open(self, session_id: str, root: str, repository: StorageRepository) -> SessionWorkspace:
+
+        opened = self._sessions.get(session_id)
+        if opened is not None:
+            opened.holders += 1
+            return opened.workspace
+
+        await self.recover(repository)
+        try:
+            workspace = await asyncio.to_thread(repository.open_session_workspace, session_id, root, self._spool_dir)
+        except FileExistsError:
+            # Another turn of the same course opened it while we were recovering
+            opened = self._sessions.get(session_id)
+            if opened is None:
+                raise
+            opened.holders += 1
+            return opened.workspace
+
+        timer = asyncio.get_running_loop().call_later(self._timeout_seconds, self._expire, session_id)
+        self._sessions[session_id] = _OpenSession(workspace, repository, 1, timer)
+        return workspace
+
+    def get(self, session_id: str) -> SessionWorkspace | None:
+
+        opened = self._sessions.get(session_id)
+        return opened.workspace if opened is not None else None
+
+    async def close(self, session_id: str) -> dict[str, Any] | None:
+        """Release one hold on the session; the last one flushes it and returns the flush result."""
+
+        opened = self._sessions.get(session_id)
+        if opened is None:
+            return None
+        opened.holders -= 1
+        if opened.holders > 0:
+            return None
+        return await self._flush(session_id)
+
+    async def recover(self, repository: StorageRepository) -> list[dict[str, Any]]:
+        """Flush the journals of sessions that died with their process."""
+
+        results = []
+        for directory in await asyncio.to_thread(spooled_session_directories, self._spool_dir):
+            workspace = await asyncio.to_thread(repository.recover_session_workspace, directory)
+            if workspace is not None:
+                results.append(await repository.flush_session_workspace(workspace))
+        return results
+
+    async def _flush(self, session_id: str) -> dict[str, Any]:
+        opened = self._sessions.pop(session_id)
+        opened.timer.cancel()
+        # Requests arriving from now on go straight to storage
+        opened.workspace.close()
+        return await opened.repository.flush_session_workspace(opened.workspace)
+
+    def _expire(self, session_id: str) -> None:
+        if session_id not in self._sessions:
+            return
+
+        async def _run() -> None:
+            try:
+                result = await self._flush(session_id)
+            except Exception as exc:
+                # The journal stays behind and is flushed by the next recovery
+                print(f"Failed to flush timed-out session {session_id}: {exc}")
+            else:
+                if result["conflicts"]:
+                    # No turn is waiting for this result; the agent's versions are in the conflict copies
+                    print(f"Session {session_id} lost changes to concurrent writes, kept as {result['conflict_copies']}: {result['conflicts']}")
+
+        task = asyncio.get_running_loop().create_task(_run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+@lru_cache(maxsize=1)
+def get_session_workspaces(spool_dir: str | None, timeout_seconds: float) -> SessionWorkspaceRegistry:
+
+    return SessionWorkspaceRegistry(
+        spool_dir=spool_dir or os.path.join(tempfile.gettempdir(), "agent-session-workspaces"),
+        timeout_seconds=timeout_seconds,
+    )
@@ -1,7 +1,16 @@
 import os
 from functools import lru_cache
 
+import google.auth
+import httpx
+from google.auth.credentials import Credentials
 from google.cloud import storage
+from google.oauth2 import service_account
+
+from repository.gcs_async_backend import DEFAULT_ENDPOINT, AsyncGCSStorageBackend
+from repository.gcs_backend import GCSStorageBackend
+from repository.local_backend import LocalStorageBackend
+from repository.storage_backend import StorageBackend
 
 
 @lru_cache(maxsize=1)
@@ -21,6 +30,74 @@ def get_storage_client(
     return storage.Client(project=project_id)
 
 
+@lru_cache(maxsize=1)
+def get_storage_http_client(max_connections: int) -> httpx.AsyncClient:
+
+    # One connection pool for every async storage call in the process
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        timeout=httpx.Timeout(60.0),
+    )
+
+
+def get_storage_backend(
+    backend: str,
+    bucket_name: str | None,
+    local_root: str | None,
+    project_id: str | None,
+    credentials_file: str | None,
+    async_io: bool = False,
+    async_max_connections: int = 256,
+) -> StorageBackend:
+
+    if backend == "local":
+        if not local_root:
+            raise ValueError("STORAGE_LOCAL_ROOT is not configured.")
+        return _get_local_storage_backend(local_root)
+
+    if not bucket_name:
+        raise ValueError("GCS_BUCKET_NAME is not configured.")
+    return _get_gcs_storage_backend(bucket_name, project_id, credentials_file, async_io, async_max_connections)
+
+
+@lru_cache(maxsize=4)
+def _get_gcs_storage_backend(
+    bucket_name: str,
+    project_id: str | None,
+    credentials_file: str | None,
+    async_io: bool,
+    async_max_connections: int,
+) -> GCSStorageBackend:
+
+    async_backend = None
+    if async_io:
+        # The client library honours the emulator variable; the JSON API client follows it the same way
+        emulator_host = os.getenv("STORAGE_EMULATOR_HOST")
+        async_backend = AsyncGCSStorageBackend(
+            get_storage_http_client(async_max_connections),
+            bucket_name,
+            credentials=None if emulator_host else _get_storage_credentials(credentials_file),
+            endpoint=emulator_host.rstrip("/") if emulator_host else DEFAULT_ENDPOINT,
+        )
+    return GCSStorageBackend(get_storage_client(project_id, credentials_file), bucket_name, async_backend)
+
+
+def _get_storage_credentials(credentials_file: str | None) -> Credentials:
+
+    scopes = ["https://www.googleapis.com/auth/devstorage.read_write"]
+    resolved_credentials_file = _resolve_credentials_path(credentials_file)
+    if resolved_credentials_file:
+        return service_account.Credentials.from_service_account_file(resolved_credentials_file, scopes=scopes)
+    credentials, _ = google.auth.default(scopes=scopes)
+    return credentials
+
+
+@lru_cache(maxsize=4)
+def _get_local_storage_backend(root: str) -> LocalStorageBackend:
+
+    return LocalStorageBackend(root)
+
+
 def _resolve_credentials_path(explicit_path: str | None) -> str | None:
 
     candidates = [
@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import threading
+from collections import Counter
+from contextvars import Context, ContextVar, copy_context
+from functools import lru_cache, wraps
+from typing import Any, Callable
+
+# Name of the repository method a storage call is made on behalf of. asyncio.to_thread copies
+# the context, so the value set in the coroutine is visible inside the worker thread.
+_current_operation: ContextVar[str] = ContextVar("storage_operation", default="unattributed")
+
+
+class StorageRoundTripCounter:
+    """Thread-safe count of storage backend round trips, grouped by repository method."""
+
+    def __init__(self) -> None:
+        self._counts: Counter[str] = Counter()
+        self._calls: Counter[str] = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, count: int = 1) -> None:
+
+        with self._lock:
+            self._counts[_current_operation.get()] += count
+
+    def record_call(self, operation: str) -> None:
+
+        with self._lock:
+            self._calls[operation] += 1
+
+    def snapshot(self) -> dict[str, dict[str, int]]:
+
+        with self._lock:
+            return {
+                operation: {
+                    "calls": self._calls[operation],
+                    "round_trips": self._counts[operation],
+                }
+                for operation in sorted(set(self._calls) | set(self._counts))
+            }
+
+    def reset(self) -> None:
+
+        with self._lock:
+            self._counts.clear()
+            self._calls.clear()
+
+
+def metered_operation(func: Callable[..., Any]) -> Callable[..., Any]:
+    """Attribute the storage round trips made by an async repository method to its name."""
+
+    @wraps(func)
+    async def wrapper(self: Any, *args: Any, **kwargs: Any) -> Any:
+
+        token = _current_operation.set(func.__name__)
+        metrics = getattr(self, "_metrics", None)
+        if metrics is not None:
+            metrics.record_call(func.__name__)
+        try:
+            return await func(self, *args, **kwargs)
+        finally:
+            _current_operation.reset(token)
+
+    return wrapper
+
+
+def operation_context(operation: str) -> Context:
+    """A context that attributes round trips to ``operation``, for work resumed across many awaits."""
+
+    context = copy_context()
+    context.run(_current_operation.set, operation)
+    return context
+
+
+@lru_cache(maxsize=1)
+def get_storage_metrics() -> StorageRoundTripCounter:
+
+    return StorageRoundTripCounter()
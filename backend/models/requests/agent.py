@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import BaseModel, ConfigDict, Field
 
 
@@ -25,6 +27,34 @@ class FileSystemRewriteRequest(BaseModel):
     content: str = Field(..., description="Content to rewrite")
 
 
+class FileSystemCopyRequest(BaseModel):
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "source": "/project/src/legacy/",
+                "destination": "/project/src/archive/legacy/",
+                "overwrite": False
+            }
+        }
+    )
+    source: str = Field(..., description="File or folder to copy. Ends with / for directory.")
+    destination: str = Field(..., description="New path. A file copied to a path ending with / keeps its name.")
+    overwrite: bool = Field(default=False, description="Replace files that already exist at the destination.")
+
+
+class FileSystemAppendRequest(BaseModel):
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "path": "/project/NOTES.md",
+                "content": "\n## Step 4\nMigrated the connection pool.\n"
+            }
+        }
+    )
+    path: str = Field(..., description="Path to the file; created if it does not exist")
+    content: str = Field(..., description="Text appended to the end of the file")
+
+
 class FileSystemEditRequest(BaseModel):
     model_config = ConfigDict(
         json_schema_extra={
@@ -45,11 +75,86 @@ class FileSystemSearchContentRequest(BaseModel):
                 "query": "connectToDatabase",
                 "is_regex": False,
                 "search_in_folder": "/path/to/project/src",
-                "page": 1
+                "page": 1,
+                "page_size": 20
             }
         }
     )
     query: str = Field(..., description="The search query string or regex pattern.")
     search_in_folder: str = Field(..., description="The root path to search within.")
     is_regex: bool | None = Field(default=False, description="Whether the query is a regex pattern.")
-    page: int | None = Field(default=None, description="Page number of the content (ignored).")
+    page: int | None = Field(default=None, ge=1, description="1-based page of matching files. Ignored when a cursor is given.")
+    page_size: int | None = Field(
+        default=None,
+        ge=1,
+        le=1000,
+        description="Matching files per page. Defaults to 50 when page or cursor is set; otherwise every match is returned.",
+    )
+    cursor: str | None = Field(default=None, description="next_cursor of a previous response, to continue after its last match.")
+    stream: bool = Field(default=False, description="Stream matches as NDJSON while the folder is scanned.")
+
+
+class FileSystemGrepRequest(BaseModel):
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "query": "connectToDatabase",
+                "is_regex": False,
+                "search_in_folder": "/path/to/project/src",
+                "context_lines": 2,
+                "max_matches_per_file": 20,
+                "max_total_matches": 200
+            }
+        }
+    )
+    query: str = Field(..., description="The search query string or regex pattern, matched line by line.")
+    search_in_folder: str = Field(..., description="The root path to search within.")
+    is_regex: bool | None = Field(default=False, description="Whether the query is a regex pattern.")
+    context_lines: int = Field(default=0, ge=0, le=20, description="Lines of context returned before and after each match.")
+    max_matches_per_file: int = Field(default=50, ge=1, le=1000, description="Matching lines returned per file.")
+    max_total_matches: int = Field(default=500, ge=1, le=5000, description="Matching lines returned in total; the scan stops there.")
+
+
+class AgentBatchOperation(BaseModel):
+    op: Literal[
+        "read", "list", "tree", "create", "rewrite", "edit", "delete", "copy", "move",
+        "search_paths", "search_content", "search_file", "grep",
+    ] = Field(..., description="Operation to run; each mirrors the standalone endpoint of the same purpose.")
+    path: str = Field(..., description="File or folder the operation applies to (search root for searches).")
+    start_line: int | None = Field(default=None, description="read: start line of the content.")
+    end_line: int | None = Field(default=None, description="read: end line of the content.")
+    offset: int | None = Field(default=None, ge=0, description="read: byte offset; switches to byte-range mode.")
+    length: int | None = Field(default=None, gt=0, description="read: number of bytes to read in byte-range mode.")
+    content: str | None = Field(default=None, description="rewrite: full new file content.")
+    search_replace_blocks: str | None = Field(default=None, description="edit: SEARCH/REPLACE block(s) to apply.")
+    query: str | None = Field(default=None, description="search_*/grep: query string, regex or glob.")
+    is_regex: bool = Field(default=False, description="search_content/search_file/grep: whether the query is a regex.")
+    include_pattern: bool = Field(default=False, description="search_paths: whether the query is a glob pattern.")
+    destination: str | None = Field(default=None, description="copy/move: new path of the file or folder.")
+    overwrite: bool = Field(default=False, description="copy/move: replace files that already exist at the destination.")
+    max_depth: int | None = Field(default=None, ge=1, description="tree: levels to expand.")
+    max_entries: int | None = Field(default=5000, ge=1, le=50000, description="tree: entries to show before truncating.")
+    ignore: list[str] | None = Field(default=None, description="tree: glob patterns; matching names or relative paths are left out with their content.")
+
+
+class AgentBatchRequest(BaseModel):
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "operations": [
+                    {"op": "read", "path": "/project/src/config.ts"},
+                    {"op": "read", "path": "/project/src/app.ts", "start_line": 1, "end_line": 40},
+                    {"op": "rewrite", "path": "/project/NOTES.md", "content": "# Notes\n"},
+                    {"op": "list", "path": "/project/src/"}
+                ],
+                "stop_on_error": False
+            }
+        }
+    )
+    operations: list[AgentBatchOperation] = Field(
+        ...,
+        min_length=1,
+        max_length=50,
+        description="Operations in order. Consecutive reads run concurrently; every write runs alone, in order.",
+    )
+    stop_on_error: bool = Field(default=False, description="Once an operation fails, skip every operation that has not started yet.")
@@ -1,3 +1,6 @@
+from datetime import datetime
+from typing import Any
+
 from pydantic import BaseModel, ConfigDict, Field
 
 
@@ -12,6 +15,10 @@ class FileContentResponse(BaseModel):
     )
     status: str = Field(default="success", description="Operation status")
     content: str = Field(..., description="File content")
+    encoding: str | None = Field(default=None, description="Encoding of content in byte-range mode: utf-8 or base64")
+    offset: int | None = Field(default=None, description="Byte offset of the returned range")
+    length: int | None = Field(default=None, description="Number of bytes returned")
+    size: int | None = Field(default=None, description="Total size of the file in bytes")
 
 
 class DirectoryListResponse(BaseModel):
@@ -73,12 +80,17 @@ class FileSystemSearchContentResponse(BaseModel):
                     "/project/src/db/connection.ts",
                     "/project/src/app.ts"
                 ],
-                "message": "Find 2 matches result in /project/src"
+                "message": "Find 2 matches result in /project/src",
+                "next_cursor": "cHJvamVjdC9zcmMvYXBwLnRz"
             }
         }
     )
     files: list[str] = Field(..., description="List of files containing the query")
     message: str = Field(..., description="Result message")
+    next_cursor: str | None = Field(
+        default=None,
+        description="Pass as cursor to fetch the next page; absent when the page was not filled",
+    )
 
 
 class FileSystemSearchOffsetMatch(BaseModel):
@@ -102,3 +114,156 @@ class FileSystemSearchOffsetResponse(BaseModel):
     )
     matches: list[FileSystemSearchOffsetMatch] = Field(..., description="List of matches with line numbers")
     formatted_output: str = Field(..., description="Formatted string output of matches")
+
+
+class FileSystemGrepMatch(BaseModel):
+    line: int = Field(..., description="Line number (1-based)")
+    content: str = Field(..., description="Content of the line")
+    before: list[str] = Field(default_factory=list, description="Context lines preceding the match")
+    after: list[str] = Field(default_factory=list, description="Context lines following the match")
+
+
+class FileSystemGrepFile(BaseModel):
+    path: str = Field(..., description="File containing the matches")
+    matches: list[FileSystemGrepMatch] = Field(..., description="Matching lines in file order")
+    truncated: bool = Field(..., description="Whether the per-file or total limit cut this file's matches short")
+
+
+class FileSystemGrepResponse(BaseModel):
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "files": [
+                    {
+                        "path": "project/src/app.ts",
+                        "matches": [
+                            {
+                                "line": 10,
+                                "content": "const db = connectToDatabase();",
+                                "before": ["// open the pool"],
+                                "after": ["db.migrate();"]
+                            }
+                        ],
+                        "truncated": False
+                    }
+                ],
+                "total_matches": 1,
+                "truncated": False,
+                "formatted_output": "project/src/app.ts\nLine 10:\n```\nconst db = connectToDatabase();\n```",
+                "message": "Find 1 matching lines in 1 files in /project/src"
+            }
+        }
+    )
+    files: list[FileSystemGrepFile] = Field(..., description="Files with matching lines, in path order")
+    total_matches: int = Field(..., description="Number of matching lines returned")
+    truncated: bool = Field(..., description="Whether the total limit stopped the scan")
+    formatted_output: str = Field(..., description="Formatted string output of matches")
+    message: str = Field(..., description="Result message")
+
+
+class StorageStatsResponse(BaseModel):
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "status": "success",
+                "round_trips": {
+                    "read_file_from_storage_string": {"calls": 12, "round_trips": 3}
+                },
+                "cache": {
+                    "hits": 9,
+                    "misses": 3,
+                    "revalidations": 0,
+                    "evictions": 0,
+                    "entries": 3,
+                    "bytes": 48213,
+                    "max_bytes": 67108864
+                },
+                "executors": {
+                    "storage": {
+                        "workers": 32,
+                        "max_queue": 512,
+                        "queued": 0,
+                        "running": 2,
+                        "completed": 1840,
+                        "rejected": 0,
+                        "avg_wait_ms": 0.412,
+                        "max_wait_ms": 38.5,
+                        "avg_run_ms": 61.2,
+                        "max_run_ms": 2210.7
+                    }
+                }
+            }
+        }
+    )
+    status: str = Field(default="success", description="Operation status")
+    round_trips: dict[str, dict[str, int]] = Field(..., description="GCS calls and round trips per repository method since start-up")
+    cache: dict[str, int] = Field(..., description="Blob content cache counters")
+    executors: dict[str, dict[str, float]] = Field(
+        default_factory=dict,
+        description="Queue depth, wait and run times of the per-backend executors used so far",
+    )
+
+
+class AgentBatchResult(BaseModel):
+    index: int = Field(..., description="Position of the operation in the request")
+    op: str = Field(..., description="Operation that was run")
+    path: str = Field(..., description="Path the operation applied to")
+    status: str = Field(..., description="success, error, or skipped after an earlier error with stop_on_error")
+    status_code: int = Field(..., description="HTTP status the standalone endpoint would have answered with")
+    result: dict[str, Any] | None = Field(default=None, description="Operation output, shaped like the standalone endpoint's response")
+    error: str | None = Field(default=None, description="Error detail when the operation failed")
+
+
+class AgentBatchResponse(BaseModel):
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "results": [
+                    {
+                        "index": 0,
+                        "op": "read",
+                        "path": "/project/src/config.ts",
+                        "status": "success",
+                        "status_code": 200,
+                        "result": {"content": "export const debug = false;"}
+                    },
+                    {
+                        "index": 1,
+                        "op": "read",
+                        "path": "/project/src/missing.ts",
+                        "status": "error",
+                        "status_code": 404,
+                        "error": "File not found: project/src/missing.ts"
+                    }
+                ]
+            }
+        }
+    )
+    results: list[AgentBatchResult] = Field(..., description="One result per operation, in request order")
+
+
+class BackgroundJobResponse(BaseModel):
+    model_config = ConfigDict(
+        json_schema_extra={
+            "example": {
+                "job_id": "3f0c9a1e5b7d4c2a8e6f1d0b9a7c5e3f",
+                "kind": "delete",
+                "target": "user/course/assets/",
+                "status": "running",
+                "processed": 1200,
+                "result": None,
+                "error": None,
+                "started_at": "2025-01-01T12:00:00Z",
+                "finished_at": None
+            }
+        }
+    )
+    job_id: str = Field(..., description="Identifier to poll GET /agent/jobs/{job_id} with")
+    kind: str = Field(..., description="Kind of job, e.g. delete")
+    target: str = Field(..., description="Path the job works on")
+    status: str = Field(..., description="running, completed or failed")
+    processed: int = Field(..., description="Objects processed so far")
+    result: dict[str, Any] | None = Field(default=None, description="Final outcome once completed, e.g. {'deleted': 1200}")
+    error: str | None = Field(default=None, description="Failure detail when status is failed")
+    started_at: datetime = Field(..., description="When the job started")
+    finished_at: datetime | None = Field(default=None, description="When the job completed or failed")
@@ -76,7 +76,8 @@ class CourseDetailResponse(BaseModel):
                         "content": "Hello",
                         "createdAt": "2025-01-01T00:00:00.000000+00:00"
                     }
-                ]
+                ],
+                "has_more": False
             }
         }
     )
@@ -84,6 +85,7 @@ class CourseDetailResponse(BaseModel):
     status: str = Field(..., description="Response status", example="success")
     course: CourseModel = Field(..., description="Course data")
     messages: list[MessageModel] = Field(..., description="List of messages for the course")
+    has_more: bool = Field(False, description="Whether more messages lie beyond this page")
 
 class MultipleMessageResponse(BaseModel):
     model_config = ConfigDict(
@@ -99,13 +101,15 @@ class MultipleMessageResponse(BaseModel):
                         "content": "Hello",
                         "createdAt": "2025-01-01T00:00:00.000000+00:00"
                     }
-                ]
+                ],
+                "has_more": False
             }
         }
     )
     
     status: str = Field(..., description="Response status", example="success")
     messages: list[MessageModel] = Field(..., description="List of messages for the course")
+    has_more: bool = Field(False, description="Whether more messages lie beyond this page")
 
 class SingleMessageResponse(BaseModel):
     model_config = ConfigDict(
@@ -1,22 +1,23 @@
 from __future__ import annotations
 
-import asyncio
 from datetime import datetime, timezone
 from typing import Any
 
 from google.cloud import firestore
 
+from core.executors import InstrumentedExecutor, run_async
 from models.course import CourseModel, Phase
 
 
 class CourseRepository:
-    def __init__(self, client: firestore.Client, collection: str = "courses") -> None:
+    def __init__(self, client: firestore.AsyncClient, collection: str = "courses", executor: InstrumentedExecutor | None = None) -> None:
         self._client = client
         self._collection = collection
+        self._executor = executor
 
     async def create_course(self, owner_id: str,name: str) -> CourseModel:
 
-        def _sync_create_course() -> CourseModel:
+        async def _create_course() -> CourseModel:
             courses_ref = self._client.collection(self._collection)
             doc_ref = courses_ref.document()
             
@@ -31,32 +32,32 @@ class CourseRepository:
                 "phase": Phase.MARKDOWN
             }
             
-            doc_ref.set(new_course_data)
+            await doc_ref.set(new_course_data)
             return CourseModel(**new_course_data)
 
-        return await asyncio.to_thread(_sync_create_course)
+        return await run_async(self._executor, _create_course)
 
     async def get_all_courses_by_userId(self, user_id: str) -> list[CourseModel]:
         
-        def _sync_get_all_courses_by_userId() -> list[CourseModel]:
+        async def _get_all_courses_by_userId() -> list[CourseModel]:
             courses_ref = self._client.collection(self._collection)
 
             query = courses_ref.where("owner_id", "==", user_id)
 
-            docs = list(query.stream())
+            docs = [doc async for doc in query.stream()]
 
             return [CourseModel(**doc.to_dict()) for doc in docs]
 
-        return await asyncio.to_thread(_sync_get_all_courses_by_userId)
+        return await run_async(self._executor, _get_all_courses_by_userId)
 
     async def get_course_by_id(self, course_id: str) -> CourseModel | None:
         
-        def _sync_get_course_by_id() -> CourseModel | None:
+        async def _get_course_by_id() -> CourseModel | None:
             doc_ref = self._client.collection(self._collection).document(course_id)
-            doc = doc_ref.get()
+            doc = await doc_ref.get()
             
             if doc.exists:
                 return CourseModel(**doc.to_dict())
             return None
 
-        return await asyncio.to_thread(_sync_get_course_by_id)
\ No newline at end of file
+        return await run_async(self._executor, _get_course_by_id)
\ No newline at end of file
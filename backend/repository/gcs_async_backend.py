@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator
+from urllib.parse import quote
+
+import httpx
+from google.auth.credentials import Credentials
+from google.auth.transport.requests import Request as AuthRequest
+
+from repository.storage_backend import AsyncStorageBackend, ObjectNotFound, PreconditionFailed, StoredObject, UnsupportedQuery
+
+DEFAULT_ENDPOINT = "https://storage.googleapis.com"
+
+# The retry policy google-cloud-storage applies to the blocking backend (google.cloud.storage.retry)
+_RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+_RETRY_INITIAL_DELAY = 1.0
+_RETRY_MAXIMUM_DELAY = 60.0
+_RETRY_MULTIPLIER = 2.0
+_RETRY_DEADLINE = 120.0
+
+
+class AsyncGCSStorageBackend(AsyncStorageBackend):
+    """Objects of one Google Cloud Storage bucket over the JSON API.
+
+    Every instance in the process shares ``client`` and with it one pool of
+    keep-alive connections, so in-flight calls cost a socket each rather than
+    a thread. Credentials are refreshed off the event loop when they expire.
+    Like the client library, requests are retried on 408, 429, 5xx and
+    connection errors when repeating them is safe: reads, listings and
+    writes or deletes conditioned on a generation.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        bucket_name: str,
+        credentials: Credentials | None,
+        endpoint: str = DEFAULT_ENDPOINT,
+    ) -> None:
+        self._client = client
+        self._credentials = credentials
+        self._objects_url = f"{endpoint}/storage/v1/b/{quote(bucket_name, safe='')}/o"
+        self._upload_url = f"{endpoint}/upload/storage/v1/b/{quote(bucket_name, safe='')}/o"
+        self._refresh_lock = asyncio.Lock()
+
+    async def stat(self, name: str) -> StoredObject:
+        response = await self._request("GET", self._object_url(name), name, idempotent=True)
+        return _stored(response.json())
+
+    async def read(
+        self,
+        name: str,
+        start: int | None = None,
+        end: int | None = None,
+        if_generation_match: int | None = None,
+    ) -> tuple[bytes, StoredObject]:
+        params: dict[str, Any] = {"alt": "media"}
+        if if_generation_match is not None:
+            params["ifGenerationMatch"] = if_generation_match
+        headers = {}
+        if start is not None or end is not None:
+            headers["Range"] = f"bytes={start or 0}-{'' if end is None else end}"
+            # Ranged downloads must not be transcoded, or the offsets would refer to other bytes
+            headers["Accept-Encoding"] = "identity"
+
+        response = await self._request("GET", self._object_url(name), name, idempotent=True, params=params, headers=headers)
+        data = response.content
+        size = len(data)
+        content_range = response.headers.get("Content-Range")
+        if content_range and "/" in content_range:
+            total = content_range.rsplit("/", 1)[1]
+            if total.isdigit():
+                size = int(total)
+        generation = response.headers.get("X-Goog-Generation")
+        return data, StoredObject(name=name, size=size, generation=int(generation) if generation else None)
+
+    async def write(self, name: str, data: bytes, content_type: str, if_generation_match: int | None = None) -> StoredObject:
+        params: dict[str, Any] = {"uploadType": "media", "name": name}
+        if if_generation_match is not None:
+            params["ifGenerationMatch"] = if_generation_match
+        response = await self._request(
+            "POST",
+            self._upload_url,
+            name,
+            idempotent=if_generation_match is not None,
+            params=params,
+            content=data,
+            headers={"Content-Type": content_type},
+        )
+        return _stored(response.json())
+
+    async def delete(self, name: str, if_generation_match: int | None = None) -> None:
+        params = {"ifGenerationMatch": if_generation_match} if if_generation_match is not None else {}
+        await self._request("DELETE", self._object_url(name), name, idempotent=if_generation_match is not None, params=params)
+
+    async def list_pages(
+        self,
+        prefix: str,
+        delimiter: str | None = None,
+        match_glob: str | None = None,
+    ) -> AsyncIterator[tuple[list[StoredObject], list[str]]]:
+        params: dict[str, Any] = {"prefix": prefix}
+        if delimiter is not None:
+            params["delimiter"] = delimiter
+        if match_glob is not None:
+            params["matchGlob"] = match_glob
+
+        while True:
+            response = await self._request("GET", self._objects_url, prefix, idempotent=True, params=params, match_glob=match_glob)
+            listed = response.json()
+            yield [_stored(item) for item in listed.get("items", [])], sorted(listed.get("prefixes", []))
+            token = listed.get("nextPageToken")
+            if not token:
+                return
+            params["pageToken"] = token
+
+    def _object_url(self, name: str) -> str:
+        return f"{self._objects_url}/{quote(name, safe='')}"
+
+    async def _request(
+        self,
+        method: str,
+        url: str,
+        name: str,
+        idempotent: bool,
+        match_glob: str | None = None,
+        headers: dict[str, str] | None = None,
+        **kwargs: Any,
+    ) -> httpx.Response:
+        response = await self._send(method, url, idempotent, headers or {}, **kwargs)
+        if response.status_code == httpx.codes.NOT_FOUND:
+            raise ObjectNotFound(name)
+        if response.status_code == httpx.codes.PRECONDITION_FAILED:
+            raise PreconditionFailed(name)
+        if response.status_code == httpx.codes.BAD_REQUEST and match_glob is not None:
+            # Backends without matchGlob support (e.g. some emulators) reject the parameter
+            raise UnsupportedQuery(match_glob)
+        response.raise_for_status()
+        return response
+
+    async def _send(self, method: str, url: str, idempotent: bool, headers: dict[str, str], **kwargs: Any) -> httpx.Response:
+        # Exponential backoff with jitter until the deadline; a non-idempotent request is sent once
+        deadline = time.monotonic() + _RETRY_DEADLINE
+        delay = _RETRY_INITIAL_DELAY
+        while True:
+            try:
+                response = await self._client.request(method, url, headers={**headers, **await self._auth_headers()}, **kwargs)
+            except httpx.TransportError:
+                if not idempotent or time.monotonic() + delay > deadline:
+                    raise
+            else:
+                if response.status_code not in _RETRYABLE_STATUS_CODES or not idempotent or time.monotonic() + delay > deadline:
+                    return response
+            await asyncio.sleep(random.uniform(0, delay))
+            delay = min(delay * _RETRY_MULTIPLIER, _RETRY_MAXIMUM_DELAY)
+
+    async def _auth_headers(self) -> dict[str, str]:
+        if self._credentials is None:
+            return {}
+        if not self._credentials.valid:
+            async with self._refresh_lock:
+                if not self._credentials.valid:
+                    # The token endpoint call is blocking, but only happens about once an hour
+                    await asyncio.to_thread(self._credentials.refresh, AuthRequest())
+        return {"Authorization": f"Bearer {self._credentials.token}"}
+
+
+def _stored(item: dict[str, Any]) -> StoredObject:
+    updated = item.get("updated")
+    return StoredObject(
+        name=item["name"],
+        size=int(item["size"]) if "size" in item else None,
+        generation=int(item["generation"]) if "generation" in item else None,
+        updated=datetime.fromisoformat(updated.replace("Z", "+00:00")) if updated else None,
+        component_count=item.get("componentCount"),
+    )
@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator
+
+from google.api_core import exceptions as gcs_exceptions
+from google.cloud import storage
+
+from repository.storage_backend import AsyncStorageBackend, ObjectNotFound, PreconditionFailed, StorageBackend, StoredObject, UnsupportedQuery
+
+
+class GCSStorageBackend(StorageBackend):
+    """Objects of one Google Cloud Storage bucket, optionally with a non-blocking data path to the same bucket."""
+
+    def __init__(self, client: storage.Client, bucket_name: str, async_backend: AsyncStorageBackend | None = None) -> None:
+        self._bucket_name = bucket_name
+        self._bucket = client.bucket(bucket_name)
+        self.async_backend = async_backend
+
+    @property
+    def name(self) -> str:
+        return self._bucket_name
+
+    def uri(self, name: str) -> str:
+        return f"gs://{self._bucket_name}/{name}"
+
+    def stat(self, name: str) -> StoredObject:
+        blob = self._bucket.blob(name)
+        with _translated(name):
+            blob.reload()
+        return _stored(blob)
+
+    def read(
+        self,
+        name: str,
+        start: int | None = None,
+        end: int | None = None,
+        if_generation_match: int | None = None,
+    ) -> tuple[bytes, StoredObject]:
+        blob = self._bucket.blob(name)
+        with _translated(name):
+            data = blob.download_as_bytes(start=start, end=end, if_generation_match=if_generation_match)
+        if start is None and end is None:
+            # A download reports the generation but not the size
+            return data, StoredObject(name=name, size=len(data), generation=blob.generation, updated=blob.updated)
+        return data, _stored(blob)
+
+    def write(self, name: str, data: bytes, content_type: str, if_generation_match: int | None = None) -> StoredObject:
+        blob = self._bucket.blob(name)
+        with _translated(name):
+            blob.upload_from_string(data, content_type=content_type, if_generation_match=if_generation_match)
+        return _stored(blob)
+
+    def write_file(self, name: str, file_obj: BinaryIO, content_type: str) -> StoredObject:
+        blob = self._bucket.blob(name)
+        with _translated(name):
+            blob.upload_from_file(file_obj, content_type=content_type)
+        return _stored(blob)
+
+    def compose(self, name: str, sources: list[str], if_generation_match: int | None = None) -> StoredObject:
+        blob = self._bucket.blob(name)
+        with _translated(name):
+            blob.compose([self._bucket.blob(source) for source in sources], if_generation_match=if_generation_match)
+        return _stored(blob)
+
+    def copy(self, source: StoredObject, name: str, if_generation_match: int | None = None) -> StoredObject:
+        blob = self._bucket.blob(name)
+        # Large or cross-location objects take several rewrite calls, each resuming with the token
+        token = None
+        with _translated(name):
+            while True:
+                token, _, _ = blob.rewrite(
+                    self._bucket.blob(source.name),
+                    token=token,
+                    if_generation_match=if_generation_match,
+                    if_source_generation_match=source.generation,
+                )
+                if token is None:
+                    break
+        return _stored(blob)
+
+    def delete(self, name: str, if_generation_match: int | None = None) -> None:
+        with _translated(name):
+            self._bucket.blob(name).delete(if_generation_match=if_generation_match)
+
+    def delete_many(self, names: list[str]) -> None:
+        # delete_blobs issues one DELETE per object; missing objects are already gone
+        self._bucket.delete_blobs([self._bucket.blob(name) for name in names], on_error=lambda blob: None)
+
+    def list_pages(
+        self,
+        prefix: str,
+        delimiter: str | None = None,
+        match_glob: str | None = None,
+    ) -> Iterator[tuple[list[StoredObject], list[str]]]:
+        kwargs = {"match_glob": match_glob} if match_glob is not None else {}
+        iterator = self._bucket.list_blobs(prefix=prefix, delimiter=delimiter, **kwargs)
+        seen: set[str] = set()
+        try:
+            for page in iterator.pages:
+                objects = [_stored(blob) for blob in page]
+                # The iterator accumulates the prefixes of every page fetched so far
+                prefixes = sorted(set(iterator.prefixes) - seen)
+                seen.update(prefixes)
+                yield objects, prefixes
+        except gcs_exceptions.BadRequest as exc:
+            if match_glob is None:
+                raise
+            # Backends without match_glob support (e.g. some emulators) reject the parameter
+            raise UnsupportedQuery(match_glob) from exc
+
+
+@contextmanager
+def _translated(name: str) -> Iterator[None]:
+    try:
+        yield
+    except gcs_exceptions.NotFound as exc:
+        raise ObjectNotFound(name) from exc
+    except gcs_exceptions.PreconditionFailed as exc:
+        raise PreconditionFailed(name) from exc
+
+
+def _stored(blob: storage.Blob) -> StoredObject:
+    return StoredObject(
+        name=blob.name,
+        size=blob.size,
+        generation=blob.generation,
+        updated=blob.updated,
+        component_count=blob.component_count,
+    )
@@ -0,0 +1,375 @@
+from __future__ import annotations
+
+import fcntl
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from stat import S_ISREG
+from typing import BinaryIO, Callable, Iterator
+
+from repository.storage_backend import ObjectNotFound, PreconditionFailed, StorageBackend, StoredObject, UnsupportedQuery
+
+# A folder marker object ``a/b/`` is stored as this file inside the directory ``a/b``
+_FOLDER_MARKER = ".__folder__"
+# Names starting with this are the backend's own files and never listed
+_RESERVED_PREFIX = ".__"
+_LIST_PAGE_SIZE = 1000
+# Writers lock one of these stripes, picked by the object name, instead of the whole root
+_LOCK_STRIPES = 64
+_LOCK_DIRECTORY = f"{_RESERVED_PREFIX}locks"
+_TEMPORARY_FILE_ATTEMPTS = 5
+
+
+class LocalStorageBackend(StorageBackend):
+    """Objects stored as files under a local directory, with the same semantics as a GCS bucket.
+
+    An object ``a/b.txt`` is the file ``<root>/a/b.txt`` and a folder marker
+    ``a/`` is a hidden file inside ``<root>/a``. A directory exists only while
+    it holds objects, so prefixes are listed exactly like GCS lists them. The
+    generation of an object is the nanosecond modification time the backend
+    stamps on every write, which needs a filesystem that keeps nanoseconds
+    (ext4, xfs, tmpfs, APFS). Writes land in a temporary file that atomically
+    replaces the object; only the generation check and the rename run under
+    a per-object lock, which also covers other processes using the same root.
+    Appending to an object in place holds an exclusive lock on its file, and
+    readers a shared one while they take its size and generation. Reads are
+    served from a memory map of the file.
+
+    Unlike in GCS, ``a/b`` and ``a/b/c`` cannot both be files, and content
+    types are not kept.
+    """
+
+    def __init__(self, root: str) -> None:
+        self._root = os.path.abspath(root)
+        os.makedirs(os.path.join(self._root, _LOCK_DIRECTORY), exist_ok=True)
+        self._lock = threading.Lock()
+        self._last_generation = 0
+
+    @property
+    def name(self) -> str:
+        return self._root
+
+    def uri(self, name: str) -> str:
+        return f"file://{self._path(name)}"
+
+    def stat(self, name: str) -> StoredObject:
+        try:
+            stat_result = os.stat(self._path(name))
+        except (FileNotFoundError, NotADirectoryError) as exc:
+            raise ObjectNotFound(name) from exc
+        if not S_ISREG(stat_result.st_mode):
+            # A directory is a prefix, not an object
+            raise ObjectNotFound(name)
+        return self._stored(name, stat_result)
+
+    def read(
+        self,
+        name: str,
+        start: int | None = None,
+        end: int | None = None,
+        if_generation_match: int | None = None,
+    ) -> tuple[bytes, StoredObject]:
+        with self._mapped(name) as (mapped, stored):
+            if if_generation_match is not None and stored.generation != if_generation_match:
+                raise PreconditionFailed(name)
+            begin = start or 0
+            finish = len(mapped) if end is None else end + 1
+            return bytes(mapped[begin:finish]), stored
+
+    def contains(self, name: str, needle: bytes, generation: int | None) -> bool | None:
+        # Searched in the page cache through the memory map, without copying the file
+        try:
+            with self._mapped(name) as (mapped, stored):
+                if generation is not None and stored.generation != generation:
+                    return None
+                return mapped.find(needle) >= 0
+        except ObjectNotFound:
+            return None
+
+    def write(self, name: str, data: bytes, content_type: str, if_generation_match: int | None = None) -> StoredObject:
+
+        def _write(handle: BinaryIO) -> None:
+            handle.write(data)
+
+        return self._replace(name, _write, if_generation_match)
+
+    def write_file(self, name: str, file_obj: BinaryIO, content_type: str) -> StoredObject:
+
+        def _write(handle: BinaryIO) -> None:
+            shutil.copyfileobj(file_obj, handle)
+
+        return self._replace(name, _write, None)
+
+    def compose(self, name: str, sources: list[str], if_generation_match: int | None = None) -> StoredObject:
+        if sources and sources[0] == name:
+            # Appending to the object itself: extend the file in place instead of rewriting it.
+            # Readers wait for the appended bytes and the new generation to land together.
+            with self._mutation(name, if_generation_match):
+                path = self._path(name)
+                try:
+                    handle = open(path, "ab")
+                except (FileNotFoundError, NotADirectoryError, IsADirectoryError) as exc:
+                    raise ObjectNotFound(name) from exc
+                with handle:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+                    for source in sources[1:]:
+                        self._copy_into(source, handle)
+                    handle.flush()
+                    return self._stamp(name, path)
+
+        def _write(handle: BinaryIO) -> None:
+            for source in sources:
+                self._copy_into(source, handle)
+
+        return self._replace(name, _write, if_generation_match)
+
+    def copy(self, source: StoredObject, name: str, if_generation_match: int | None = None) -> StoredObject:
+
+        def _write(handle: BinaryIO) -> None:
+            # The open file keeps the checked generation's bytes even if the source is replaced meanwhile
+            with self._opened(source.name) as (source_handle, stored):
+                if source.generation is not None and stored.generation != source.generation:
+                    raise PreconditionFailed(source.name)
+                # copyfileobj between real files lets the kernel copy the bytes
+                shutil.copyfileobj(source_handle, handle)
+
+        return self._replace(name, _write, if_generation_match)
+
+    def delete(self, name: str, if_generation_match: int | None = None) -> None:
+        with self._mutation(name, if_generation_match):
+            path = self._path(name)
+            try:
+                os.unlink(path)
+            except (FileNotFoundError, NotADirectoryError, IsADirectoryError) as exc:
+                raise ObjectNotFound(name) from exc
+            self._prune(os.path.dirname(path))
+
+    def delete_many(self, names: list[str]) -> None:
+        for name in names:
+            try:
+                self.delete(name)
+            except ObjectNotFound:
+                pass
+
+    def list_pages(
+        self,
+        prefix: str,
+        delimiter: str | None = None,
+        match_glob: str | None = None,
+    ) -> Iterator[tuple[list[StoredObject], list[str]]]:
+        if delimiter not in (None, "/"):
+            raise ValueError(f"Unsupported delimiter: {delimiter!r}")
+        glob = _compile_match_glob(match_glob) if match_glob is not None else None
+
+        names = self._names_under(prefix) if delimiter is None else self._children(prefix)
+
+        objects: list[StoredObject] = []
+        prefixes: list[str] = []
+        for name in names:
+            if name.endswith("/") and name != prefix and delimiter is not None:
+                prefixes.append(name)
+            elif glob is None or glob.match(name):
+                try:
+                    objects.append(self._stored(name, os.stat(self._path(name))))
+                except FileNotFoundError:
+                    # Deleted since the directory was read
+                    continue
+            if len(objects) + len(prefixes) >= _LIST_PAGE_SIZE:
+                yield objects, prefixes
+                objects, prefixes = [], []
+        yield objects, prefixes
+
+    def _names_under(self, prefix: str) -> list[str]:
+        # Every object name starting with ``prefix``, in name order like a GCS listing
+        base = prefix[:prefix.rfind("/") + 1]
+        start = self._directory(base)
+        names = []
+        for directory, folders, files in os.walk(start):
+            relative = os.path.relpath(directory, self._root)
+            folder_name = "" if relative == "." else relative.replace(os.sep, "/") + "/"
+            # Prune subtrees that cannot hold a match
+            folders[:] = [
+                folder for folder in folders
+                if not folder.startswith(_RESERVED_PREFIX) and _may_hold(f"{folder_name}{folder}/", prefix)
+            ]
+            for file in files:
+                if file == _FOLDER_MARKER:
+                    name = folder_name
+                elif file.startswith(_RESERVED_PREFIX):
+                    continue
+                else:
+                    name = folder_name + file
+                if name and name.startswith(prefix):
+                    names.append(name)
+        return sorted(names)
+
+    def _children(self, prefix: str) -> list[str]:
+        # One directory level: files are objects, non-empty subdirectories are prefixes
+        base = prefix[:prefix.rfind("/") + 1]
+        directory = self._directory(base)
+        names = []
+        try:
+            with os.scandir(directory) as iterator:
+                for entry in iterator:
+                    if entry.name == _FOLDER_MARKER:
+                        name = base
+                    elif entry.name.startswith(_RESERVED_PREFIX):
+                        continue
+                    elif entry.is_dir(follow_symlinks=False):
+                        name = f"{base}{entry.name}/"
+                    else:
+                        name = base + entry.name
+                    if name and name.startswith(prefix):
+                        names.append(name)
+        except (FileNotFoundError, NotADirectoryError):
+            return []
+        return sorted(names)
+
+    def _path(self, name: str) -> str:
+        folder, _, leaf = name.rpartition("/")
+        if not name or leaf in (".", "..") or leaf.startswith(_RESERVED_PREFIX):
+            raise ValueError(f"Object name cannot be stored on disk: {name!r}")
+        return os.path.join(self._directory(folder + "/" if folder else ""), leaf or _FOLDER_MARKER)
+
+    def _directory(self, folder: str) -> str:
+        # ``a/b/`` -> <root>/a/b; rejects names that would escape the root or collide with our own files
+        if not folder:
+            return self._root
+        parts = folder[:-1].split("/")
+        if any(part in ("", ".", "..") or part.startswith(_RESERVED_PREFIX) for part in parts):
+            raise ValueError(f"Object name cannot be stored on disk: {folder!r}")
+        return os.path.join(self._root, *parts)
+
+    def _stored(self, name: str, stat_result: os.stat_result) -> StoredObject:
+        generation = stat_result.st_mtime_ns
+        return StoredObject(
+            name=name,
+            size=stat_result.st_size,
+            generation=generation,
+            updated=datetime.fromtimestamp(generation / 1e9, tz=timezone.utc),
+        )
+
+    @contextmanager
+    def _opened(self, name: str) -> Iterator[tuple[BinaryIO, StoredObject]]:
+        # The shared lock keeps an in-place append from landing between the size and the generation
+        try:
+            handle = open(self._path(name), "rb")
+        except (FileNotFoundError, NotADirectoryError, IsADirectoryError) as exc:
+            raise ObjectNotFound(name) from exc
+        with handle:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_SH)
+            yield handle, self._stored(name, os.fstat(handle.fileno()))
+
+    @contextmanager
+    def _mapped(self, name: str) -> Iterator[tuple[bytes | mmap.mmap, StoredObject]]:
+        with self._opened(name) as (handle, stored):
+            if not stored.size:
+                # mmap cannot map an empty file
+                yield b"", stored
+                return
+            # The map keeps the bytes of this generation even if the file is replaced meanwhile;
+            # appends only add bytes past the mapped length
+            with mmap.mmap(handle.fileno(), stored.size, access=mmap.ACCESS_READ) as mapped:
+                yield mapped, stored
+
+    def _copy_into(self, source: str, handle: BinaryIO) -> None:
+        with self._opened(source) as (source_handle, _):
+            shutil.copyfileobj(source_handle, handle)
+
+    def _replace(self, name: str, write: Callable[[BinaryIO], None], if_generation_match: int | None) -> StoredObject:
+        # The bytes are written before taking the lock; only the check, the stamp and the rename hold it
+        path = self._path(name)
+        directory = os.path.dirname(path)
+        temporary = self._temporary_file(directory)
+        try:
+            with temporary as handle:
+                write(handle)
+            with self._mutation(name, if_generation_match):
+                self._stamp(name, temporary.name)
+                os.replace(temporary.name, path)
+                return self.stat(name)
+        except BaseException:
+            try:
+                os.unlink(temporary.name)
+            except FileNotFoundError:
+                pass
+            self._prune(directory)
+            raise
+
+    def _temporary_file(self, directory: str) -> BinaryIO:
+        # A delete elsewhere in the directory may prune it between creating it and opening the file
+        attempts = _TEMPORARY_FILE_ATTEMPTS
+        while True:
+            try:
+                # makedirs reports FileExistsError when the directory vanishes while it looks
+                os.makedirs(directory, exist_ok=True)
+                return open(os.path.join(directory, f"{_RESERVED_PREFIX}tmp-{uuid.uuid4().hex}"), "xb")
+            except (FileNotFoundError, FileExistsError):
+                attempts -= 1
+                if not attempts:
+                    raise
+
+    def _stamp(self, name: str, path: str) -> StoredObject:
+        # Generations must change on every write, even within one tick of the filesystem clock
+        with self._lock:
+            generation = max(time.time_ns(), self._last_generation + 1)
+            self._last_generation = generation
+        os.utime(path, ns=(generation, generation))
+        return self._stored(name, os.stat(path))
+
+    @contextmanager
+    def _mutation(self, name: str, if_generation_match: int | None) -> Iterator[None]:
+        # One writer of an object at a time across threads and processes sharing the root, so that
+        # checking the generation and replacing the file happen as one step
+        with self._lock_object(name):
+            if if_generation_match is not None:
+                try:
+                    current = self.stat(name).generation
+                except ObjectNotFound:
+                    current = 0
+                if current != if_generation_match:
+                    raise PreconditionFailed(name)
+            yield
+
+    @contextmanager
+    def _lock_object(self, name: str) -> Iterator[None]:
+        # flock locks belong to the open file, so threads of this process exclude each other too
+        stripe = zlib.crc32(name.encode("utf-8")) % _LOCK_STRIPES
+        descriptor = os.open(os.path.join(self._root, _LOCK_DIRECTORY, f"{stripe:02d}"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(descriptor, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(descriptor)
+
+    def _prune(self, directory: str) -> None:
+        # Keep the invariant that a directory exists only while it holds objects
+        while directory != self._root and directory.startswith(self._root):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                return
+            directory = os.path.dirname(directory)
+
+
+def _may_hold(folder: str, prefix: str) -> bool:
+    return folder.startswith(prefix) or prefix.startswith(folder)
+
+
+def _compile_match_glob(match_glob: str) -> re.Pattern[str]:
+    # The subset of GCS glob syntax the repository pushes down: "*" within a level, "**" across levels
+    if set(match_glob) & set("?[]{}\\"):
+        raise UnsupportedQuery(match_glob)
+    pieces = []
+    for index, part in enumerate(match_glob.split("**")):
+        if index:
+            pieces.append(".*")
+        pieces.append("[^/]*".join(re.escape(literal) for literal in part.split("*")))
+    return re.compile("".join(pieces) + r"\Z", re.DOTALL)
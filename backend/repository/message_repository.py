@@ -1,39 +1,53 @@
 import asyncio
-from typing import Any, Optional
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Optional, TypeVar
 
 from google.cloud import firestore
 from google.cloud.firestore_v1.base_query import FieldFilter
 
+from core.executors import InstrumentedExecutor, run_async
 from models.message import MessageModel
 
+# Firestore caps a commit at 500 writes and a request at 10 MiB
+_MAX_WRITES_PER_COMMIT = 500
+_MAX_BYTES_PER_COMMIT = 8 * 1024 * 1024
+# An append spanning several commits leases the course counter until its last commit, so no message with
+# a later index becomes visible (and is skipped over by ``since_index`` pollers) while part of it is missing
+_APPEND_LEASE_SECONDS = 30
+_APPEND_LEASE_POLL_SECONDS = 0.05
+_APPEND_LEASE_MAX_POLL_SECONDS = 1.0
+
+_T = TypeVar("_T")
+
+
+class _CounterLeased(Exception):
+    """Another append holds the course counter; the transaction is retried once it is released."""
+
 
 class MessageRepository:
-    def __init__(self, client: firestore.Client, collection: str = "message") -> None:
+    def __init__(
+        self,
+        client: firestore.AsyncClient,
+        collection: str = "message",
+        counter_collection: str = "message_counter",
+        executor: InstrumentedExecutor | None = None,
+    ) -> None:
         self._client = client
         self._collection = collection
+        # One document per course, keyed by course ID, holding the next free message index
+        self._counter_collection = counter_collection
+        self._executor = executor
 
     async def create_message(self, course_id: str, message: MessageModel) -> MessageModel:
         
-        def _sync_create_message() -> MessageModel:
+        async def _create_message() -> MessageModel:
             messages_ref = self._client.collection(self._collection)
             
             # Start a transaction to ensure index consistency
-            @firestore.transactional
-            def create_in_transaction(transaction: firestore.Transaction) -> MessageModel:
-                # Query specifically for this course to find the max index
-                # We need to order by index descending and limit to 1
-                query = messages_ref.where(filter=FieldFilter("course_id", "==", course_id))\
-                                    .order_by("index", direction=firestore.Query.DESCENDING)\
-                                    .limit(1)
-                
-                # Transactional query
-                results = list(query.stream(transaction=transaction))
-                
-                next_index = 0
-                if results:
-                    last_msg = results[0].to_dict()
-                    if last_msg and "index" in last_msg:
-                        next_index = last_msg["index"] + 1
+            @firestore.async_transactional
+            async def create_in_transaction(transaction: firestore.AsyncTransaction) -> MessageModel:
+                next_index = await self._reserve_in_transaction(transaction, course_id, 1, stored=1)
                 
                 # Create new document reference
                 new_doc_ref = messages_ref.document()
@@ -49,31 +63,284 @@ class MessageRepository:
                 
                 return MessageModel(**message_data)
 
-            transaction = self._client.transaction()
-            return create_in_transaction(transaction)
+            return await self._wait_for_lease(lambda: create_in_transaction(self._client.transaction()))
+
+        return await run_async(self._executor, _create_message)
+
+    async def append_messages(self, course_id: str, messages: list[MessageModel]) -> list[MessageModel]:
+        """Store messages under consecutive indexes, in list order, with as few commits as possible.
+
+        Messages that fit one commit are written in the transaction that
+        reserves their indexes. Longer lists reserve the range with their
+        first chunk and lease the course counter until the last chunk is
+        committed, each in a transaction that checks the lease is still held;
+        other writers of the course wait meanwhile, so readers only ever see a
+        prefix. If a chunk fails, the lease is released and the indexes of the
+        unwritten messages stay unused.
+        """
+
+        if not messages:
+            return []
+
+        messages_ref = self._client.collection(self._collection)
+        records = []
+        for message in messages:
+            doc_ref = messages_ref.document()
+            message_data = message.model_dump(exclude_none=True)
+            message_data["id"] = doc_ref.id
+            message_data["course_id"] = course_id
+            records.append((doc_ref, message_data))
+        # The first commit also carries the counter update
+        chunks = _chunk_records(records, [message.model_dump_json() for message in messages], _MAX_WRITES_PER_COMMIT - 1)
+
+        async def _append_messages() -> list[MessageModel]:
+            lease = uuid.uuid4().hex if len(chunks) > 1 else None
+
+            @firestore.async_transactional
+            async def append_in_transaction(transaction: firestore.AsyncTransaction) -> int:
+                first_chunk = chunks[0]
+                first_index = await self._reserve_in_transaction(
+                    transaction, course_id, len(records), stored=len(first_chunk), lease=lease
+                )
+                for offset, (doc_ref, message_data) in enumerate(first_chunk):
+                    transaction.set(doc_ref, {**message_data, "index": first_index + offset})
+                return first_index
+
+            first_index = await self._wait_for_lease(lambda: append_in_transaction(self._client.transaction()))
+            if lease is not None:
+                offset = len(chunks[0])
+                try:
+                    for number, chunk in enumerate(chunks[1:], start=2):
+                        await self._commit_leased_chunk(course_id, lease, chunk, first_index + offset, last=number == len(chunks))
+                        offset += len(chunk)
+                except BaseException:
+                    await self._release_lease(course_id, lease)
+                    raise
+
+            return [
+                MessageModel(**{**message_data, "index": first_index + offset})
+                for offset, (_, message_data) in enumerate(records)
+            ]
+
+        return await run_async(self._executor, _append_messages)
+
+    async def reserve_indexes(self, course_id: str, count: int) -> int:
+        """Reserve ``count`` consecutive message indexes of the course and return the first one."""
+
+        return await run_async(self._executor, lambda: self._reserve_indexes(course_id, count))
+
+    async def _reserve_indexes(self, course_id: str, count: int) -> int:
+
+        @firestore.async_transactional
+        async def reserve_in_transaction(transaction: firestore.AsyncTransaction) -> int:
+            return await self._reserve_in_transaction(transaction, course_id, count, stored=0)
+
+        return await self._wait_for_lease(lambda: reserve_in_transaction(self._client.transaction()))
+
+    async def _wait_for_lease(self, attempt: Callable[[], Awaitable[_T]]) -> _T:
+        # A lease left behind by a crashed append expires, so this waits at most _APPEND_LEASE_SECONDS
+        delay = _APPEND_LEASE_POLL_SECONDS
+        while True:
+            try:
+                return await attempt()
+            except _CounterLeased:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, _APPEND_LEASE_MAX_POLL_SECONDS)
+
+    async def _commit_leased_chunk(
+        self,
+        course_id: str,
+        lease: str,
+        chunk: list[tuple[Any, dict[str, Any]]],
+        first_index: int,
+        last: bool,
+    ) -> None:
+        counter_ref = self._client.collection(self._counter_collection).document(course_id)
 
-        return await asyncio.to_thread(_sync_create_message)
+        @firestore.async_transactional
+        async def commit_in_transaction(transaction: firestore.AsyncTransaction) -> None:
+            counter = await counter_ref.get(transaction=transaction)
+            data = counter.to_dict() if counter.exists else None
+            if not data or data.get("append_lease") != lease:
+                # Expired and taken over: later messages may already be visible, so this one must not land behind them
+                raise RuntimeError(f"Lost the message counter lease of course {course_id} while appending")
+
+            for offset, (doc_ref, message_data) in enumerate(chunk):
+                transaction.set(doc_ref, {**message_data, "index": first_index + offset})
+            # Counted in the commit that makes the messages visible, so the count never runs ahead of them
+            data["message_count"] = data.get("message_count", data["next_index"]) + len(chunk)
+            data["updated_at"] = datetime.now(timezone.utc)
+            if last:
+                data.pop("append_lease", None)
+                data.pop("append_lease_until", None)
+            else:
+                data.update(_lease_fields(lease))
+            transaction.set(counter_ref, data)
+
+        await commit_in_transaction(self._client.transaction())
+
+    async def _release_lease(self, course_id: str, lease: str) -> None:
+        counter_ref = self._client.collection(self._counter_collection).document(course_id)
+
+        @firestore.async_transactional
+        async def release_in_transaction(transaction: firestore.AsyncTransaction) -> None:
+            counter = await counter_ref.get(transaction=transaction)
+            data = counter.to_dict() if counter.exists else None
+            if data and data.get("append_lease") == lease:
+                data.pop("append_lease", None)
+                data.pop("append_lease_until", None)
+                transaction.set(counter_ref, data)
+
+        try:
+            await release_in_transaction(self._client.transaction())
+        except Exception as exc:
+            # Other writers still get the counter once the lease expires
+            print(f"Failed to release the message counter lease of course {course_id}: {exc}")
+
+    async def _reserve_in_transaction(
+        self,
+        transaction: firestore.AsyncTransaction,
+        course_id: str,
+        count: int,
+        stored: int,
+        lease: str | None = None,
+    ) -> int:
+        # One document read per allocation, and writers only contend on their own course's counter
+        counter_ref = self._client.collection(self._counter_collection).document(course_id)
+        counter = await counter_ref.get(transaction=transaction)
+        
+        data = counter.to_dict() if counter.exists else None
+        if data and data.get("append_lease") and data.get("append_lease_until", datetime.min.replace(tzinfo=timezone.utc)) > datetime.now(timezone.utc):
+            raise _CounterLeased(course_id)
+        if data and "next_index" in data:
+            next_index = data["next_index"]
+            message_count = data.get("message_count", next_index)
+        else:
+            # Course not backfilled yet: seed the counter from its last message once
+            query = self._client.collection(self._collection)\
+                                .where(filter=FieldFilter("course_id", "==", course_id))\
+                                .order_by("index", direction=firestore.Query.DESCENDING)\
+                                .limit(1)
+            results = [doc async for doc in query.stream(transaction=transaction)]
+            
+            next_index = 0
+            if results:
+                last_msg = results[0].to_dict()
+                if last_msg and "index" in last_msg:
+                    next_index = last_msg["index"] + 1
+            message_count = next_index
+        
+        # ``stored`` of the reserved messages are written by this same transaction; replacing the
+        # document also drops an expired lease
+        counter_data = {
+            "course_id": course_id,
+            "next_index": next_index + count,
+            "message_count": message_count + stored,
+            "updated_at": datetime.now(timezone.utc),
+        }
+        if lease is not None:
+            counter_data.update(_lease_fields(lease))
+        transaction.set(counter_ref, counter_data)
+        return next_index
 
     async def get_all_messages_by_course_id(self, course_id: str) -> list[MessageModel]:
         
-        def _sync_get_all() -> list[MessageModel]:
+        async def _get_all() -> list[MessageModel]:
             messages_ref = self._client.collection(self._collection)
             query = messages_ref.where(filter=FieldFilter("course_id", "==", course_id))\
                                 .order_by("index", direction=firestore.Query.ASCENDING)
             
-            docs = query.stream()
+            docs = [doc async for doc in query.stream()]
             return [MessageModel(**doc.to_dict()) for doc in docs if doc.to_dict()]
 
-        return await asyncio.to_thread(_sync_get_all)
+        return await run_async(self._executor, _get_all)
+
+    async def get_messages_page(
+        self,
+        course_id: str,
+        limit: int | None = None,
+        before_index: int | None = None,
+        after_index: int | None = None,
+    ) -> tuple[list[MessageModel], bool]:
+        """Messages with an index strictly between the cursors, oldest first, and whether more lie beyond the page.
+
+        With ``after_index`` the page is the ``limit`` oldest messages after it;
+        otherwise it is the ``limit`` newest ones (before ``before_index``).
+        """
+
+        async def _get_page() -> tuple[list[MessageModel], bool]:
+            forward = after_index is not None or limit is None
+            direction = firestore.Query.ASCENDING if forward else firestore.Query.DESCENDING
+            query = self._client.collection(self._collection)\
+                                .where(filter=FieldFilter("course_id", "==", course_id))\
+                                .order_by("index", direction=direction)
+            
+            # Cursors on the ordered field, so Firestore skips to them instead of scanning from the start
+            first, last = (after_index, before_index) if forward else (before_index, after_index)
+            if first is not None:
+                query = query.start_after({"index": first})
+            if last is not None:
+                query = query.end_before({"index": last})
+            if limit is not None:
+                # One extra document tells whether there is another page
+                query = query.limit(limit + 1)
+            
+            docs = [doc async for doc in query.stream()]
+            has_more = limit is not None and len(docs) > limit
+            messages = [MessageModel(**doc.to_dict()) for doc in docs[:limit] if doc.to_dict()]
+            if not forward:
+                messages.reverse()
+            return messages, has_more
+
+        return await run_async(self._executor, _get_page)
+
+    async def get_message_count(self, course_id: str) -> int:
+        """Number of stored messages of the course; it changes with every commit that adds messages."""
+
+        async def _get_message_count() -> int:
+            counter = await self._client.collection(self._counter_collection).document(course_id).get()
+            data = counter.to_dict() if counter.exists else None
+            if data and "next_index" in data:
+                return data.get("message_count", data["next_index"])
+            
+            # Course not backfilled yet: its messages are numbered without gaps
+            query = self._client.collection(self._collection)\
+                                .where(filter=FieldFilter("course_id", "==", course_id))\
+                                .order_by("index", direction=firestore.Query.DESCENDING)\
+                                .limit(1)
+            results = [doc async for doc in query.stream()]
+            last_msg = results[0].to_dict() if results else None
+            if last_msg and "index" in last_msg:
+                return last_msg["index"] + 1
+            return 0
+
+        return await run_async(self._executor, _get_message_count)
 
     async def get_message_by_id(self, message_id: str) -> Optional[MessageModel]:
         
-        def _sync_get_by_id() -> Optional[MessageModel]:
+        async def _get_by_id() -> Optional[MessageModel]:
             doc_ref = self._client.collection(self._collection).document(message_id)
-            doc = doc_ref.get()
+            doc = await doc_ref.get()
             
             if doc.exists:
                 return MessageModel(**doc.to_dict())
             return None
 
-        return await asyncio.to_thread(_sync_get_by_id)
+        return await run_async(self._executor, _get_by_id)
+
+
+def _lease_fields(lease: str) -> dict[str, Any]:
+    return {"append_lease": lease, "append_lease_until": datetime.now(timezone.utc) + timedelta(seconds=_APPEND_LEASE_SECONDS)}
+
+
+def _chunk_records(records: list[Any], encoded: list[str], max_writes: int) -> list[list[Any]]:
+    # Encoded JSON length stands in for the stored size, which it roughly tracks
+    chunks: list[list[Any]] = [[]]
+    size = 0
+    for record, payload in zip(records, encoded):
+        if chunks[-1] and (len(chunks[-1]) >= max_writes or size + len(payload) > _MAX_BYTES_PER_COMMIT):
+            chunks.append([])
+            size = 0
+        chunks[-1].append(record)
+        size += len(payload)
+    return chunks
@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import json
+import re
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_left
+from typing import Any, Iterator
+
+try:
+    from re import _constants as _sre_constants, _parser as _sre_parse  # type: ignore[attr-defined]
+except ImportError:  # Python < 3.11
+    import sre_constants as _sre_constants  # type: ignore[no-redef]
+    import sre_parse as _sre_parse  # type: ignore[no-redef]
+
+# Layout: magic, length of the JSON table, the table, then one sorted uint32 array per file
+_MAGIC = b"TRI1"
+_HEADER = struct.Struct("<4sI")
+_BINARY = 1
+
+
+def index_shard(name: str, shards: int) -> int:
+    """Shard of a workspace index that holds ``name``; stable across processes."""
+
+    return zlib.crc32(name.encode("utf-8")) % shards
+
+
+def content_trigrams(content: bytes) -> array:
+    """Sorted distinct byte trigrams of ``content``, each packed into a 24-bit integer."""
+
+    distinct = set(zip(content, content[1:], content[2:]))
+    return array("I", sorted((a << 16) | (b << 8) | c for a, b, c in distinct))
+
+
+def required_trigrams(query: str, is_regex: bool) -> array | None:
+    """Trigrams every matching file must contain, or None when no safe filter exists.
+
+    Substring queries require all trigrams of the query. For regexes, runs of
+    literal characters that every match must contain are extracted from the
+    parsed pattern; alternations, optional repeats and character classes just
+    end a run. Case-insensitive patterns cannot be filtered by exact bytes.
+    """
+
+    if not is_regex:
+        return content_trigrams(query.encode("utf-8"))
+
+    try:
+        compiled = re.compile(query)
+        parsed = _sre_parse.parse(query, compiled.flags)
+    except (re.error, RecursionError):
+        return None
+    if compiled.flags & re.IGNORECASE:
+        return None
+
+    runs: list[str] = []
+    _collect_literal_runs(parsed, runs)
+
+    required: set[int] = set()
+    for run in runs:
+        required.update(content_trigrams(run.encode("utf-8")))
+    return array("I", sorted(required))
+
+
+def _collect_literal_runs(pattern: Any, runs: list[str]) -> None:
+
+    current: list[str] = []
+
+    def _flush() -> None:
+        if current:
+            runs.append("".join(current))
+            current.clear()
+
+    for op, value in pattern:
+        if op is _sre_constants.LITERAL:
+            current.append(chr(value))
+        elif op is _sre_constants.AT:
+            # Zero-width anchors do not break a literal run
+            continue
+        elif op is _sre_constants.SUBPATTERN:
+            _flush()
+            _, add_flags, _, sub_pattern = value
+            if not add_flags & _sre_constants.SRE_FLAG_IGNORECASE:
+                _collect_literal_runs(sub_pattern, runs)
+        elif op in (_sre_constants.MAX_REPEAT, _sre_constants.MIN_REPEAT):
+            minimum, maximum, sub_pattern = value
+            if minimum >= 1 and len(sub_pattern) == 1 and sub_pattern[0][0] is _sre_constants.LITERAL:
+                # "c+" / "c{2,}": the mandatory copies extend the run; an open upper bound
+                # means the run can only continue from the last copy
+                character = chr(sub_pattern[0][1])
+                current.extend(character * minimum)
+                if maximum != minimum:
+                    _flush()
+                    current.append(character)
+                continue
+            _flush()
+            if minimum >= 1:
+                _collect_literal_runs(sub_pattern, runs)
+        else:
+            _flush()
+    _flush()
+
+
+class TrigramIndex:
+    """Map of file -> sorted trigram array, tagged with the indexed generation.
+
+    A workspace's index is stored as shards (see ``index_shard``) so that a
+    write rewrites one shard; a search merges them with ``update``.
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        # name -> [generation, flags, trigrams (array) or raw little-endian bytes until first use]
+        self._files: dict[str, list[Any]] = {}
+
+    @classmethod
+    def from_bytes(cls, root: str, data: bytes) -> TrigramIndex | None:
+
+        if len(data) < _HEADER.size:
+            return None
+        magic, table_length = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            return None
+
+        try:
+            table = json.loads(data[_HEADER.size:_HEADER.size + table_length])
+        except ValueError:
+            return None
+
+        body = memoryview(data)[_HEADER.size + table_length:]
+        index = cls(root)
+        for name, (generation, flags, offset, count) in table.items():
+            index._files[name] = [generation, flags, body[offset * 4:(offset + count) * 4]]
+        return index
+
+    def to_bytes(self) -> bytes:
+
+        table: dict[str, list[int]] = {}
+        chunks: list[bytes] = []
+        offset = 0
+        for name, (generation, flags, _) in self._files.items():
+            trigrams = self._trigrams(name)
+            table[name] = [generation, flags, offset, len(trigrams)]
+            chunks.append(_to_little_endian(trigrams))
+            offset += len(trigrams)
+
+        encoded_table = json.dumps(table, separators=(",", ":")).encode("utf-8")
+        return _HEADER.pack(_MAGIC, len(encoded_table)) + encoded_table + b"".join(chunks)
+
+    def __len__(self) -> int:
+        return len(self._files)
+
+    def update(self, other: TrigramIndex) -> None:
+
+        self._files.update(other._files)
+
+    def names_under(self, prefix: str) -> Iterator[str]:
+
+        return (name for name in self._files if name.startswith(prefix))
+
+    def set_file(self, name: str, generation: int | None, content: bytes) -> None:
+
+        try:
+            content.decode("utf-8")
+        except UnicodeDecodeError:
+            self._files[name] = [generation, _BINARY, array("I")]
+            return
+        self._files[name] = [generation, 0, content_trigrams(content)]
+
+    def copy_file(
+        self,
+        source_index: TrigramIndex,
+        source: str,
+        source_generation: int | None,
+        name: str,
+        generation: int | None,
+    ) -> None:
+        """Index ``name`` as a byte-for-byte copy of ``source`` when ``source_index`` knows that generation of it."""
+
+        entry = source_index._files.get(source)
+        if entry is None or entry[0] != source_generation:
+            # Unknown content stays out of the index
+            self._files.pop(name, None)
+            return
+        self._files[name] = [generation, entry[1], entry[2]]
+
+    def remove(self, name: str) -> None:
+
+        self._files.pop(name, None)
+
+    def may_match(self, name: str, generation: int | None, required: array | None) -> bool | None:
+        """True/False when the index knows this generation of the file, None when it does not."""
+
+        entry = self._files.get(name)
+        if entry is None or entry[0] != generation:
+            return None
+        if entry[1] & _BINARY:
+            # Content search only ever matches text files
+            return False
+        if not required:
+            return True
+
+        trigrams = self._trigrams(name)
+        for trigram in required:
+            position = bisect_left(trigrams, trigram)
+            if position == len(trigrams) or trigrams[position] != trigram:
+                return False
+        return True
+
+    def _trigrams(self, name: str) -> array:
+        entry = self._files[name]
+        if not isinstance(entry[2], array):
+            decoded = array("I")
+            decoded.frombytes(entry[2])
+            if sys.byteorder != "little":
+                decoded.byteswap()
+            entry[2] = decoded
+        return entry[2]
+
+
+def _to_little_endian(values: array) -> bytes:
+    if sys.byteorder == "little":
+        return values.tobytes()
+    swapped = array(values.typecode, values)
+    swapped.byteswap()
+    return swapped.tobytes()
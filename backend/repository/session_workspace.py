@@ -0,0 +1,498 @@
+from __future__ import annotations
+
+import fcntl
+import json
+import os
+import shutil
+import threading
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import BinaryIO, Callable, Iterator
+from urllib.parse import quote
+
+from repository.storage_backend import ObjectNotFound, PreconditionFailed, StorageBackend, StoredObject, UnsupportedQuery
+
+_SESSION_FILE = "session.json"
+_JOURNAL_FILE = "journal.jsonl"
+_LOCK_FILE = "lock"
+_OBJECTS_DIR = "objects"
+
+
+class SessionClosed(Exception):
+    """A change reached a session after it was closed for flushing; it was not applied."""
+
+
+@dataclass
+class _Entry:
+    # meta is None for an object that does not exist (any more); data is None until it is read
+    meta: StoredObject | None
+    base: int
+    data: bytes | None = None
+    dirty: bool = False
+
+
+@dataclass(frozen=True)
+class PendingChange:
+    """A workspace file the session changed: its new bytes (None when deleted) and the
+    generation the change was based on, which the flush is conditioned on."""
+
+    name: str
+    data: bytes | None
+    base: int
+
+
+class SessionWorkspace(StorageBackend):
+    """Write-back working set of one workspace for the duration of an agent turn.
+
+    Objects under ``root`` and under ``local_prefixes`` (the workspace's system
+    objects) are read from ``inner`` once and then served and changed in memory;
+    everything else goes straight through. A single listing of the workspace
+    answers every stat and listing inside it.
+
+    Changes to workspace files are journaled to ``directory`` before the call
+    returns, so a crashed process leaves them behind for ``recover``. The
+    repository flushes ``pending_changes`` with generation preconditions; the
+    system objects written in the session are only valid for the session's own
+    generations and are dropped instead.
+    """
+
+    # Only the calls forwarded to the inner backend are round trips
+    counts_round_trips = True
+
+    def __init__(
+        self,
+        inner: StorageBackend,
+        session_id: str,
+        root: str,
+        local_prefixes: tuple[str, ...],
+        directory: str,
+        lock_fd: int | None,
+        count_round_trips: Callable[[int], None] | None = None,
+    ) -> None:
+        self._inner = inner
+        self.session_id = session_id
+        self.root = root
+        self._local_prefixes = (root, *local_prefixes)
+        self._directory = directory
+        self._lock_fd: int | None = lock_fd
+        self._count_round_trips = count_round_trips
+        self._entries: dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._snapshot_loaded = False
+        # Session generations count down from -1 so they never collide with the inner backend's
+        self._generation = 0
+        self._journal_sequence = 0
+        self._closed = False
+
+    @classmethod
+    def create(
+        cls,
+        inner: StorageBackend,
+        session_id: str,
+        root: str,
+        local_prefixes: tuple[str, ...],
+        spool_dir: str,
+        count_round_trips: Callable[[int], None] | None = None,
+    ) -> SessionWorkspace:
+        """Start a session journaled under ``spool_dir``; raises FileExistsError while a previous
+        session with the same id still has unflushed changes there."""
+
+        # Built under a hidden name and renamed into place, so recovery never sees it half made
+        directory = os.path.join(spool_dir, quote(session_id, safe=""))
+        staging = os.path.join(spool_dir, f".{uuid.uuid4().hex}")
+        os.makedirs(os.path.join(staging, _OBJECTS_DIR))
+        lock_fd = _lock_directory(staging)
+        _write_durably(
+            os.path.join(staging, _SESSION_FILE),
+            json.dumps({"session_id": session_id, "root": root, "local_prefixes": list(local_prefixes)}).encode(),
+        )
+        try:
+            os.rename(staging, directory)
+        except OSError as exc:
+            os.close(lock_fd)
+            shutil.rmtree(staging, ignore_errors=True)
+            raise FileExistsError(directory) from exc
+        return cls(inner, session_id, root, local_prefixes, directory, lock_fd, count_round_trips)
+
+    @classmethod
+    def recover(
+        cls,
+        inner: StorageBackend,
+        directory: str,
+        count_round_trips: Callable[[int], None] | None = None,
+    ) -> SessionWorkspace | None:
+        """Reload the unflushed changes a session left in ``directory``, closed and ready to flush.
+
+        Returns None when the session is still alive in some process, or never got as far as
+        recording what it belongs to.
+        """
+
+        lock_fd = _lock_directory(directory)
+        if lock_fd is None:
+            return None
+        try:
+            with open(os.path.join(directory, _SESSION_FILE), "rb") as handle:
+                described = json.loads(handle.read())
+        except (OSError, ValueError):
+            os.close(lock_fd)
+            shutil.rmtree(directory, ignore_errors=True)
+            return None
+
+        workspace = cls(
+            inner,
+            described["session_id"],
+            described["root"],
+            tuple(described["local_prefixes"]),
+            directory,
+            lock_fd,
+            count_round_trips,
+        )
+        workspace._replay_journal()
+        workspace._closed = True
+        return workspace
+
+    @property
+    def name(self) -> str:
+        return f"{self._inner.name}#session/{self.session_id}"
+
+    def uri(self, name: str) -> str:
+        return self._inner.uri(name)
+
+    def close(self) -> None:
+        """Refuse further changes; writers still in flight get SessionClosed and nothing is applied."""
+
+        with self._lock:
+            self._closed = True
+
+    def pending_changes(self) -> list[PendingChange]:
+        with self._lock:
+            return [
+                PendingChange(name, entry.data if entry.meta is not None else None, entry.base)
+                for name, entry in sorted(self._entries.items())
+                if entry.dirty and name.startswith(self.root)
+            ]
+
+    def mark_settled(self, name: str) -> None:
+        """The change to ``name`` was flushed, or lost to a conflicting write; either way it is done."""
+
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                entry.dirty = False
+            self._append_journal({"name": name, "settled": True})
+
+    def discard(self) -> None:
+        """Forget the journal once every change is settled."""
+
+        shutil.rmtree(self._directory, ignore_errors=True)
+        self.release()
+
+    def release(self) -> None:
+        """Let another session or a later recovery take over the journal as it is."""
+
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    def stat(self, name: str) -> StoredObject:
+        if not self._holds(name):
+            self._count()
+            return self._inner.stat(name)
+
+        meta = self._entry(name).meta
+        if meta is None:
+            raise ObjectNotFound(name)
+        return meta
+
+    def read(
+        self,
+        name: str,
+        start: int | None = None,
+        end: int | None = None,
+        if_generation_match: int | None = None,
+    ) -> tuple[bytes, StoredObject]:
+        if not self._holds(name):
+            self._count()
+            return self._inner.read(name, start, end, if_generation_match)
+
+        data, meta = self._content(name)
+        if if_generation_match is not None and if_generation_match != meta.generation:
+            raise PreconditionFailed(name)
+        if start is None and end is None:
+            return data, meta
+        return data[start or 0:None if end is None else end + 1], meta
+
+    def write(self, name: str, data: bytes, content_type: str, if_generation_match: int | None = None) -> StoredObject:
+        if not self._holds(name):
+            self._count()
+            return self._inner.write(name, data, content_type, if_generation_match)
+        return self._change(name, data, if_generation_match)
+
+    def write_file(self, name: str, file_obj: BinaryIO, content_type: str) -> StoredObject:
+        if not self._holds(name):
+            self._count()
+            return self._inner.write_file(name, file_obj, content_type)
+        return self._change(name, file_obj.read(), None)
+
+    def compose(self, name: str, sources: list[str], if_generation_match: int | None = None) -> StoredObject:
+        if not self._holds(name) and not any(self._holds(source) for source in sources):
+            self._count()
+            return self._inner.compose(name, sources, if_generation_match)
+        data = b"".join(self.read(source)[0] for source in sources)
+        if not self._holds(name):
+            self._count()
+            return self._inner.write(name, data, "application/octet-stream", if_generation_match)
+        return self._change(name, data, if_generation_match)
+
+    def copy(self, source: StoredObject, name: str, if_generation_match: int | None = None) -> StoredObject:
+        if not self._holds(name) and not self._holds(source.name):
+            self._count()
+            return self._inner.copy(source, name, if_generation_match)
+        data, _ = self.read(source.name, if_generation_match=source.generation)
+        if not self._holds(name):
+            self._count()
+            return self._inner.write(name, data, "application/octet-stream", if_generation_match)
+        return self._change(name, data, if_generation_match)
+
+    def delete(self, name: str, if_generation_match: int | None = None) -> None:
+        if not self._holds(name):
+            self._count()
+            self._inner.delete(name, if_generation_match)
+            return
+        self._change(name, None, if_generation_match)
+
+    def delete_many(self, names: list[str]) -> None:
+        forwarded = [name for name in names if not self._holds(name)]
+        if forwarded:
+            self._count(len(forwarded))
+            self._inner.delete_many(forwarded)
+        for name in names:
+            if self._holds(name):
+                try:
+                    self._change(name, None, None)
+                except ObjectNotFound:
+                    pass
+
+    def list_pages(
+        self,
+        prefix: str,
+        delimiter: str | None = None,
+        match_glob: str | None = None,
+    ) -> Iterator[tuple[list[StoredObject], list[str]]]:
+        if match_glob is not None:
+            # The in-memory listing is cheap to filter client-side
+            raise UnsupportedQuery(match_glob)
+
+        if prefix.startswith(self.root) or self.root.startswith(prefix):
+            self._load_snapshot()
+
+        objects: dict[str, StoredObject] = {}
+        if not prefix.startswith(self.root):
+            for page, _ in self._forwarded_pages(prefix):
+                objects.update((blob.name, blob) for blob in page if not blob.name.startswith(self.root))
+
+        with self._lock:
+            for name, entry in self._entries.items():
+                if not name.startswith(prefix):
+                    continue
+                if entry.meta is None:
+                    objects.pop(name, None)
+                else:
+                    objects[name] = entry.meta
+
+        listed: list[StoredObject] = []
+        prefixes: set[str] = set()
+        for name in sorted(objects):
+            cut = name.find(delimiter, len(prefix)) if delimiter else -1
+            if cut == -1:
+                listed.append(objects[name])
+            else:
+                prefixes.add(name[:cut + len(delimiter or "")])
+        yield listed, sorted(prefixes)
+
+    def contains(self, name: str, needle: bytes, generation: int | None) -> bool | None:
+        if not self._holds(name):
+            return self._inner.contains(name, needle, generation)
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None or entry.data is None or entry.meta is None or entry.meta.generation != generation:
+                return None
+            return needle in entry.data
+
+    def _holds(self, name: str) -> bool:
+        return name.startswith(self._local_prefixes)
+
+    def _count(self, count: int = 1) -> None:
+        if self._count_round_trips is not None:
+            self._count_round_trips(count)
+
+    def _forwarded_pages(self, prefix: str) -> Iterator[tuple[list[StoredObject], list[str]]]:
+        for page in self._inner.list_pages(prefix):
+            self._count()
+            yield page
+
+    def _load_snapshot(self) -> None:
+        # One listing of the workspace, after which a name missing from the entries does not exist
+        with self._snapshot_lock:
+            if self._snapshot_loaded:
+                return
+            for page, _ in self._forwarded_pages(self.root):
+                with self._lock:
+                    for blob in page:
+                        self._entries.setdefault(blob.name, _Entry(meta=blob, base=blob.generation or 0))
+            self._snapshot_loaded = True
+
+    def _entry(self, name: str) -> _Entry:
+        with self._lock:
+            entry = self._entries.get(name)
+        if entry is not None:
+            return entry
+
+        if name.startswith(self.root):
+            self._load_snapshot()
+            meta = None
+        else:
+            try:
+                self._count()
+                meta = self._inner.stat(name)
+            except ObjectNotFound:
+                meta = None
+        with self._lock:
+            return self._entries.setdefault(name, _Entry(meta=meta, base=(meta.generation or 0) if meta else 0))
+
+    def _content(self, name: str) -> tuple[bytes, StoredObject]:
+        entry = self._entry(name)
+        with self._lock:
+            if entry.meta is None:
+                raise ObjectNotFound(name)
+            if entry.data is not None:
+                return entry.data, entry.meta
+
+        try:
+            self._count()
+            data, meta = self._inner.read(name)
+        except ObjectNotFound:
+            data, meta = None, None
+        with self._lock:
+            if entry.dirty:
+                # Written by the session while the read was in flight
+                data, meta = entry.data, entry.meta
+            else:
+                # The listing may be older than the bytes: the download is what the session builds on
+                entry.meta, entry.data = meta, data
+                entry.base = (meta.generation or 0) if meta is not None else 0
+            if meta is None or data is None:
+                raise ObjectNotFound(name)
+            return data, meta
+
+    def _change(self, name: str, data: bytes | None, if_generation_match: int | None) -> StoredObject:
+        entry = self._entry(name)
+        with self._lock:
+            if self._closed:
+                raise SessionClosed(f"Session {self.session_id} is closed")
+            current = entry.meta.generation if entry.meta is not None else 0
+            if if_generation_match is not None and if_generation_match != current:
+                raise PreconditionFailed(name)
+            if data is None and entry.meta is None:
+                raise ObjectNotFound(name)
+
+            if name.startswith(self.root):
+                self._journal_change(name, data, entry.base)
+
+            if data is None:
+                entry.meta, entry.data = None, None
+                meta = StoredObject(name=name)
+            else:
+                self._generation -= 1
+                meta = StoredObject(name=name, size=len(data), generation=self._generation, updated=datetime.now(timezone.utc))
+                entry.meta, entry.data = meta, data
+            entry.dirty = True
+            return meta
+
+    def _journal_change(self, name: str, data: bytes | None, base: int) -> None:
+        # The bytes are durable before the journal line that refers to them
+        record: dict[str, object] = {"name": name, "base": base}
+        if data is None:
+            record["deleted"] = True
+        else:
+            self._journal_sequence += 1
+            object_file = f"{self._journal_sequence}.bin"
+            _write_durably(os.path.join(self._directory, _OBJECTS_DIR, object_file), data)
+            record["file"] = object_file
+        self._append_journal(record)
+
+    def _append_journal(self, record: dict[str, object]) -> None:
+        with open(os.path.join(self._directory, _JOURNAL_FILE), "ab") as journal:
+            journal.write(json.dumps(record).encode() + b"\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def _replay_journal(self) -> None:
+        try:
+            with open(os.path.join(self._directory, _JOURNAL_FILE), "rb") as journal:
+                lines = journal.read().splitlines()
+        except FileNotFoundError:
+            return
+
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Torn last line of a crash mid-append: its change was never acknowledged
+                break
+            name = record["name"]
+            if record.get("settled"):
+                self._entries.pop(name, None)
+                continue
+
+            entry = self._entries.get(name)
+            base = entry.base if entry is not None else record["base"]
+            if record.get("deleted"):
+                self._entries[name] = _Entry(meta=None, base=base, dirty=True)
+                continue
+            with open(os.path.join(self._directory, _OBJECTS_DIR, record["file"]), "rb") as handle:
+                data = handle.read()
+            self._generation -= 1
+            meta = StoredObject(name=name, size=len(data), generation=self._generation)
+            self._entries[name] = _Entry(meta=meta, base=base, data=data, dirty=True)
+            self._journal_sequence = max(self._journal_sequence, int(record["file"].split(".")[0]))
+
+
+def spooled_session_directories(spool_dir: str) -> list[str]:
+    """Journals left in ``spool_dir``, by live sessions or by crashed ones."""
+
+    try:
+        names = sorted(os.listdir(spool_dir))
+    except FileNotFoundError:
+        return []
+    return [
+        os.path.join(spool_dir, name)
+        for name in names
+        if not name.startswith(".") and os.path.isdir(os.path.join(spool_dir, name))
+    ]
+
+
+def _lock_directory(directory: str) -> int | None:
+    # Held for the session's lifetime; the kernel drops it if the process dies
+    try:
+        fd = os.open(os.path.join(directory, _LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+    except FileNotFoundError:
+        # Flushed and removed by its owner meanwhile
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _write_durably(path: str, data: bytes) -> None:
+    temporary = f"{path}.tmp"
+    with open(temporary, "wb") as handle:
+        handle.write(data)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temporary, path)
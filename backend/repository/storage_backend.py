@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+from typing import AsyncIterator, BinaryIO, Iterator
+
+
+class ObjectNotFound(Exception):
+    """The object does not exist (or no longer has the requested generation)."""
+
+
+class PreconditionFailed(Exception):
+    """The object's live generation is not the one the request was conditioned on."""
+
+
+class UnsupportedQuery(Exception):
+    """The backend cannot evaluate a listing filter; the caller filters client-side instead."""
+
+
+@dataclass(frozen=True)
+class StoredObject:
+    """Metadata of one object, as returned by every backend call that touches it.
+
+    ``generation`` changes with every write of the object and is what reads,
+    writes and deletes can be conditioned on. Names ending with '/' are folder
+    markers.
+    """
+
+    name: str
+    size: int | None = None
+    generation: int | None = None
+    updated: datetime | None = None
+    component_count: int | None = None
+
+
+class StorageBackend(ABC):
+    """Flat object namespace the storage repository is built on.
+
+    Names are '/'-separated paths without a leading slash. Every mutating call
+    accepts ``if_generation_match``: the call only happens when the live object
+    has that generation, 0 meaning "does not exist yet", and raises
+    PreconditionFailed otherwise. Missing objects raise ObjectNotFound.
+    """
+
+    # Whether the backend reports its own round trips; otherwise every call counts as one
+    counts_round_trips = False
+    # The same objects over a non-blocking data path, when the backend has one
+    async_backend: AsyncStorageBackend | None = None
+
+    @property
+    @abstractmethod
+    def name(self) -> str:
+        """Identifies the namespace, e.g. in cache keys; stable for the backend's lifetime."""
+
+    @abstractmethod
+    def uri(self, name: str) -> str:
+        """Location of an object for callers outside the service (e.g. ``gs://bucket/name``)."""
+
+    @abstractmethod
+    def stat(self, name: str) -> StoredObject:
+        ...
+
+    @abstractmethod
+    def read(
+        self,
+        name: str,
+        start: int | None = None,
+        end: int | None = None,
+        if_generation_match: int | None = None,
+    ) -> tuple[bytes, StoredObject]:
+        """Bytes ``start`` to ``end`` (inclusive) of the object, or all of them."""
+
+    @abstractmethod
+    def write(self, name: str, data: bytes, content_type: str, if_generation_match: int | None = None) -> StoredObject:
+        ...
+
+    @abstractmethod
+    def write_file(self, name: str, file_obj: BinaryIO, content_type: str) -> StoredObject:
+        ...
+
+    @abstractmethod
+    def compose(self, name: str, sources: list[str], if_generation_match: int | None = None) -> StoredObject:
+        """Concatenate ``sources`` into ``name`` without their bytes leaving the backend."""
+
+    @abstractmethod
+    def copy(self, source: StoredObject, name: str, if_generation_match: int | None = None) -> StoredObject:
+        """Copy ``source`` to ``name`` inside the backend, pinned to ``source.generation`` when known."""
+
+    @abstractmethod
+    def delete(self, name: str, if_generation_match: int | None = None) -> None:
+        ...
+
+    @abstractmethod
+    def delete_many(self, names: list[str]) -> None:
+        """Delete every object in ``names``; missing ones are skipped."""
+
+    @abstractmethod
+    def list_pages(
+        self,
+        prefix: str,
+        delimiter: str | None = None,
+        match_glob: str | None = None,
+    ) -> Iterator[tuple[list[StoredObject], list[str]]]:
+        """Objects under ``prefix`` in name order, one ``(objects, prefixes)`` pair per page.
+
+        With a delimiter, names continuing past it are rolled up into the
+        ``prefixes`` of the page they were found on instead. ``match_glob``
+        takes GCS glob syntax and may raise UnsupportedQuery.
+        """
+
+    def contains(self, name: str, needle: bytes, generation: int | None) -> bool | None:
+        """Whether that generation of the object contains ``needle``, when the backend can tell cheaply.
+
+        None means "unknown": the caller has to read the object itself.
+        """
+
+        return None
+
+
+class AsyncStorageBackend(ABC):
+    """Non-blocking variant of the hottest StorageBackend calls: same names, errors and preconditions.
+
+    Lets the repository serve plain reads, writes, listings and deletes on the
+    event loop instead of holding a worker thread for every call in flight.
+    """
+
+    @abstractmethod
+    async def stat(self, name: str) -> StoredObject:
+        ...
+
+    @abstractmethod
+    async def read(
+        self,
+        name: str,
+        start: int | None = None,
+        end: int | None = None,
+        if_generation_match: int | None = None,
+    ) -> tuple[bytes, StoredObject]:
+        ...
+
+    @abstractmethod
+    async def write(self, name: str, data: bytes, content_type: str, if_generation_match: int | None = None) -> StoredObject:
+        ...
+
+    @abstractmethod
+    async def delete(self, name: str, if_generation_match: int | None = None) -> None:
+        ...
+
+    @abstractmethod
+    def list_pages(
+        self,
+        prefix: str,
+        delimiter: str | None = None,
+        match_glob: str | None = None,
+    ) -> AsyncIterator[tuple[list[StoredObject], list[str]]]:
+        ...
@@ -1,336 +1,1475 @@
 from __future__ import annotations
 
 import asyncio
-from typing import Any, BinaryIO
+from collections import deque
+from typing import Any, AsyncIterator, BinaryIO, Callable, Generator, Iterable, Iterator, TypeVar
 
-from google.cloud import storage
 import fnmatch
+import itertools
+import posixpath
 import re
+import uuid
+
+from core.blob_cache import BlobContentCache
+from core.executors import InstrumentedExecutor, resume_blocking, run_blocking
+from core.scan_pool import BlobScanPool
+from core.storage_metrics import StorageRoundTripCounter, metered_operation, operation_context
+from repository.search_index import TrigramIndex, index_shard, required_trigrams
+from repository.session_workspace import PendingChange, SessionWorkspace
+from repository.storage_backend import ObjectNotFound, PreconditionFailed, StorageBackend, StoredObject, UnsupportedQuery
+from repository.workspace_manifest import WorkspaceManifest, workspace_root
+from utils.glob_pattern import CompiledGlob, compile_glob, narrow_listing_prefix
+from utils.line_index import build_line_index, decode_line_index, encode_line_index, line_window_to_byte_range
+
+# Objects the service keeps for itself (indexes, manifests); never shown to the agent
+SYSTEM_PREFIX = ".system/"
+LINE_INDEX_PREFIX = f"{SYSTEM_PREFIX}line-index/"
+MANIFEST_PREFIX = f"{SYSTEM_PREFIX}manifest/"
+SEARCH_INDEX_PREFIX = f"{SYSTEM_PREFIX}search-index/"
+APPEND_STAGING_PREFIX = f"{SYSTEM_PREFIX}append/"
+
+_RANGE_READ_ATTEMPTS = 3
+_SYSTEM_OBJECT_UPDATE_ATTEMPTS = 5
+_FILE_UPDATE_ATTEMPTS = 3
+# GCS refuses to compose an object past 1024 components; flatten appended files well before that
+_APPEND_COMPACT_COMPONENTS = 512
+# A write rewrites the one shard of the search index holding its file, about 1/64 of the index
+SEARCH_INDEX_SHARDS = 64
+# Per-file updates of the workspace manifest spread over this many objects
+MANIFEST_SHARDS = 16
+
+_T = TypeVar("_T")
+# A backend request a bookkeeping protocol hands to its driver: the helper ("stat", "download",
+# "upload" or "delete") and its arguments. See StorageRepository._drive.
+_Call = tuple[str, tuple[Any, ...], dict[str, Any]]
+_Steps = Generator[_Call, Any, _T]
 
 class StorageRepository:
 
     def __init__(
         self,
-        client: storage.Client,
-        bucket_name: str,
+        backend: StorageBackend,
+        cache: BlobContentCache | None = None,
+        line_index_min_bytes: int = 256 * 1024,
+        metrics: StorageRoundTripCounter | None = None,
+        search_index_max_file_bytes: int = 16 * 1024 * 1024,
+        scan_pool: BlobScanPool | None = None,
+        scan_concurrency: int = 8,
+        executor: InstrumentedExecutor | None = None,
+    ) -> None:
+        self._backend = backend
+        # Cache entries are keyed by the backend's name, so backends can share one cache
+        self._namespace = backend.name
+        self._cache = cache
+        self._line_index_min_bytes = line_index_min_bytes
+        self._metrics = metrics
+        self._search_index_max_file_bytes = search_index_max_file_bytes
+        self._scan_pool = scan_pool
+        self._scan_concurrency = scan_concurrency
+        self._aio = backend.async_backend
+        # Blocking backend calls run here (or on the default pool without one)
+        self._executor = executor
+
+    # Every backend request goes through one of the helpers below so it is counted exactly once
+
+    def _count_round_trips(self, count: int = 1) -> None:
+        if self._metrics is not None and not self._backend.counts_round_trips:
+            self._metrics.record(count)
+
+    def _stat(self, path: str) -> StoredObject:
+        self._count_round_trips()
+        return self._backend.stat(path)
+
+    def _download(self, path: str, **kwargs: Any) -> tuple[bytes, StoredObject]:
+        self._count_round_trips()
+        return self._backend.read(path, **kwargs)
+
+    def _upload(self, path: str, data: bytes, content_type: str, **kwargs: Any) -> StoredObject:
+        self._count_round_trips()
+        return self._backend.write(path, data, content_type, **kwargs)
+
+    def _compose(self, path: str, sources: list[str], **kwargs: Any) -> StoredObject:
+        self._count_round_trips()
+        return self._backend.compose(path, sources, **kwargs)
+
+    def _copy_object(self, source: StoredObject, path: str, **kwargs: Any) -> StoredObject:
+        self._count_round_trips()
+        return self._backend.copy(source, path, **kwargs)
+
+    def _delete(self, path: str, **kwargs: Any) -> None:
+        self._count_round_trips()
+        self._backend.delete(path, **kwargs)
+
+    def _list_pages(self, prefix: str, delimiter: str | None = None, **kwargs: Any) -> Iterator[tuple[list[StoredObject], list[str]]]:
+        for page in self._backend.list_pages(prefix, delimiter, **kwargs):
+            self._count_round_trips()
+            yield page
+
+    def _list(self, prefix: str, delimiter: str | None = None, **kwargs: Any) -> tuple[list[StoredObject], set[str]]:
+        blobs: list[StoredObject] = []
+        prefixes: set[str] = set()
+        for page_blobs, page_prefixes in self._list_pages(prefix, delimiter, **kwargs):
+            blobs.extend(page_blobs)
+            prefixes.update(page_prefixes)
+        return blobs, prefixes
+
+    def _delete_many(self, paths: list[str]) -> None:
+        # One request per object; missing objects are already gone
+        self._count_round_trips(len(paths))
+        self._backend.delete_many(paths)
+
+    def _drive(self, steps: _Steps[_T]) -> _T:
+        # The cache and system-object protocols are written once, as generators yielding backend
+        # requests; this runs them on the blocking helpers and _adrive on the async ones
+        result: Any = None
+        error: Exception | None = None
+        while True:
+            try:
+                method, args, kwargs = steps.throw(error) if error is not None else steps.send(result)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                result, error = getattr(self, f"_{method}")(*args, **kwargs), None
+            except Exception as exc:
+                result, error = None, exc
+
+    def _read_blob_bytes(self, path: str, blob: StoredObject | None = None) -> bytes:
+        return self._read_blob(path, blob)[0]
+
+    def _read_blob(self, path: str, blob: StoredObject | None = None) -> tuple[bytes, int | None]:
+        return self._drive(self._read_blob_steps(path, blob))
+
+    def _read_blob_steps(self, path: str, blob: StoredObject | None = None) -> _Steps[tuple[bytes, int | None]]:
+        # Serve from the content cache when possible; raises FileNotFoundError when the blob is missing.
+        # A caller that already has the metadata in ``blob`` saves the metadata round trip.
+        if self._cache is not None:
+            cached = self._cache.get(self._namespace, path)
+            if cached is not None:
+                return cached
+
+            if self._cache.get_generation(self._namespace, path) is not None:
+                # Stale entry: a metadata-only request tells us whether the bytes are still current
+                if blob is None:
+                    try:
+                        blob = yield _call("stat", path)
+                    except ObjectNotFound as exc:
+                        self._cache.invalidate(self._namespace, path)
+                        raise FileNotFoundError(f"File not found: {path}") from exc
+                revalidated = self._cache.revalidate(self._namespace, path, blob.generation)
+                if revalidated is not None:
+                    return revalidated, blob.generation
+
+            self._cache.record_miss()
+
+        # Optimistic download: a missing blob costs the same single request as exists() would
+        try:
+            content, downloaded = yield _call("download", path)
+        except ObjectNotFound as exc:
+            raise FileNotFoundError(f"File not found: {path}") from exc
+
+        if self._cache is not None:
+            self._cache.put(self._namespace, path, downloaded.generation, content)
+
+        return content, downloaded.generation
+
+    def _invalidate_cached(self, path: str) -> None:
+        if self._cache is not None:
+            self._cache.invalidate(self._namespace, path)
+
+    def _read_blob_range(self, path: str, offset: int, length: int | None) -> tuple[bytes, int]:
+        if self._cache is not None:
+            cached = self._cache.get(self._namespace, path)
+            if cached is not None:
+                content = cached[0]
+                end = None if length is None else offset + length
+                return content[offset:end], len(content)
+
+        for _ in range(_RANGE_READ_ATTEMPTS):
+            try:
+                blob = self._stat(path)
+            except ObjectNotFound as exc:
+                self._invalidate_cached(path)
+                raise FileNotFoundError(f"File not found: {path}") from exc
+
+            size = blob.size or 0
+            last = size - 1 if length is None else min(size, offset + length) - 1
+            if offset >= size or last < offset:
+                return b"", size
+
+            try:
+                content, _ = self._download(path, start=offset, end=last, if_generation_match=blob.generation)
+            except PreconditionFailed:
+                # Rewritten since the metadata read: retry against whatever is current now
+                continue
+            except ObjectNotFound as exc:
+                raise FileNotFoundError(f"File not found: {path}") from exc
+            return content, size
+
+        raise RuntimeError(f"File kept changing while reading a range of {path}")
+
+    def _read_line_window(self, path: str, start_line: int | None, end_line: int | None) -> str | None:
+        # Serve a line window of a large text file with a ranged download guided by its line index.
+        # Returns None when the plain full read is the cheaper option (small or already cached file).
+        if self._cache is not None and self._cache.get(self._namespace, path) is not None:
+            return None
+
+        try:
+            blob = self._stat(path)
+        except ObjectNotFound as exc:
+            self._invalidate_cached(path)
+            raise FileNotFoundError(f"File not found: {path}") from exc
+
+        size = blob.size or 0
+        if size < self._line_index_min_bytes or not _indexable_generation(blob.generation):
+            # Session workspaces hold the bytes in memory, so the full read costs no round trip
+            return None
+
+        offsets = self._load_line_index(path, blob.generation)
+        if offsets is not None:
+            begin, finish = line_window_to_byte_range(offsets, size, start_line, end_line)
+            if finish <= begin:
+                return ""
+            try:
+                window, _ = self._download(path, start=begin, end=finish - 1, if_generation_match=blob.generation)
+            except PreconditionFailed:
+                # Rewritten between the metadata read and the download; fall back to a fresh full read
+                return None
+            try:
+                return window.decode('utf-8')
+            except UnicodeDecodeError:
+                return "[Binary content]"
+
+        # Missing or stale index: pay for one full download and leave an index behind for next time
+        content_bytes, generation = self._read_blob(path, blob)
+        self._write_line_index(path, content_bytes, generation)
+        return _decode_line_window(content_bytes, start_line, end_line)
+
+    def _load_line_index(self, path: str, generation: int | None) -> Any:
+        if not _indexable_generation(generation):
+            return None
+        try:
+            data = self._read_blob_bytes(_line_index_path(path))
+        except FileNotFoundError:
+            return None
+
+        decoded = decode_line_index(data)
+        if decoded is None or decoded[0] != generation:
+            return None
+        return decoded[1]
+
+    def _write_line_index(self, path: str, content: bytes, generation: int | None) -> None:
+        self._drive(self._write_line_index_steps(path, content, generation))
+
+    def _write_line_index_steps(self, path: str, content: bytes, generation: int | None) -> _Steps[None]:
+        # Only text files big enough to benefit get an index; stale sidecars are ignored by generation
+        if not _indexable_generation(generation) or len(content) < self._line_index_min_bytes:
+            return
+        try:
+            content.decode('utf-8')
+        except UnicodeDecodeError:
+            return
+
+        payload = encode_line_index(build_line_index(content), generation)
+        yield from self._save_system_object_steps(_line_index_path(path), payload, 'application/octet-stream', None)
+
+    def _delete_line_index_prefix(self, prefix: str) -> None:
+        self._delete_system_objects(_line_index_path(prefix))
+
+    def _delete_line_index(self, path: str) -> None:
+        self._drive(self._delete_line_index_steps(path))
+
+    def _delete_line_index_steps(self, path: str) -> _Steps[None]:
+        index_path = _line_index_path(path)
+        self._invalidate_cached(index_path)
+        try:
+            yield _call("delete", index_path)
+        except ObjectNotFound:
+            pass
+
+    def _load_system_object(self, object_path: str, parse: Callable[[bytes], _T | None]) -> tuple[_T, int | None] | None:
+        return self._drive(self._load_system_object_steps(object_path, parse))
+
+    def _load_system_object_steps(self, object_path: str, parse: Callable[[bytes], _T | None]) -> _Steps[tuple[_T, int | None] | None]:
+        try:
+            data, generation = yield from self._read_blob_steps(object_path)
+        except FileNotFoundError:
+            return None
+
+        parsed = parse(data)
+        if parsed is None:
+            return None
+        return parsed, generation
+
+    def _save_system_object(self, object_path: str, payload: bytes, content_type: str, if_generation_match: int | None) -> StoredObject:
+        return self._drive(self._save_system_object_steps(object_path, payload, content_type, if_generation_match))
+
+    def _save_system_object_steps(
+        self, object_path: str, payload: bytes, content_type: str, if_generation_match: int | None
+    ) -> _Steps[StoredObject]:
+        blob = yield _call("upload", object_path, payload, content_type, if_generation_match=if_generation_match)
+        if self._cache is not None:
+            self._cache.put(self._namespace, object_path, blob.generation, payload)
+        return blob
+
+    def _update_system_object_steps(
+        self,
+        object_path: str,
+        parse: Callable[[bytes], _T | None],
+        mutate: Callable[[_T], None],
+        serialize: Callable[[_T], bytes],
+        content_type: str,
+    ) -> _Steps[bool]:
+        # Optimistic read-modify-write of a per-workspace object guarded by its generation.
+        # Returns False when the object does not exist (yet), in which case nothing is written.
+        for attempt in range(_SYSTEM_OBJECT_UPDATE_ATTEMPTS):
+            loaded = None
+            if attempt == 0 and self._cache is not None:
+                # The conditional save checks the cached generation anyway, so a stale copy costs one
+                # failed attempt instead of a metadata request on every update
+                cached = self._cache.peek(self._namespace, object_path)
+                if cached is not None:
+                    value = parse(cached[0])
+                    loaded = (value, cached[1]) if value is not None else None
+            if loaded is None:
+                loaded = yield from self._load_system_object_steps(object_path, parse)
+            if loaded is None:
+                # Not built yet: it is built from a full scan the next time it is needed
+                return False
+            value, generation = loaded
+            mutate(value)
+            try:
+                yield from self._save_system_object_steps(object_path, serialize(value), content_type, if_generation_match=generation)
+                return True
+            except PreconditionFailed:
+                # Someone else updated it (or our cached copy was stale); retry on fresh bytes
+                self._invalidate_cached(object_path)
+
+        # Persistently contended: drop it so the next reader rebuilds it from scratch
+        self._invalidate_cached(object_path)
+        try:
+            yield _call("delete", object_path)
+        except ObjectNotFound:
+            pass
+        return True
+
+    def _delete_system_objects(self, object_prefix: str) -> None:
+        if self._cache is not None:
+            self._cache.invalidate_prefix(self._namespace, object_prefix)
+        blobs, _ = self._list(object_prefix)
+        if blobs:
+            self._delete_many([blob.name for blob in blobs])
+
+    def _load_manifest(self, root: str) -> WorkspaceManifest | None:
+        return self._drive(self._load_manifest_steps(root))
+
+    def _load_manifest_steps(self, root: str) -> _Steps[WorkspaceManifest | None]:
+        # One listing of the shards gives their current generations, so only shards changed since
+        # they were cached are downloaded. A missing shard means the manifest has to be rebuilt.
+        blobs, _ = yield _call("list", _manifest_prefix(root))
+        if {blob.name for blob in blobs} != set(_manifest_shard_paths(root)):
+            return None
+
+        manifest = WorkspaceManifest(root)
+        for blob in blobs:
+            try:
+                data, _ = yield from self._read_blob_steps(blob.name, blob)
+            except FileNotFoundError:
+                return None
+            shard = WorkspaceManifest.from_bytes(root, data)
+            if shard is None:
+                return None
+            manifest.entries.update(shard.entries)
+        return manifest
+
+    def _rescan_manifest(self, root: str) -> WorkspaceManifest:
+        # Rebuild every shard from a full listing. The precondition on each shard's previous generation
+        # makes a concurrent incremental update win instead of being silently overwritten.
+        manifest = WorkspaceManifest(root)
+        for _ in range(_SYSTEM_OBJECT_UPDATE_ATTEMPTS):
+            shard_blobs, _ = self._list(_manifest_prefix(root))
+            generations = {blob.name: blob.generation for blob in shard_blobs}
+            blobs, _ = self._list(root)
+            manifest = WorkspaceManifest.from_blobs(root, blobs)
+            if not self._save_manifest_shards(root, manifest, generations):
+                continue
+
+            # Writers that found a shard missing while we listed skipped their update. Anything written
+            # before the saves shows up in a listing taken after them; later writers update the saved shards.
+            blobs, _ = self._list(root)
+            if WorkspaceManifest.from_blobs(root, blobs).entries == manifest.entries:
+                return manifest
+
+        # Still accurate for this caller; the next read retries persisting it
+        return manifest
+
+    def _save_manifest_shards(self, root: str, manifest: WorkspaceManifest, generations: dict[str, int | None]) -> bool:
+        # Every shard is written, empty ones included, so a missing shard always means "rebuild".
+        # Returns False when a concurrent update got to one of them first.
+        shards = {shard_path: WorkspaceManifest(root) for shard_path in _manifest_shard_paths(root)}
+        for name, entry in manifest.entries.items():
+            shards[_manifest_shard_path(root, name)].entries[name] = entry
+
+        def _save(shard_path: str) -> bool:
+            payload = shards[shard_path].to_bytes()
+            try:
+                self._save_system_object(shard_path, payload, 'application/json', if_generation_match=generations.get(shard_path, 0))
+            except PreconditionFailed:
+                self._invalidate_cached(shard_path)
+                return False
+            return True
+
+        return all(list(self._scan_blobs(_save, list(shards))))
+
+    def _workspace_manifest(self, root: str) -> WorkspaceManifest:
+        manifest = self._load_manifest(root)
+        if manifest is not None:
+            return manifest
+        return self._rescan_manifest(root)
+
+    def _update_manifest(self, root: str, names: Iterable[str], mutate: Callable[[WorkspaceManifest, str], None]) -> None:
+        self._drive(self._update_manifest_steps(root, names, mutate))
+
+    def _update_manifest_steps(
+        self, root: str, names: Iterable[str], mutate: Callable[[WorkspaceManifest, str], None]
+    ) -> _Steps[None]:
+        # Applies ``mutate(shard, name)`` for each name, rewriting only the shards those names live in.
+        # A missing shard is left alone: the manifest is rebuilt from a listing when it is next read.
+        by_shard: dict[str, list[str]] = {}
+        for name in names:
+            by_shard.setdefault(_manifest_shard_path(root, name), []).append(name)
+
+        for shard_path, shard_names in by_shard.items():
+            def _apply(manifest: WorkspaceManifest, shard_names: list[str] = shard_names) -> None:
+                for name in shard_names:
+                    mutate(manifest, name)
+
+            yield from self._update_system_object_steps(
+                shard_path,
+                lambda data: WorkspaceManifest.from_bytes(root, data),
+                _apply,
+                lambda manifest: manifest.to_bytes(),
+                'application/json',
+            )
+
+    def _load_search_index_shards(self, root: str, names: Iterable[str] | None = None) -> dict[str, TrigramIndex]:
+        # The shards holding ``names``, or all of them after one listing; unchanged shards come
+        # from the cache by generation. Missing shards are simply absent from the result.
+        if names is None:
+            blobs, _ = self._list(_search_index_prefix(root))
+            candidates = [(blob.name, blob) for blob in blobs]
+        else:
+            candidates = [(shard_path, None) for shard_path in sorted({_search_index_shard_path(root, name) for name in names})]
+
+        def _load(candidate: tuple[str, StoredObject | None]) -> tuple[str, TrigramIndex | None]:
+            shard_path, blob = candidate
+            try:
+                data, _ = self._read_blob(shard_path, blob)
+            except FileNotFoundError:
+                return shard_path, None
+            return shard_path, TrigramIndex.from_bytes(root, data)
+
+        return {shard_path: shard for shard_path, shard in self._scan_blobs(_load, candidates) if shard is not None}
+
+    def _load_search_index(self, root: str, names: Iterable[str] | None = None) -> TrigramIndex | None:
+        shards = self._load_search_index_shards(root, names)
+        if not shards:
+            return None
+        index = TrigramIndex(root)
+        for shard in shards.values():
+            index.update(shard)
+        return index
+
+    def _update_search_index(
+        self,
+        root: str,
+        names: Iterable[str],
+        mutate: Callable[[TrigramIndex, str], None],
+        create: bool = False,
+    ) -> None:
+        self._drive(self._update_search_index_steps(root, names, mutate, create))
+
+    def _update_search_index_steps(
+        self,
+        root: str,
+        names: Iterable[str],
+        mutate: Callable[[TrigramIndex, str], None],
+        create: bool = False,
+    ) -> _Steps[None]:
+        # Applies ``mutate(shard, name)`` for each name, rewriting only the shards those names live in.
+        # Missing shards are left alone (their files count as unindexed) unless ``create`` is set.
+        by_shard: dict[str, list[str]] = {}
+        for name in names:
+            by_shard.setdefault(_search_index_shard_path(root, name), []).append(name)
+
+        for shard_path, shard_names in by_shard.items():
+            def _apply(index: TrigramIndex, shard_names: list[str] = shard_names) -> None:
+                for name in shard_names:
+                    mutate(index, name)
+
+            updated = yield from self._update_system_object_steps(
+                shard_path,
+                lambda data: TrigramIndex.from_bytes(root, data),
+                _apply,
+                lambda index: index.to_bytes(),
+                'application/octet-stream',
+            )
+            if updated or not create:
+                continue
+
+            index = TrigramIndex(root)
+            _apply(index)
+            try:
+                yield from self._save_system_object_steps(shard_path, index.to_bytes(), 'application/octet-stream', if_generation_match=0)
+            except PreconditionFailed:
+                # Another request created it first; ours is only an optimisation
+                pass
+
+    def _add_to_search_index(self, root: str, files: dict[str, tuple[int | None, bytes]]) -> None:
+        def _add(index: TrigramIndex, name: str) -> None:
+            generation, content = files[name]
+            index.set_file(name, generation, content)
+
+        self._update_search_index(root, files, _add, create=True)
+
+    def _record_written_blob(self, blob: StoredObject, content: bytes | None = None) -> None:
+        self._drive(self._record_written_blob_steps(blob, content))
+
+    def _record_written_blob_steps(self, blob: StoredObject, content: bytes | None = None) -> _Steps[None]:
+        root = workspace_root(blob.name)
+        if root is None:
+            return
+        yield from self._update_manifest_steps(
+            root,
+            [blob.name],
+            lambda manifest, name: manifest.upsert(name, blob.size, blob.generation, blob.updated),
+        )
+        if blob.name.endswith('/'):
+            return
+
+        if content is not None and len(content) <= self._search_index_max_file_bytes:
+            yield from self._update_search_index_steps(root, [blob.name], lambda index, name: index.set_file(name, blob.generation, content))
+        else:
+            # Unknown content stays out of the index, which makes it a candidate for every search
+            yield from self._update_search_index_steps(root, [blob.name], lambda index, name: index.remove(name))
+
+    def _record_deleted_path(self, path: str) -> None:
+        self._drive(self._record_deleted_path_steps(path))
+
+    def _record_deleted_path_steps(self, path: str) -> _Steps[None]:
+        root = workspace_root(path)
+        if root is not None:
+            yield from self._update_manifest_steps(root, [path], lambda manifest, name: manifest.remove(name))
+            yield from self._update_search_index_steps(root, [path], lambda index, name: index.remove(name))
+
+    def _record_deleted_prefix(self, prefix: str) -> None:
+        root = workspace_root(prefix)
+        if root is not None:
+            # Only the shards holding something under the prefix are rewritten; without a manifest
+            # there is nothing to update, the next read rebuilds it
+            manifest = self._load_manifest(root)
+            if manifest is not None:
+                self._update_manifest(root, list(manifest.names_under(prefix)), lambda manifest, name: manifest.remove(name))
+            names = [name for shard in self._load_search_index_shards(root).values() for name in shard.names_under(prefix)]
+            self._update_search_index(root, names, lambda index, name: index.remove(name))
+            return
+
+        # The prefix spans whole workspaces: their manifests and indexes go with them
+        self._delete_system_objects(f"{MANIFEST_PREFIX}{prefix}")
+        self._delete_system_objects(f"{SEARCH_INDEX_PREFIX}{prefix}")
+
+    def _scan_blobs(self, scan: Callable[[_T], Any], items: list[_T]) -> Iterator[Any]:
+        # Downloads dominate a scan, so fan them out over the shared pool when one is configured
+        if self._scan_pool is None or len(items) <= 1:
+            return map(scan, items)
+        return self._scan_pool.map_ordered(scan, items, self._scan_concurrency)
+
+    def _store_file(
+        self, path: str, content_bytes: bytes, if_generation_match: int | None = None, content_type: str = 'application/octet-stream'
     ) -> None:
-        self._client = client
-        self._bucket_name = bucket_name
+        self._drive(self._store_file_steps(path, content_bytes, content_type, if_generation_match))
+
+    def _store_file_steps(
+        self, path: str, content_bytes: bytes, content_type: str, if_generation_match: int | None = None
+    ) -> _Steps[StoredObject]:
+        # Upload agent-visible file content and bring the cache, line index, manifest and search index along
+        blob = yield _call("upload", path, content_bytes, content_type, if_generation_match=if_generation_match)
+
+        # Keep the freshly written bytes hot for the agent's next read
+        if self._cache is not None:
+            self._cache.put(self._namespace, path, blob.generation, content_bytes)
+        yield from self._write_line_index_steps(path, content_bytes, blob.generation)
+        yield from self._record_written_blob_steps(blob, content_bytes)
+        return blob
+
+    def _record_appended_blob(self, blob: StoredObject, previous_generation: int | None, chunk: bytes) -> None:
+        # The full content is only known when the previous version was cached; extend it in that case
+        content = None
+        if self._cache is not None and previous_generation is not None:
+            previous = self._cache.revalidate(self._namespace, blob.name, previous_generation)
+            if previous is not None:
+                content = previous + chunk
+            self._cache.invalidate(self._namespace, blob.name)
+
+        if (blob.component_count or 0) >= _APPEND_COMPACT_COMPONENTS:
+            try:
+                if content is None:
+                    content, _ = self._download(blob.name, if_generation_match=blob.generation)
+                # Re-uploading the same bytes yields a plain, single-component object
+                self._store_file(blob.name, content, if_generation_match=blob.generation)
+                return
+            except (PreconditionFailed, ObjectNotFound):
+                # Changed or deleted meanwhile: the next append gets to compact it. The chunk is
+                # already in, so this must not reach the caller as a conflict worth retrying.
+                content = None
+
+        if content is not None:
+            if self._cache is not None:
+                self._cache.put(self._namespace, blob.name, blob.generation, content)
+            self._write_line_index(blob.name, content, blob.generation)
+        # A line index of an older generation is ignored by readers, so no clean-up is needed
+        self._record_written_blob(blob, content)
+
+    def _list_matching_blob_names(self, prefix: str, glob: CompiledGlob) -> list[str]:
+        # Let the backend drop non-matching names; results are still re-checked by the caller
+        if glob.match_glob is not None:
+            try:
+                blobs, _ = self._list(prefix, match_glob=glob.match_glob)
+                return [blob.name for blob in blobs if not _is_system_path(blob.name)]
+            except UnsupportedQuery:
+                pass
+        return self._list_blob_names(prefix)
+
+    def _delete_folder(self, prefix: str, progress: Callable[[int], None] | None) -> int:
+        # Stream the listing page by page and delete each page with bounded parallelism, so neither
+        # memory nor latency grows with the whole folder. Page tokens are name-based, so deleting
+        # the listed objects does not disturb the pagination.
+        deleted = 0
+        for page, _ in self._list_pages(prefix):
+            blobs = [blob for blob in page if not _is_system_path(blob.name)]
+            for _ in self._scan_blobs(self._delete_blob, blobs):
+                pass
+            deleted += len(blobs)
+            if progress is not None and blobs:
+                progress(len(blobs))
+
+        if deleted:
+            self._delete_line_index_prefix(prefix)
+            self._record_deleted_prefix(prefix)
+        return deleted
+
+    def _delete_blob(self, blob: StoredObject) -> None:
+        try:
+            self._delete(blob.name)
+        except ObjectNotFound:
+            # Already gone: a concurrent delete got there first
+            pass
+
+    def _copy_blob(self, source: StoredObject, name: str, overwrite: bool) -> StoredObject:
+        # The bytes stay inside the backend; only the exact generation that was listed gets copied
+        target = self._copy_object(source, name, if_generation_match=None if overwrite else 0)
+
+        if self._cache is not None:
+            content = None
+            if source.generation is not None:
+                content = self._cache.revalidate(self._namespace, source.name, source.generation)
+            if content is not None:
+                self._cache.put(self._namespace, name, target.generation, content)
+            else:
+                self._cache.invalidate(self._namespace, name)
+        # A line index left behind by an older generation of the target is ignored by readers
+        return target
+
+    def _record_copied_blobs(self, copies: list[tuple[StoredObject, StoredObject]]) -> None:
+        # One manifest and one search index update per workspace for a whole page of copies
+        by_root: dict[str, list[tuple[StoredObject, StoredObject]]] = {}
+        for source, target in copies:
+            root = workspace_root(target.name)
+            if root is not None:
+                by_root.setdefault(root, []).append((source, target))
 
+        for root, pairs in by_root.items():
+            targets = {target.name: target for _, target in pairs}
+
+            def _upsert(manifest: WorkspaceManifest, name: str, targets: dict[str, StoredObject] = targets) -> None:
+                target = targets[name]
+                manifest.upsert(name, target.size, target.generation, target.updated)
+
+            self._update_manifest(root, targets, _upsert)
+
+            files = {target.name: (source, target) for source, target in pairs if not target.name.endswith('/')}
+            # Identical bytes: reuse the sources' trigrams instead of reading the copies
+            same_root = [source.name for source, _ in files.values() if workspace_root(source.name) == root]
+            source_index = self._load_search_index(root, same_root) if same_root else None
+
+            def _index(
+                index: TrigramIndex,
+                name: str,
+                files: dict[str, tuple[StoredObject, StoredObject]] = files,
+                source_index: TrigramIndex | None = source_index,
+            ) -> None:
+                source, target = files[name]
+                if source_index is not None:
+                    index.copy_file(source_index, source.name, source.generation, name, target.generation)
+                else:
+                    index.remove(name)
+
+            self._update_search_index(root, files, _index)
+
+    def _copy_folder(self, prefix: str, target_prefix: str, overwrite: bool, move: bool) -> int:
+        # Streamed like _delete_folder: each listed page is copied with bounded parallelism and
+        # recorded before the next page is fetched. A move deletes each page's sources once
+        # their copies exist, guarded by the generation that was copied.
+        # A failure (e.g. a 409) stops the walk, but whatever already happened is recorded
+        # first, so listings and searches served from the manifest still match storage.
+        copied = 0
+        moved: list[str] = []
+        for page, _ in self._list_pages(prefix):
+            blobs = [blob for blob in page if not _is_system_path(blob.name)]
+            outcomes = list(self._scan_blobs(
+                lambda blob: _attempt(self._copy_blob, blob, target_prefix + blob.name[len(prefix):], overwrite),
+                blobs,
+            ))
+            self._record_copied_blobs([(blob, target) for blob, (target, error) in zip(blobs, outcomes) if error is None])
+            _raise_first_error(outcomes, lambda: self._record_moved_sources(moved))
+
+            if move:
+                outcomes = list(self._scan_blobs(lambda blob: _attempt(self._delete_moved_blob, blob), blobs))
+                moved.extend(blob.name for blob, (_, error) in zip(blobs, outcomes) if error is None)
+                _raise_first_error(outcomes, lambda: self._record_moved_sources(moved))
+            copied += len(blobs)
+
+        if move and copied:
+            if self._cache is not None:
+                self._cache.invalidate_prefix(self._namespace, prefix)
+            self._delete_line_index_prefix(prefix)
+            self._record_deleted_prefix(prefix)
+        return copied
+
+    def _record_moved_sources(self, names: list[str]) -> None:
+        # Sources a move deleted before it stopped; a completed move records its whole prefix instead
+        by_root: dict[str, list[str]] = {}
+        for name in names:
+            self._invalidate_cached(name)
+            self._delete_line_index(name)
+            root = workspace_root(name)
+            if root is not None:
+                by_root.setdefault(root, []).append(name)
+
+        for root, root_names in by_root.items():
+            self._update_manifest(root, root_names, lambda manifest, name: manifest.remove(name))
+            self._update_search_index(root, root_names, lambda index, name: index.remove(name))
+
+    def _delete_moved_blob(self, blob: StoredObject) -> None:
+        # PreconditionFailed means the source was written after it was copied: the caller reports a conflict
+        try:
+            self._delete(blob.name, if_generation_match=blob.generation)
+        except ObjectNotFound:
+            pass
+
+    def _flush_change(self, change: PendingChange) -> tuple[PendingChange, StoredObject | None, bool]:
+        # Returns the change, the object it produced (None once deleted) and whether it lost to a conflicting write
+        if change.data is None:
+            try:
+                if change.base:
+                    self._delete(change.name, if_generation_match=change.base)
+            except ObjectNotFound:
+                # Deleted by someone else as well
+                pass
+            except PreconditionFailed:
+                return change, None, True
+            return change, None, False
+
+        try:
+            return change, self._upload(change.name, change.data, 'application/octet-stream', if_generation_match=change.base), False
+        except PreconditionFailed:
+            pass
+
+        # A flush interrupted by a crash may already have written these very bytes
+        try:
+            content, current = self._download(change.name)
+        except ObjectNotFound:
+            return change, None, True
+        return change, current, content != change.data
+
+    def _keep_conflict_copy(self, change: PendingChange) -> tuple[PendingChange, StoredObject]:
+        # The losing bytes go next to the file under a name derived from the base generation,
+        # so a flush repeated after a crash rewrites the same copy instead of adding another
+        copy = PendingChange(_conflict_copy_name(change.name, change.base), change.data, 0)
+        return copy, self._upload(copy.name, copy.data, 'application/octet-stream')
+
+    def _record_flushed_changes(self, root: str, flushed: list[tuple[PendingChange, StoredObject | None]]) -> None:
+        for change, blob in flushed:
+            if blob is None or change.data is None:
+                self._invalidate_cached(change.name)
+                continue
+            if self._cache is not None:
+                self._cache.put(self._namespace, change.name, blob.generation, change.data)
+            self._write_line_index(change.name, change.data, blob.generation)
+
+        changes = {change.name: (change, blob) for change, blob in flushed}
+
+        def _apply(manifest: WorkspaceManifest, name: str) -> None:
+            _, blob = changes[name]
+            if blob is None:
+                manifest.remove(name)
+            else:
+                manifest.upsert(name, blob.size, blob.generation, blob.updated)
+
+        files = {name: pair for name, pair in changes.items() if not name.endswith('/')}
+
+        def _index(index: TrigramIndex, name: str) -> None:
+            change, blob = files[name]
+            if blob is None or change.data is None or len(change.data) > self._search_index_max_file_bytes:
+                index.remove(name)
+            else:
+                index.set_file(name, blob.generation, change.data)
+
+        self._update_manifest(root, changes, _apply)
+        self._update_search_index(root, files, _index)
+
+    def _list_blob_names(self, prefix: str) -> list[str]:
+        # Recursive listing, answered from the workspace manifest when the prefix lies inside one
+        prefix = _workspace_scoped_prefix(prefix)
+        root = workspace_root(prefix)
+        if root is not None:
+            return list(self._workspace_manifest(root).names_under(prefix))
+
+        blobs, _ = self._list(prefix)
+        return [blob.name for blob in blobs if not _is_system_path(blob.name)]
+
+    # Non-blocking counterparts of the helpers above, only called when the backend has an async data
+    # path (self._aio). The hot plain reads, writes, listings and deletes use them; the rest runs in a thread.
+
+    async def _astat(self, path: str) -> StoredObject:
+        self._count_round_trips()
+        return await self._aio.stat(path)
+
+    async def _adownload(self, path: str, **kwargs: Any) -> tuple[bytes, StoredObject]:
+        self._count_round_trips()
+        return await self._aio.read(path, **kwargs)
+
+    async def _aupload(self, path: str, data: bytes, content_type: str, **kwargs: Any) -> StoredObject:
+        self._count_round_trips()
+        return await self._aio.write(path, data, content_type, **kwargs)
+
+    async def _adelete(self, path: str, **kwargs: Any) -> None:
+        self._count_round_trips()
+        await self._aio.delete(path, **kwargs)
+
+    async def _alist(self, prefix: str, delimiter: str | None = None) -> tuple[list[StoredObject], set[str]]:
+        blobs: list[StoredObject] = []
+        prefixes: set[str] = set()
+        async for page_blobs, page_prefixes in self._aio.list_pages(prefix, delimiter):
+            self._count_round_trips()
+            blobs.extend(page_blobs)
+            prefixes.update(page_prefixes)
+        return blobs, prefixes
+
+    async def _adrive(self, steps: _Steps[_T]) -> _T:
+        # _drive on the event loop: the same protocol, with each request awaited
+        result: Any = None
+        error: Exception | None = None
+        while True:
+            try:
+                method, args, kwargs = steps.throw(error) if error is not None else steps.send(result)
+            except StopIteration as stop:
+                return stop.value
+            try:
+                result, error = await getattr(self, f"_a{method}")(*args, **kwargs), None
+            except Exception as exc:
+                result, error = None, exc
+
+    async def _aread_blob(self, path: str) -> tuple[bytes, int | None]:
+        return await self._adrive(self._read_blob_steps(path))
+
+    async def _aworkspace_manifest(self, root: str) -> WorkspaceManifest:
+        manifest = await self._adrive(self._load_manifest_steps(root))
+        if manifest is not None:
+            return manifest
+        # Rebuilding takes a full listing and a conditional save; rare enough for the thread path
+        return await run_blocking(self._executor, self._rescan_manifest, root)
+
+    @metered_operation
     async def upload_file(self, destination_blob_name: str, file_obj: BinaryIO, content_type: str) -> str:
         
         def _sync_upload() -> str:
-            bucket = self._client.bucket(self._bucket_name)
-            blob = bucket.blob(destination_blob_name)
-            
             # Rewind file to beginning just in case
             file_obj.seek(0)
             
-            blob.upload_from_file(file_obj, content_type=content_type)
+            self._count_round_trips()
+            blob = self._backend.write_file(destination_blob_name, file_obj, content_type)
+            self._invalidate_cached(destination_blob_name)
+            self._record_written_blob(blob)
             
-            return f"gs://{self._bucket_name}/{destination_blob_name}"
+            return self._backend.uri(destination_blob_name)
 
-        return await asyncio.to_thread(_sync_upload)
+        return await run_blocking(self._executor, _sync_upload)
 
+    @metered_operation
     async def upload_file_bytes(self, destination_blob_name: str, content: bytes, content_type: str) -> str:
         
         def _sync_upload_bytes() -> str:
-            bucket = self._client.bucket(self._bucket_name)
-            blob = bucket.blob(destination_blob_name)
-            
-            blob.upload_from_string(content, content_type=content_type)
+            self._store_file(destination_blob_name, content, content_type=content_type)
             
-            return f"gs://{self._bucket_name}/{destination_blob_name}"
+            return self._backend.uri(destination_blob_name)
 
-        return await asyncio.to_thread(_sync_upload_bytes)
+        if self._aio is not None:
+            await self._adrive(self._store_file_steps(destination_blob_name, content, content_type))
+            return self._backend.uri(destination_blob_name)
+        return await run_blocking(self._executor, _sync_upload_bytes)
 
+    @metered_operation
     async def read_file_from_storage_string(self, destination_blob_path: str, start_line: int | None, end_line: int | None, page: int | None) -> str:
         
         def _sync_read_file_from_storage_string() -> str:
-            bucket = self._client.bucket(self._bucket_name)
             
             path = destination_blob_path.lstrip('/')
-            
-            blob = bucket.blob(path)
-            
-            # Check if file exists
-            if not blob.exists():
-                raise FileNotFoundError(f"File not found: {path}")
 
-            content_bytes = blob.download_as_bytes()
+            if start_line is not None or end_line is not None:
+                window = self._read_line_window(path, start_line, end_line)
+                if window is not None:
+                    return window
             
-            # Handle text files (assume utf-8)
-            try:
-                text_content = content_bytes.decode('utf-8')
-                
-                # Apply line slicing if requested
-                if start_line is not None or end_line is not None:
-                    lines = text_content.split('\n')
-                    # Adjust for 1-based indexing if needed, but usually slice is 0-based in python
-                    # Assuming start_line/end_line are 1-based for user friendliness, convert to 0-based
-                    start = (start_line - 1) if start_line is not None and start_line > 0 else 0
-                    end = end_line if end_line is not None else len(lines)
-                    
-                    return "\n".join(lines[start:end])
-                
-                return text_content
-            except UnicodeDecodeError:
-                # Binary file that is not PDF
-                return "[Binary content]"
+            content_bytes = self._read_blob_bytes(path)
+            
+            return _decode_line_window(content_bytes, start_line, end_line)
 
-        return await asyncio.to_thread(_sync_read_file_from_storage_string)
+        if self._aio is not None and start_line is None and end_line is None:
+            content_bytes, _ = await self._aread_blob(destination_blob_path.lstrip('/'))
+            return _decode_line_window(content_bytes, None, None)
+        return await run_blocking(self._executor, _sync_read_file_from_storage_string)
 
+    @metered_operation
     async def read_file_from_storage(self, destination_blob_path: str, start_line: int | None, end_line: int | None, page: int | None) -> bytes:
 
         def _sync_read_file_from_storage() -> bytes:
-            bucket = self._client.bucket(self._bucket_name)
             
             # Remove leading slash if present to be flexible
             path = destination_blob_path.lstrip('/')
+
+            # Non-negative bounds can be answered by the backend directly instead of slicing the whole object
+            if (start_line is not None or end_line is not None) and (start_line or 0) >= 0 and (end_line is None or end_line >= 0):
+                start = start_line or 0
+                length = None if end_line is None else max(0, end_line - start)
+                content, _ = self._read_blob_range(path, start, length)
+                return content
             
-            blob = bucket.blob(path)
-            
-            content = blob.download_as_bytes()
+            content = self._read_blob_bytes(path)
             
             return content[start_line:end_line]
 
-        return await asyncio.to_thread(_sync_read_file_from_storage)
+        if self._aio is not None and start_line is None and end_line is None:
+            content, _ = await self._aread_blob(destination_blob_path.lstrip('/'))
+            return content
+        return await run_blocking(self._executor, _sync_read_file_from_storage)
+
+    @metered_operation
+    async def read_file_range_from_storage(self, destination_blob_path: str, offset: int, length: int | None) -> tuple[bytes, int]:
+        """Read ``length`` bytes starting at ``offset``; returns the bytes and the total object size."""
+
+        def _sync_read_file_range() -> tuple[bytes, int]:
+
+            path = destination_blob_path.lstrip('/')
+
+            return self._read_blob_range(path, offset, length)
+
+        return await run_blocking(self._executor, _sync_read_file_range)
 
+    @metered_operation
     async def list_directory_from_storage(self, destination_blob_path: str) -> list[str]:
 
+        # Remove leading slash if present to be flexible
+        prefix = destination_blob_path.lstrip('/')
+
+        # Ensure prefix ends with / if we are treating it as a folder, unless it's empty (root)
+        if prefix and not prefix.endswith("/"):
+            prefix += "/"
+
+        root = workspace_root(prefix)
+
         def _sync_list_directory_from_storage() -> list[str]:
-            bucket = self._client.bucket(self._bucket_name)
             
-            # Remove leading slash if present to be flexible
-            prefix = destination_blob_path.lstrip('/')
-            
-            # Ensure prefix ends with / if we are treating it as a folder, unless it's empty (root)
-            if prefix and not prefix.endswith("/"):
-                prefix += "/"
-                
-            # Using delimiter='/' mimics a filesystem listing (non-recursive)
-            blobs = bucket.list_blobs(prefix=prefix, delimiter="/")
-            
-            items = []
-            # Iterate through blobs (files)
-            for blob in blobs:
-                name = blob.name
-                if name.startswith(prefix):
-                    name = name[len(prefix):]
-                if name:  # Exclude the directory blob itself or empty strings
-                    items.append(name)
-            
-            # Iterate through prefixes (directories)
-            # Note: blobs.prefixes is populated only after iterating through blobs
-            if blobs.prefixes:
-                for p in blobs.prefixes:
-                    name = p
-                    if name.startswith(prefix):
-                        name = name[len(prefix):]
-                    items.append(name)
-            
-            return sorted(items)
+            if root is not None:
+                names, prefixes = self._workspace_manifest(root).children(prefix)
+            else:
+                # Using delimiter='/' mimics a filesystem listing (non-recursive)
+                blobs, prefixes = self._list(prefix, delimiter="/")
+                names = [blob.name for blob in blobs]
+            return _directory_items(prefix, names, prefixes)
 
-        return await asyncio.to_thread(_sync_list_directory_from_storage)
+        if self._aio is not None:
+            if root is not None:
+                names, prefixes = (await self._aworkspace_manifest(root)).children(prefix)
+            else:
+                blobs, prefixes = await self._alist(prefix, delimiter="/")
+                names = [blob.name for blob in blobs]
+            return _directory_items(prefix, names, prefixes)
+        return await run_blocking(self._executor, _sync_list_directory_from_storage)
     
-    async def list_directory_as_tree_from_storage(self, destination_blob_path: str) -> str:
-        
+    @metered_operation
+    async def list_directory_as_tree_from_storage(
+        self,
+        destination_blob_path: str,
+        max_depth: int | None = None,
+        max_entries: int | None = None,
+        ignore: list[str] | None = None,
+    ) -> str:
+        """Render the folder as a tree, breadth-first within ``max_depth`` levels and ``max_entries`` lines.
+
+        Folders deeper than ``max_depth`` are shown collapsed as ``name/ …``; entries whose
+        name or relative path matches an ``ignore`` glob are left out along with their content.
+        """
+
         def _sync_list_directory_as_tree() -> str:
-            bucket = self._client.bucket(self._bucket_name)
             
             # Remove leading slash if present to be flexible
             prefix = destination_blob_path.lstrip('/')
-            
-            blobs = list(bucket.list_blobs(prefix=prefix))
-            
-            if not blobs:
+
+            if max_depth is not None and workspace_root(_workspace_scoped_prefix(prefix)) is None:
+                # Outside a manifest, only list the levels that will be shown: one delimiter query per folder
+                folder_prefix = prefix if not prefix or prefix.endswith('/') else prefix + '/'
+
+                def _children(folder: str) -> tuple[list[str], list[str]]:
+                    listed = folder_prefix + folder
+                    blobs, prefixes = self._list(listed, delimiter="/")
+                    files = [blob.name[len(listed):] for blob in blobs if not _is_system_path(blob.name)]
+                    folders = [name[len(listed):].rstrip('/') for name in prefixes if not _is_system_path(name)]
+                    files = [name for name in files if name and name not in folders]
+                    return sorted(files), sorted(name for name in folders if name)
+            else:
+                names = self._list_blob_names(prefix)
+                if not names:
+                    return ""
+                _children = _nested_children(names, prefix, max_depth)
+
+            tree, truncated = _collect_tree(_children, max_depth, max_entries, ignore or [])
+            if not tree and not truncated:
                 return ""
-                
-            # Build directory tree
-            tree: dict[str, Any] = {}
-            for blob in blobs:
-                # Get relative path
-                name = blob.name
-                if name.startswith(prefix):
-                    rel_path = name[len(prefix):]
-                    # Remove leading slash if present
-                    if rel_path.startswith("/"):
-                        rel_path = rel_path[1:]
-                    
-                    if not rel_path:
-                        continue
-                        
-                    parts = [p for p in rel_path.split("/") if p]
-                    current = tree
-                    for part in parts:
-                        if part not in current:
-                            current[part] = {}
-                        current = current[part]
-            
-            # Generate tree string
-            lines = [prefix if prefix else "."]
-            
-            def _build_tree_string(node: dict[str, Any], prefix_str: str = ""):
-                entries = sorted(node.keys())
-                for i, entry in enumerate(entries):
-                    is_last = i == len(entries) - 1
-                    connector = "└── " if is_last else "├── "
-                    lines.append(f"{prefix_str}{connector}{entry}")
-                    
-                    children = node[entry]
-                    if children:
-                        extension = "    " if is_last else "│   "
-                        _build_tree_string(children, prefix_str + extension)
-            
-            _build_tree_string(tree)
-            return "\n".join(lines)
+            return _render_tree(prefix if prefix else ".", tree, truncated, max_entries)
 
-        return await asyncio.to_thread(_sync_list_directory_as_tree)
+        return await run_blocking(self._executor, _sync_list_directory_as_tree)
 
+    @metered_operation
     async def create_directory_file_from_storage(self, destination_blob_path: str) -> None:
         
         def _sync_create_directory_file() -> None:
-            bucket = self._client.bucket(self._bucket_name)
 
             path = destination_blob_path.lstrip('/')
 
-            blob = bucket.blob(path)
+            blob = self._upload(path, b'', 'application/x-www-form-urlencoded;charset=UTF-8')
+            self._invalidate_cached(path)
+            self._record_written_blob(blob)
 
-            blob.upload_from_string(b'', content_type='application/x-www-form-urlencoded;charset=UTF-8')
+        return await run_blocking(self._executor, _sync_create_directory_file)
 
-        return await asyncio.to_thread(_sync_create_directory_file)
+    @metered_operation
+    async def delete_directory_file_from_storage(
+        self,
+        destination_blob_path: str,
+        progress: Callable[[int], None] | None = None,
+    ) -> int:
+        """Delete a file, or a folder with everything under it; returns the number of objects deleted.
 
-    async def delete_directory_file_from_storage(self, destination_blob_path: str, recursive: bool = False) -> None:
+        ``progress`` is called from worker threads with the count of each deleted chunk.
+        """
 
-        def _sync_delete_directory_file() -> None:
-            bucket = self._client.bucket(self._bucket_name)
+        def _sync_delete_directory_file() -> int:
             
             # Remove leading slash
             path = destination_blob_path.lstrip('/')
+
+            if self._cache is not None:
+                self._cache.invalidate(self._namespace, path)
+                self._cache.invalidate_prefix(self._namespace, path.rstrip('/') + '/')
             
             if path.endswith('/'):
-                # It is a folder, delete all blobs with this prefix
-                blobs = list(bucket.list_blobs(prefix=path))
-                if blobs:
-                    bucket.delete_blobs(blobs)
-                # Also try to delete the "folder marker" object itself if it exists (it was included in list_blobs if it matches prefix)
-            else:
-                # It might be a file or a folder path without trailing slash.
-                # First try to delete as a single object (file)
-                blob = bucket.blob(path)
-                if blob.exists():
-                    blob.delete()
-                else:
-                    # If it doesn't exist as a file, check if it is a folder (prefix)
-                    # Appending '/' to treat as folder
-                    folder_prefix = path + '/'
-                    blobs = list(bucket.list_blobs(prefix=folder_prefix))
-                    if blobs:
-                         bucket.delete_blobs(blobs)
+                # It is a folder, delete all blobs with this prefix (the folder marker included)
+                return self._delete_folder(path, progress)
+
+            # It might be a file or a folder path without trailing slash.
+            # First try to delete as a single object (file); ObjectNotFound means it may be a folder
+            try:
+                self._delete(path)
+            except ObjectNotFound:
+                # If it doesn't exist as a file, check if it is a folder (prefix)
+                # Appending '/' to treat as folder
+                return self._delete_folder(path + '/', progress)
+
+            self._delete_line_index(path)
+            self._record_deleted_path(path)
+            if progress is not None:
+                progress(1)
+            return 1
+
+        path = destination_blob_path.lstrip('/')
+        if self._aio is None or path.endswith('/'):
+            return await run_blocking(self._executor, _sync_delete_directory_file)
+
+        # A single file is one request plus the bookkeeping; folders stream through the thread path
+        self._invalidate_cached(path)
+        try:
+            await self._adelete(path)
+        except ObjectNotFound:
+            return await run_blocking(self._executor, _sync_delete_directory_file)
+        await self._adrive(self._delete_line_index_steps(path))
+        await self._adrive(self._record_deleted_path_steps(path))
+        if progress is not None:
+            progress(1)
+        return 1
+
+    @metered_operation
+    async def copy_path_from_storage(
+        self,
+        source_blob_path: str,
+        destination_blob_path: str,
+        overwrite: bool = False,
+        move: bool = False,
+    ) -> int:
+        """Copy (or move) a file, or a folder with everything under it; returns the number of objects.
 
-        return await asyncio.to_thread(_sync_delete_directory_file)
+        Copies happen inside the backend (GCS rewrites), so no content passes through this process.
+        A destination ending with '/' receives a file under its own name. Without
+        ``overwrite`` an existing target raises PreconditionFailed, as does a moved
+        source that changes before it is deleted.
+        """
 
+        def _sync_copy_path() -> int:
+
+            path = source_blob_path.lstrip('/')
+            target = destination_blob_path.lstrip('/')
+
+            if not path.endswith('/'):
+                try:
+                    source = self._stat(path)
+                except ObjectNotFound:
+                    source = None
+
+                if source is not None:
+                    if target.endswith('/'):
+                        target += posixpath.basename(path)
+                    if target == path:
+                        raise ValueError(f"Source and destination are the same: {path}")
+                    copy = self._copy_blob(source, target, overwrite)
+                    self._record_copied_blobs([(source, copy)])
+                    if move:
+                        self._delete_moved_blob(source)
+                        self._invalidate_cached(path)
+                        self._delete_line_index(path)
+                        self._record_deleted_path(path)
+                    return 1
+
+            prefix = path.rstrip('/') + '/'
+            target_prefix = target.rstrip('/') + '/'
+            if target_prefix.startswith(prefix):
+                # The listing would pick up the copies it is making
+                raise ValueError(f"Destination {target_prefix} lies inside {prefix}")
+            return self._copy_folder(prefix, target_prefix, overwrite, move)
+
+        return await run_blocking(self._executor, _sync_copy_path)
+
+    @metered_operation
     async def rewrite_file_from_storage(self, destination_blob_path: str, content: str) -> None:
 
         def _sync_rewrite_file() -> None:
-            bucket = self._client.bucket(self._bucket_name)
 
             path = destination_blob_path.lstrip('/')
 
-            blob = bucket.blob(path)
+            self._store_file(path, content.encode('utf-8'))
+
+        if self._aio is not None:
+            await self._adrive(self._store_file_steps(destination_blob_path.lstrip('/'), content.encode('utf-8'), 'application/octet-stream'))
+            return
+        return await run_blocking(self._executor, _sync_rewrite_file)
+
+    @metered_operation
+    async def append_file_from_storage(self, destination_blob_path: str, content: str) -> int:
+        """Append to a file by uploading only the new bytes and composing them on server-side.
+
+        Creates the file if it does not exist and returns its new size. Once the
+        file is made of too many composed components it is rewritten as a
+        single object.
+        """
+
+        def _sync_append_file() -> int:
+
+            path = destination_blob_path.lstrip('/')
+            chunk = content.encode('utf-8')
+
+            staged = f"{APPEND_STAGING_PREFIX}{uuid.uuid4().hex}"
+            staged_uploaded = False
+            try:
+                for attempt in range(_FILE_UPDATE_ATTEMPTS):
+                    try:
+                        previous_generation = self._stat(path).generation
+                    except ObjectNotFound:
+                        # Nothing to append to yet: the chunk becomes the file, unless someone creates it first
+                        try:
+                            self._store_file(path, chunk, if_generation_match=0)
+                            return len(chunk)
+                        except PreconditionFailed:
+                            continue
+
+                    if not staged_uploaded:
+                        self._upload(staged, chunk, 'application/octet-stream')
+                        staged_uploaded = True
+
+                    try:
+                        blob = self._compose(path, [path, staged], if_generation_match=previous_generation)
+                    except PreconditionFailed:
+                        # Another writer got in between; append after their bytes instead
+                        if attempt == _FILE_UPDATE_ATTEMPTS - 1:
+                            raise
+                        continue
+                    except ObjectNotFound:
+                        continue
+
+                    self._record_appended_blob(blob, previous_generation, chunk)
+                    return blob.size or 0
+                raise PreconditionFailed(f"File kept changing while appending to {path}")
+            finally:
+                if staged_uploaded:
+                    try:
+                        self._delete(staged)
+                    except ObjectNotFound:
+                        pass
+
+        return await run_blocking(self._executor, _sync_append_file)
 
-            blob.upload_from_string(content, content_type='application/octet-stream')
+    @metered_operation
+    async def update_file_from_storage(self, destination_blob_path: str, mutate: Callable[[bytes], bytes]) -> None:
+        """Read-modify-write a file without losing concurrent updates.
 
-        return await asyncio.to_thread(_sync_rewrite_file)
+        The new content is written only if the file still has the generation
+        ``mutate`` saw; on a conflict the file is re-read and ``mutate`` runs
+        again. Raises FileNotFoundError, or PreconditionFailed once the file
+        kept changing for every attempt. Errors raised by ``mutate`` propagate.
+        """
+
+        def _sync_update_file() -> None:
+
+            path = destination_blob_path.lstrip('/')
 
+            for attempt in range(_FILE_UPDATE_ATTEMPTS):
+                content, generation = self._read_blob(path)
+                try:
+                    self._store_file(path, mutate(content), if_generation_match=generation)
+                    return
+                except PreconditionFailed:
+                    # A cached copy may be what went stale: read the live object next time
+                    self._invalidate_cached(path)
+                    if attempt == _FILE_UPDATE_ATTEMPTS - 1:
+                        raise
+
+        return await run_blocking(self._executor, _sync_update_file)
+
+    @metered_operation
     async def fuzzy_filename_search_from_storage(self, query: str, include_pattern: bool, destination_blob_path: str) -> list[str]:
 
         def _sync_fuzzy_filename_search() -> list[str]:
-            bucket = self._client.bucket(self._bucket_name)
 
             prefix = destination_blob_path.lstrip('/')
 
-            blobs = list(bucket.list_blobs(prefix=prefix))
+            if not include_pattern:
+                # Simple substring match
+                return [name for name in self._list_blob_names(prefix) if query in name]
 
-            results = []
-            for blob in blobs:
-                name = blob.name
-                
-                if include_pattern:
-                    # fnmatch matches against the whole string if no path separators, but we want recursive search.
-                    if fnmatch.fnmatch(name, query):
-                        results.append(name)
-                else:
-                    # Simple substring match
-                    if query in name:
-                        results.append(name)
-            
-            return results
+            # fnmatch semantics on the full name: "*" also crosses "/", so "*.md" is a recursive search
+            glob = compile_glob(query)
+            listing_prefix = narrow_listing_prefix(prefix, glob)
+            if listing_prefix is None:
+                return []
 
-        return await asyncio.to_thread(_sync_fuzzy_filename_search)
+            if workspace_root(_workspace_scoped_prefix(listing_prefix)) is not None:
+                names = self._list_blob_names(listing_prefix)
+            else:
+                names = self._list_matching_blob_names(listing_prefix, glob)
 
-    async def fuzzy_file_content_search_from_storage(self, query: str, is_regex: bool, destination_blob_path: str, page: int | None) -> list[str]:
+            return [name for name in names if glob.matches(name)]
 
-        def _sync_fuzzy_file_content_search() -> list[str]:
+        return await run_blocking(self._executor, _sync_fuzzy_filename_search)
 
-            bucket = self._client.bucket(self._bucket_name)
+    def _iter_content_matches(self, query: str, is_regex: bool, destination_blob_path: str, start_after: str | None) -> Iterator[str]:
+        # Yields matching blob names in listing order; the scan stops as soon as the consumer does
+        for name, _ in self._scan_text_blobs(query, is_regex, destination_blob_path, start_after, lambda content: True):
+            yield name
 
-            prefix = destination_blob_path.lstrip('/')
+    def _scan_text_blobs(
+        self,
+        query: str,
+        is_regex: bool,
+        destination_blob_path: str,
+        start_after: str | None,
+        inspect: Callable[[str], Any],
+    ) -> Iterator[tuple[str, Any]]:
+        # Yields (name, inspect(content)) for each text blob containing the query, in listing order.
+        # ``inspect`` runs on the scan pool right after the download; falsy results are dropped.
 
-            blobs = list(bucket.list_blobs(prefix=prefix))
 
-            results = []
-            
-            # Pre-compile regex if needed
-            regex_pattern = None
-            if is_regex:
-                try:
-                    regex_pattern = re.compile(query)
-                except re.error:
-                    # If regex is invalid, return empty or handle error. For now return empty.
-                    return []
+        prefix = destination_blob_path.lstrip('/')
+
+        # Pre-compile regex if needed
+        regex_pattern = None
+        if is_regex:
+            try:
+                regex_pattern = re.compile(query)
+            except re.error:
+                # If regex is invalid, there is nothing to match
+                return
+
+        prefix = _workspace_scoped_prefix(prefix)
+        root = workspace_root(prefix)
+        unindexed: set[str] = set()
+        if root is None:
+            # The prefix spans workspaces: no index to consult, scan every blob under it
+            candidates = [
+                (blob.name, blob)
+                for blob in self._list(prefix)[0]
+                if not _is_system_path(blob.name) and (start_after is None or blob.name > start_after)
+            ]
+        else:
+            # Narrow the files with the trigram index before downloading anything
+            manifest = self._workspace_manifest(root)
+            index = self._load_search_index(root) or TrigramIndex(root)
+            required = required_trigrams(query, is_regex)
 
-            for blob in blobs:
-                # Skip if it looks like a "directory" marker
-                if blob.name.endswith('/'):
+            candidates = []
+            for name in manifest.names_under(prefix):
+                if start_after is not None and name <= start_after:
                     continue
-                
-                try:
-                    # Download content as string (assuming utf-8 text files)
-                    content = blob.download_as_text()
-                except Exception:
-                    # If file is not text (e.g. binary), skip it
+                verdict = index.may_match(name, manifest.entries[name]["generation"], required)
+                if verdict is False:
                     continue
-                
-                if is_regex and regex_pattern:
-                    if regex_pattern.search(content):
-                        results.append(blob.name)
-                else:
-                    if query in content:
-                        results.append(blob.name)
-            
-            return results
+                if verdict is None:
+                    unindexed.add(name)
+                candidates.append((name, None))
+
+        # A literal query can be ruled out in place by backends that map files locally
+        needle = None if is_regex else query.encode('utf-8')
+
+        def _scan_blob(candidate: tuple[str, StoredObject | None]) -> tuple[str, Any, tuple[int | None, bytes] | None]:
+            name, blob = candidate
+            if needle is not None and name not in unindexed:
+                # UTF-8 is self-synchronising, so a byte-level miss is a miss for the decoded text too
+                if self._backend.contains(name, needle, blob.generation if blob is not None else None) is False:
+                    return name, None, None
+            try:
+                content_bytes, generation = self._read_blob(name, blob)
+            except FileNotFoundError:
+                return name, None, None
+
+            index_entry = None
+            if name in unindexed and len(content_bytes) <= self._search_index_max_file_bytes:
+                index_entry = (generation, content_bytes)
+
+            try:
+                # Decode content as string (assuming utf-8 text files)
+                content = content_bytes.decode('utf-8')
+            except UnicodeDecodeError:
+                # If file is not text (e.g. binary), skip it
+                return name, None, index_entry
+
+            if is_regex and regex_pattern:
+                matched = regex_pattern.search(content) is not None
+            else:
+                matched = query in content
+            return name, inspect(content) if matched else None, index_entry
+
+        # Skip if it looks like a "directory" marker
+        candidates = [candidate for candidate in candidates if not candidate[0].endswith('/')]
+
+        newly_indexed: dict[str, tuple[int | None, bytes]] = {}
+        scan = self._scan_blobs(_scan_blob, candidates)
+        try:
+            for name, result, index_entry in scan:
+                if index_entry is not None:
+                    newly_indexed[name] = index_entry
+                if result:
+                    yield name, result
+        finally:
+            # Also runs when the caller stops early; unstarted downloads are cancelled first
+            close = getattr(scan, "close", None)
+            if close is not None:
+                close()
+            if root is not None and newly_indexed:
+                # Files we had to download anyway teach the index for the next query
+                self._add_to_search_index(root, newly_indexed)
+
+    @metered_operation
+    async def fuzzy_file_content_search_from_storage(
+        self,
+        query: str,
+        is_regex: bool,
+        destination_blob_path: str,
+        page: int | None,
+        page_size: int | None = None,
+        start_after: str | None = None,
+    ) -> list[str]:
+
+        def _sync_fuzzy_file_content_search() -> list[str]:
+
+            matches = self._iter_content_matches(query, is_regex, destination_blob_path, start_after)
+            try:
+                if page_size is None:
+                    return list(matches)
+                # Only scan as far as the last match of the requested page
+                skip = (max(page or 1, 1) - 1) * page_size
+                return list(itertools.islice(matches, skip, skip + page_size))
+            finally:
+                matches.close()
+
+        return await run_blocking(self._executor, _sync_fuzzy_file_content_search)
+
+    async def iter_file_content_search_from_storage(
+        self,
+        query: str,
+        is_regex: bool,
+        destination_blob_path: str,
+        start_after: str | None = None,
+    ) -> AsyncIterator[str]:
+        """Stream matching blob names as the scan finds them.
+
+        Only the first step can raise ExecutorSaturated; later steps wait for
+        a worker instead, so a stream that started is not cut short.
+        """
 
-        return await asyncio.to_thread(_sync_fuzzy_file_content_search)
+        if self._metrics is not None:
+            self._metrics.record_call("iter_file_content_search_from_storage")
+        # The scan resumes in a new worker thread per match, so carry the attribution explicitly
+        context = operation_context("iter_file_content_search_from_storage")
+        matches = self._iter_content_matches(query, is_regex, destination_blob_path, start_after)
+        step = run_blocking
+        pending: asyncio.Future[str | None] | None = None
+        try:
+            while True:
+                # Shielded, so a cancelled request does not lose track of a step still running in a worker
+                pending = asyncio.ensure_future(step(self._executor, context.run, next, matches, None))
+                name = await asyncio.shield(pending)
+                if name is None:
+                    return
+                step = resume_blocking
+                yield name
+        finally:
+            if pending is not None and not pending.done():
+                # Closing a generator while a worker is inside next() raises ValueError
+                await asyncio.wait([pending])
+                pending.exception()
+            # Clean-up must run even when the executor is saturated
+            await asyncio.to_thread(context.run, matches.close)
 
+    @metered_operation
     async def search_file_offset_from_storage(self, query: str, destination_blob_path: str, is_regex: bool) -> list[dict[str, Any]]:
         def _sync_search_file_offset() -> list[dict[str, Any]]:
-            bucket = self._client.bucket(self._bucket_name)
 
             # Remove leading slash
             path = destination_blob_path.lstrip('/')
             
-            blob = bucket.blob(path)
-            
-            if not blob.exists():
-                return []
-                
             # Skip "directory" markers
             if path.endswith('/'):
                 return []
 
+            # A missing file surfaces as FileNotFoundError from the single download request
             try:
-                content = blob.download_as_text()
+                content = self._read_blob_bytes(path).decode('utf-8')
             except Exception:
                 return []
 
@@ -361,4 +1500,381 @@ class StorageRepository:
             
             return results
 
-        return await asyncio.to_thread(_sync_search_file_offset)
\ No newline at end of file
+        return await run_blocking(self._executor, _sync_search_file_offset)
+
+    @metered_operation
+    async def grep_folder_from_storage(
+        self,
+        query: str,
+        is_regex: bool,
+        destination_blob_path: str,
+        context_lines: int = 0,
+        max_matches_per_file: int = 50,
+        max_total_matches: int = 500,
+    ) -> tuple[list[dict[str, Any]], bool]:
+        """Line-level matches of every file under the folder, each file downloaded once.
+
+        Returns ``(files, truncated)``; ``truncated`` is set once the total limit
+        is reached, since the scan stops there.
+        """
+
+        def _sync_grep_folder() -> tuple[list[dict[str, Any]], bool]:
+
+            if is_regex:
+                try:
+                    regex_pattern = re.compile(query)
+                except re.error:
+                    return [], False
+                line_matches: Callable[[str], bool] = lambda line: regex_pattern.search(line) is not None
+            else:
+                line_matches = lambda line: query in line
+
+            def _grep_content(content: str) -> tuple[list[dict[str, Any]], bool]:
+                # Runs on the scan pool, so only the per-file limit applies here
+                return _grep_lines(content.split('\n'), line_matches, context_lines, max_matches_per_file)
+
+            files: list[dict[str, Any]] = []
+            total = 0
+            truncated = False
+            scan = self._scan_text_blobs(query, is_regex, destination_blob_path, None, _grep_content)
+            try:
+                for name, (matches, file_truncated) in scan:
+                    if not matches:
+                        # A pattern that spans lines matched the file but no single line
+                        continue
+                    if total + len(matches) > max_total_matches:
+                        matches = matches[:max_total_matches - total]
+                        file_truncated = truncated = True
+                    files.append({"path": name, "matches": matches, "truncated": file_truncated})
+                    total += len(matches)
+                    if total >= max_total_matches:
+                        truncated = True
+                        break
+            finally:
+                scan.close()
+            return files, truncated
+
+        return await run_blocking(self._executor, _sync_grep_folder)
+
+    @metered_operation
+    async def rescan_workspace_manifest(self, destination_blob_path: str) -> int:
+        """Rebuild the manifest of the workspace containing the path; returns its entry count."""
+
+        def _sync_rescan_workspace_manifest() -> int:
+
+            path = destination_blob_path.lstrip('/')
+            root = workspace_root(path if path.endswith('/') else path + '/')
+            if root is None:
+                raise ValueError(f"Path is not inside a course workspace: {path}")
+
+            return len(self._rescan_manifest(root).entries)
+
+        return await run_blocking(self._executor, _sync_rescan_workspace_manifest)
+
+    def for_session(self, workspace: SessionWorkspace) -> StorageRepository:
+        """A repository that serves and changes files through ``workspace`` until it is flushed."""
+
+        # The workspace holds the bytes itself; the shared cache only sees flushed generations
+        return StorageRepository(
+            backend=workspace,
+            line_index_min_bytes=self._line_index_min_bytes,
+            metrics=self._metrics,
+            search_index_max_file_bytes=self._search_index_max_file_bytes,
+            scan_pool=self._scan_pool,
+            scan_concurrency=self._scan_concurrency,
+            executor=self._executor,
+        )
+
+    def open_session_workspace(self, session_id: str, root: str, spool_dir: str) -> SessionWorkspace:
+        """Start a write-back session over the workspace at ``root``, journaled under ``spool_dir``."""
+
+        local_prefixes = (_manifest_prefix(root), _search_index_prefix(root), _line_index_path(root), APPEND_STAGING_PREFIX)
+        return SessionWorkspace.create(self._backend, session_id, root, local_prefixes, spool_dir, self._count_round_trips)
+
+    def recover_session_workspace(self, directory: str) -> SessionWorkspace | None:
+        """Pick up the journal a crashed session left in ``directory``, if no live session holds it."""
+
+        return SessionWorkspace.recover(self._backend, directory, self._count_round_trips)
+
+    @metered_operation
+    async def flush_session_workspace(self, workspace: SessionWorkspace) -> dict[str, Any]:
+        """Write a closed session's changed files back in parallel and drop its journal.
+
+        Each write or delete is conditioned on the generation the session
+        started from, so a file changed by someone else meanwhile keeps their
+        version and is reported under ``conflicts``. The session's bytes for
+        such a file are kept in a sibling copy, listed under
+        ``conflict_copies``. When the flush fails part-way, the journal stays
+        behind for the next recovery.
+        """
+
+        def _sync_flush() -> dict[str, Any]:
+
+            try:
+                results = list(self._scan_blobs(self._flush_change, workspace.pending_changes()))
+                flushed = [(change, blob) for change, blob, conflict in results if not conflict]
+                written = sum(1 for change, _ in flushed if change.data is not None)
+                deleted = sum(1 for change, _ in flushed if change.data is None)
+                conflicts = [change.name for change, _, conflict in results if conflict]
+                for name in conflicts:
+                    self._invalidate_cached(name)
+                lost = [change for change, _, conflict in results if conflict and change.data is not None]
+                copies = list(self._scan_blobs(self._keep_conflict_copy, lost))
+                flushed.extend(copies)
+                if flushed:
+                    self._record_flushed_changes(workspace.root, flushed)
+                for change, _, _ in results:
+                    workspace.mark_settled(change.name)
+            except BaseException:
+                workspace.release()
+                raise
+
+            workspace.discard()
+            return {
+                "session_id": workspace.session_id,
+                "written": written,
+                "deleted": deleted,
+                "conflicts": conflicts,
+                "conflict_copies": {change.name: copy.name for change, (copy, _) in zip(lost, copies)},
+            }
+
+        return await run_blocking(self._executor, _sync_flush)
+
+    def stats(self) -> dict[str, Any]:
+
+        return {
+            "round_trips": self._metrics.snapshot() if self._metrics is not None else {},
+            "cache": self._cache.stats() if self._cache is not None else {},
+        }
+
+
+def _decode_line_window(content_bytes: bytes, start_line: int | None, end_line: int | None) -> str:
+    # Handle text files (assume utf-8)
+    try:
+        text_content = content_bytes.decode('utf-8')
+        
+        # Apply line slicing if requested
+        if start_line is not None or end_line is not None:
+            lines = text_content.split('\n')
+            # Adjust for 1-based indexing if needed, but usually slice is 0-based in python
+            # Assuming start_line/end_line are 1-based for user friendliness, convert to 0-based
+            start = (start_line - 1) if start_line is not None and start_line > 0 else 0
+            end = end_line if end_line is not None else len(lines)
+            
+            return "\n".join(lines[start:end])
+        
+        return text_content
+    except UnicodeDecodeError:
+        # Binary file that is not PDF
+        return "[Binary content]"
+
+
+def _grep_lines(
+    lines: list[str],
+    line_matches: Callable[[str], bool],
+    context_lines: int,
+    limit: int,
+) -> tuple[list[dict[str, Any]], bool]:
+    # Matching lines with 1-based numbers and up to ``context_lines`` neighbours on each side
+    matches: list[dict[str, Any]] = []
+    for i, line in enumerate(lines):
+        if not line_matches(line):
+            continue
+        if len(matches) == limit:
+            return matches, True
+        matches.append({
+            "line": i + 1,
+            "content": line,
+            "before": lines[max(i - context_lines, 0):i],
+            "after": lines[i + 1:i + 1 + context_lines],
+        })
+    return matches, False
+
+
+# Tree node of a folder whose content lies beyond max_depth
+_COLLAPSED: dict[str, Any] = {}
+
+
+def _nested_children(names: list[str], prefix: str, max_depth: int | None) -> Callable[[str], tuple[list[str], list[str]]]:
+    # Index an already-listed set of blob names by folder, keeping one level past max_depth
+    # so collapsed folders are still known to be folders
+    files: dict[str, set[str]] = {}
+    folders: dict[str, set[str]] = {}
+    for name in names:
+        if not name.startswith(prefix):
+            continue
+        rel_path = name[len(prefix):]
+        # Remove leading slash if present
+        if rel_path.startswith("/"):
+            rel_path = rel_path[1:]
+        parts = [p for p in rel_path.split("/") if p]
+        last = len(parts) - 1
+        if max_depth is not None:
+            parts = parts[:max_depth + 1]
+        folder = ""
+        for depth, part in enumerate(parts):
+            if depth == last and not rel_path.endswith("/"):
+                files.setdefault(folder, set()).add(part)
+            else:
+                folders.setdefault(folder, set()).add(part)
+            folder += part + "/"
+
+    def _children(folder: str) -> tuple[list[str], list[str]]:
+        child_folders = folders.get(folder, set())
+        # A folder marker blob and a same-named folder collapse into one entry, as before
+        return sorted(files.get(folder, set()) - child_folders), sorted(child_folders)
+
+    return _children
+
+
+def _collect_tree(
+    children: Callable[[str], tuple[list[str], list[str]]],
+    max_depth: int | None,
+    max_entries: int | None,
+    ignore: list[str],
+) -> tuple[dict[str, Any], bool]:
+    # Breadth-first, so a truncated tree keeps the shallow entries the agent needs to navigate
+    tree: dict[str, Any] = {}
+    queue: deque[tuple[str, dict[str, Any], int, dict[str, Any] | None, str]] = deque([("", tree, 0, None, "")])
+    count = 0
+    while queue:
+        folder, node, depth, _, _ = queue[0]
+        files, folders = children(folder)
+        entries = [(name, False) for name in files] + [(name, True) for name in folders]
+        for name, is_folder in sorted(entries):
+            rel_path = folder + name
+            if any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(rel_path, pattern) for pattern in ignore):
+                continue
+            if max_entries is not None and count >= max_entries:
+                # Folders that never got listed are shown collapsed rather than as if empty
+                for _, pending_node, _, pending_parent, pending_name in queue:
+                    if pending_parent is not None and not pending_node:
+                        pending_parent[pending_name] = _COLLAPSED
+                return tree, True
+            count += 1
+            if not is_folder:
+                node.setdefault(name, {})
+            elif max_depth is not None and depth + 1 >= max_depth:
+                node[name] = _COLLAPSED
+            else:
+                node[name] = node.get(name) or {}
+                queue.append((rel_path + "/", node[name], depth + 1, node, name))
+        queue.popleft()
+    return tree, False
+
+
+def _render_tree(label: str, tree: dict[str, Any], truncated: bool, max_entries: int | None) -> str:
+    lines = [label]
+    # Explicit stack instead of recursion: deep trees cannot hit the recursion limit
+    stack: list[tuple[dict[str, Any], list[str], int, str]] = [(tree, sorted(tree), 0, "")]
+    while stack:
+        node, entries, position, prefix_str = stack[-1]
+        if position == len(entries):
+            stack.pop()
+            continue
+        stack[-1] = (node, entries, position + 1, prefix_str)
+
+        entry = entries[position]
+        is_last = position == len(entries) - 1
+        connector = "└── " if is_last else "├── "
+        children = node[entry]
+        if children is _COLLAPSED:
+            lines.append(f"{prefix_str}{connector}{entry}/ …")
+            continue
+        lines.append(f"{prefix_str}{connector}{entry}")
+        if children:
+            extension = "    " if is_last else "│   "
+            stack.append((children, sorted(children), 0, prefix_str + extension))
+
+    if truncated:
+        lines.append(f"… (truncated at {max_entries} entries)")
+    return "\n".join(lines)
+
+
+def _directory_items(prefix: str, names: Iterable[str], prefixes: Iterable[str]) -> list[str]:
+    items = []
+    # Iterate through blobs (files)
+    for name in names:
+        is_system = _is_system_path(name)
+        if name.startswith(prefix):
+            name = name[len(prefix):]
+        if name and not is_system:  # Exclude the directory blob itself or empty strings
+            items.append(name)
+    
+    # Iterate through prefixes (directories)
+    if prefixes:
+        for p in prefixes:
+            if _is_system_path(p):
+                continue
+            name = p
+            if name.startswith(prefix):
+                name = name[len(prefix):]
+            items.append(name)
+    
+    return sorted(items)
+
+
+def _is_system_path(name: str) -> bool:
+    return name.startswith(SYSTEM_PREFIX)
+
+
+def _workspace_scoped_prefix(prefix: str) -> str:
+    # "u/c" names the workspace folder itself; sibling workspaces never share an id prefix
+    if workspace_root(prefix) is None and workspace_root(prefix + '/') == prefix + '/':
+        return prefix + '/'
+    return prefix
+
+
+def _line_index_path(path: str) -> str:
+    return f"{LINE_INDEX_PREFIX}{path}"
+
+
+def _attempt(func: Callable[..., _T], *args: Any) -> tuple[_T | None, Exception | None]:
+    # Lets a batch finish its other items before one failure is reported
+    try:
+        return func(*args), None
+    except Exception as exc:
+        return None, exc
+
+
+def _raise_first_error(outcomes: list[tuple[Any, Exception | None]], before_raise: Callable[[], None]) -> None:
+    for _, error in outcomes:
+        if error is not None:
+            before_raise()
+            raise error
+
+
+def _call(method: str, *args: Any, **kwargs: Any) -> _Call:
+    return method, args, kwargs
+
+
+def _indexable_generation(generation: int | None) -> bool:
+    # Session workspaces number their uncommitted writes with negative generations, which the
+    # line index header cannot hold; the flush indexes the committed generation instead
+    return generation is not None and generation >= 0
+
+
+def _conflict_copy_name(name: str, base: int) -> str:
+    # notes/a.md -> notes/a.conflict-<generation>.md, so the copy keeps its file type
+    stem, extension = posixpath.splitext(name)
+    return f"{stem}.conflict-{base}{extension}"
+
+
+def _manifest_prefix(root: str) -> str:
+    return f"{MANIFEST_PREFIX}{root}shards/"
+
+
+def _manifest_shard_path(root: str, name: str) -> str:
+    return f"{_manifest_prefix(root)}{index_shard(name, MANIFEST_SHARDS):02d}.json"
+
+
+def _manifest_shard_paths(root: str) -> list[str]:
+    return [f"{_manifest_prefix(root)}{shard:02d}.json" for shard in range(MANIFEST_SHARDS)]
+
+
+def _search_index_prefix(root: str) -> str:
+    return f"{SEARCH_INDEX_PREFIX}{root}shards/"
+
+
+def _search_index_shard_path(root: str, name: str) -> str:
+    return f"{_search_index_prefix(root)}{index_shard(name, SEARCH_INDEX_SHARDS):02d}.bin"
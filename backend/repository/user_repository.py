@@ -1,29 +1,30 @@
 from __future__ import annotations
 
-import asyncio
 from datetime import datetime, timezone
 from typing import Any
 
 from google.cloud import firestore
 
+from core.executors import InstrumentedExecutor, run_async
 from models.user import UserModel, UserPreference, UserProfile
 
 
 class UserRepository:
-    def __init__(self, client: firestore.Client, collection: str = "user") -> None:
+    def __init__(self, client: firestore.AsyncClient, collection: str = "user", executor: InstrumentedExecutor | None = None) -> None:
         self._client = client
         self._collection = collection
+        self._executor = executor
 
     async def get_or_create_user(self, profile: UserProfile) -> UserModel:
 
-        def _sync_get_or_create() -> UserModel:
+        async def _get_or_create() -> UserModel:
             users_ref = self._client.collection(self._collection)
             
             # query with provider:provider_id
             query = users_ref.where("provider", "==", profile.provider)\
                              .where("provider_id", "==", profile.provider_id)\
                              .limit(1)
-            docs = list(query.stream())
+            docs = [doc async for doc in query.stream()]
             
             now = datetime.now(timezone.utc)
 
@@ -55,16 +56,16 @@ class UserRepository:
                 "updated_at": now,
             }
             
-            new_doc_ref.set(new_user_data)
+            await new_doc_ref.set(new_user_data)
             return UserModel(**new_user_data)
 
-        return await asyncio.to_thread(_sync_get_or_create)
+        return await run_async(self._executor, _get_or_create)
 
     async def update_user_preference(self, user_id: str, new_preference: UserPreference) -> None:
-        def _sync_update_user_preference() -> None:
+        async def _update_user_preference() -> None:
             users_ref = self._client.collection(self._collection)
 
-            doc = users_ref.document(user_id).get()
+            doc = await users_ref.document(user_id).get()
             if not doc.exists:
                 raise ValueError(f"User with ID {user_id} not found")
             
@@ -72,7 +73,7 @@ class UserRepository:
             data["preferences"] = new_preference.model_dump()
             data["updated_at"] = datetime.now(timezone.utc)
 
-            doc.reference.update(data)
+            await doc.reference.update(data)
             return None
             
-        return await asyncio.to_thread(_sync_update_user_preference)
\ No newline at end of file
+        return await run_async(self._executor, _update_user_preference)
\ No newline at end of file
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import json
+from datetime import datetime
+from typing import Any, Iterable, Iterator
+
+# Depth of a workspace root: ``{user_id}/{course_id}/``
+WORKSPACE_DEPTH = 2
+
+
+def workspace_root(path: str) -> str | None:
+    """Return the workspace root that fully contains every blob name starting with ``path``.
+
+    ``u/c/notes`` lies inside ``u/c/``; ``u/c`` does not (it would also match ``u/cx/``).
+    """
+
+    parts = path.split("/")
+    if len(parts) <= WORKSPACE_DEPTH or not all(parts[:WORKSPACE_DEPTH]):
+        return None
+    return "/".join(parts[:WORKSPACE_DEPTH]) + "/"
+
+
+class WorkspaceManifest:
+    """Paths, sizes, generations and update times of every blob in one workspace."""
+
+    def __init__(self, root: str, entries: dict[str, dict[str, Any]] | None = None) -> None:
+        self.root = root
+        self.entries: dict[str, dict[str, Any]] = entries or {}
+
+    @classmethod
+    def from_blobs(cls, root: str, blobs: Iterable[Any]) -> WorkspaceManifest:
+
+        manifest = cls(root)
+        for blob in blobs:
+            manifest.upsert(blob.name, blob.size, blob.generation, blob.updated)
+        return manifest
+
+    @classmethod
+    def from_bytes(cls, root: str, data: bytes) -> WorkspaceManifest | None:
+
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            return None
+        if not isinstance(payload, dict) or payload.get("version") != 1:
+            return None
+        return cls(root, payload.get("entries") or {})
+
+    def to_bytes(self) -> bytes:
+
+        payload = {"version": 1, "root": self.root, "entries": self.entries}
+        return json.dumps(payload, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+    def upsert(self, name: str, size: int | None, generation: int | None, updated: datetime | str | None) -> None:
+
+        if isinstance(updated, datetime):
+            updated = updated.isoformat()
+        self.entries[name] = {
+            "size": size or 0,
+            "generation": generation,
+            "updated": updated,
+        }
+
+    def remove(self, name: str) -> None:
+
+        self.entries.pop(name, None)
+
+    def remove_prefix(self, prefix: str) -> None:
+
+        for name in [name for name in self.entries if name.startswith(prefix)]:
+            del self.entries[name]
+
+    def names_under(self, prefix: str) -> Iterator[str]:
+        """Blob names starting with ``prefix`` in lexicographic order, like ``list_blobs``."""
+
+        for name in sorted(self.entries):
+            if name.startswith(prefix):
+                yield name
+
+    def children(self, prefix: str) -> tuple[list[str], set[str]]:
+        """Emulate a ``delimiter='/'`` listing: direct files and sub-folder prefixes."""
+
+        files: list[str] = []
+        folders: set[str] = set()
+        for name in self.names_under(prefix):
+            rest = name[len(prefix):]
+            if "/" in rest:
+                folders.add(prefix + rest.split("/", 1)[0] + "/")
+            else:
+                files.append(name)
+        return files, folders
@@ -0,0 +1,87 @@
+import argparse
+from datetime import datetime, timezone
+
+from google.cloud import firestore
+
+from config.settings import get_settings
+from core.database import get_firestore_client
+
+
+def _scan_messages(client: firestore.Client, message_collection: str) -> dict[str, tuple[int, int]]:
+
+    # Only the two fields are fetched, not the message contents
+    last_indexes: dict[str, int] = {}
+    counts: dict[str, int] = {}
+    for doc in client.collection(message_collection).select(["course_id", "index"]).stream():
+        data = doc.to_dict() or {}
+        course_id = data.get("course_id")
+        index = data.get("index")
+        if course_id is None or not isinstance(index, int):
+            continue
+        last_indexes[course_id] = max(last_indexes.get(course_id, index), index)
+        counts[course_id] = counts.get(course_id, 0) + 1
+    return {course_id: (last_index, counts[course_id]) for course_id, last_index in last_indexes.items()}
+
+
+def _backfill_counter(
+    client: firestore.Client,
+    counter_collection: str,
+    course_id: str,
+    next_index: int,
+    message_count: int,
+) -> bool:
+
+    counter_ref = client.collection(counter_collection).document(course_id)
+
+    @firestore.transactional
+    def backfill_in_transaction(transaction: firestore.Transaction) -> bool:
+        counter = counter_ref.get(transaction=transaction)
+        data = counter.to_dict() if counter.exists else None
+        # Never move a live counter backwards: messages may have been written since the scan
+        if data and data.get("next_index", 0) >= next_index:
+            if "message_count" in data:
+                return False
+            # Counters allocated before message counts existed: readers treat next_index as the count
+            transaction.update(counter_ref, {"message_count": data["next_index"]})
+            return True
+        transaction.set(counter_ref, {
+            "course_id": course_id,
+            "next_index": next_index,
+            "message_count": message_count,
+            "updated_at": datetime.now(timezone.utc),
+        })
+        return True
+
+    return backfill_in_transaction(client.transaction())
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description="Seed the per-course message index counters from existing messages.")
+    parser.add_argument("--message-collection", default="message")
+    parser.add_argument("--counter-collection", default="message_counter")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the counters that would be written.")
+    args = parser.parse_args()
+
+    settings = get_settings()
+    client = get_firestore_client(
+        project_id=settings.firebase_project_id,
+        credentials_file=settings.firebase_credentials_file,
+    )
+
+    courses = _scan_messages(client, args.message_collection)
+    print(f"found messages of {len(courses)} courses")
+
+    written = 0
+    for course_id, (last_index, message_count) in sorted(courses.items()):
+        if args.dry_run:
+            print(f"{course_id}: next_index {last_index + 1}, message_count {message_count}")
+            continue
+        if _backfill_counter(client, args.counter_collection, course_id, last_index + 1, message_count):
+            written += 1
+    if not args.dry_run:
+        print(f"wrote {written} counters, {len(courses) - written} were already up to date")
+
+
+if __name__ == "__main__":
+    main()
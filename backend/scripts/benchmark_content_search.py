@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import random
+import re
+import string
+import time
+
+from core.scan_pool import BlobScanPool
+from core.storage_metrics import StorageRoundTripCounter
+from repository.local_backend import LocalStorageBackend
+from repository.search_index import TrigramIndex, index_shard, required_trigrams
+from repository.storage_backend import StoredObject
+from repository.storage_repository import SEARCH_INDEX_PREFIX, SEARCH_INDEX_SHARDS, StorageRepository
+
+QUERIES = [
+    ("rare substring", "quarterly_reconciliation", False),
+    ("common substring", "the", False),
+    ("regex", r"def \w+_handler\(", True),
+]
+
+
+def _synthetic_workspace(files: int, file_bytes: int, seed: int) -> dict[str, bytes]:
+
+    rng = random.Random(seed)
+    words = ["the", "lecture", "notes", "course", "data", "model", "value", "return", "import", "self"]
+    workspace: dict[str, bytes] = {}
+    for number in range(files):
+        chunks: list[str] = []
+        size = 0
+        while size < file_bytes:
+            if number % 41 == 0 and rng.random() < 0.05:
+                chunk = "def " + "".join(rng.choices(string.ascii_lowercase, k=8)) + "_handler(self):\n"
+            else:
+                chunk = " ".join(rng.choices(words, k=12)) + "\n"
+            chunks.append(chunk)
+            size += len(chunk)
+        if number % 97 == 0:
+            chunks.append("quarterly_reconciliation\n")
+        workspace[f"u/c/notes/file_{number:05d}.md"] = "".join(chunks).encode("utf-8")
+    return workspace
+
+
+def _matches(content: bytes, query: str, is_regex: bool) -> bool:
+
+    text = content.decode("utf-8")
+    return re.search(query, text) is not None if is_regex else query in text
+
+
+def _full_scan(workspace: dict[str, bytes], query: str, is_regex: bool) -> tuple[list[str], int]:
+
+    matched: list[str] = []
+    downloaded = 0
+    for name, content in workspace.items():
+        downloaded += len(content)
+        if _matches(content, query, is_regex):
+            matched.append(name)
+    return matched, downloaded
+
+
+def _indexed_scan(
+    workspace: dict[str, bytes], index: TrigramIndex, query: str, is_regex: bool
+) -> tuple[list[str], int]:
+
+    required = required_trigrams(query, is_regex)
+    matched: list[str] = []
+    downloaded = len(index.to_bytes())
+    for name, content in workspace.items():
+        if index.may_match(name, 1, required) is False:
+            continue
+        downloaded += len(content)
+        if _matches(content, query, is_regex):
+            matched.append(name)
+    return matched, downloaded
+
+
+class _CountingBackend(LocalStorageBackend):
+    """Local backend that tallies the bytes written to the search index."""
+
+    index_bytes_written = 0
+
+    def write(self, name: str, data: bytes, content_type: str, if_generation_match: int | None = None) -> StoredObject:
+        if name.startswith(SEARCH_INDEX_PREFIX):
+            self.index_bytes_written += len(data)
+        return super().write(name, data, content_type, if_generation_match=if_generation_match)
+
+
+def _shard_sizes(index: TrigramIndex, workspace: dict[str, bytes]) -> list[int]:
+    # The persisted size of each shard, as the repository splits the workspace index
+    shards = [TrigramIndex("u/c/") for _ in range(SEARCH_INDEX_SHARDS)]
+    for name in workspace:
+        shards[index_shard(name, SEARCH_INDEX_SHARDS)].copy_file(index, name, 1, name, 1)
+    return [len(shard.to_bytes()) for shard in shards]
+
+
+def _local_backend_runs(root: str, workspace: dict[str, bytes], writes: int) -> None:
+    # End to end through the repository on local disk: the first run builds the manifest and index
+    backend = _CountingBackend(root)
+    for name, content in workspace.items():
+        backend.write(name, content, "text/plain")
+
+    metrics = StorageRoundTripCounter()
+    repository = StorageRepository(backend, metrics=metrics, scan_pool=BlobScanPool(16), scan_concurrency=16)
+    for label, query, is_regex in QUERIES:
+        for run in ("cold", "warm"):
+            metrics.reset()
+            started = time.perf_counter()
+            matches = asyncio.run(repository.fuzzy_file_content_search_from_storage(query, is_regex, "u/c/", None))
+            seconds = time.perf_counter() - started
+            round_trips = sum(entry["round_trips"] for entry in metrics.snapshot().values())
+            print(f"{label:>16}: {len(matches):5d} matches | local {run} {seconds * 1000:8.1f} ms, {round_trips} requests")
+
+    # Every write keeps the index current by rewriting the shard that holds the file
+    names = list(workspace)[:writes]
+    metrics.reset()
+    backend.index_bytes_written = 0
+    started = time.perf_counter()
+    for name in names:
+        asyncio.run(repository.rewrite_file_from_storage(name, workspace[name].decode("utf-8") + "edited\n"))
+    seconds = time.perf_counter() - started
+    round_trips = sum(entry["round_trips"] for entry in metrics.snapshot().values())
+    print(
+        f"{'rewrite':>16}: {len(names):5d} files   | local {seconds * 1000 / len(names):8.1f} ms, "
+        f"{round_trips / len(names):.1f} requests, {backend.index_bytes_written / len(names) / 1024:.1f} KiB of index written per write"
+    )
+
+
+def main() -> None:
+
+    parser = argparse.ArgumentParser(description="Compare full-scan and trigram-indexed content search.")
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--file-bytes", type=int, default=8 * 1024)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument(
+        "--local-root",
+        help="Also search the workspace through the repository on a local storage backend rooted here (an empty directory).",
+    )
+    parser.add_argument("--writes", type=int, default=50, help="Files rewritten through the repository in the local run.")
+    args = parser.parse_args()
+
+    workspace = _synthetic_workspace(args.files, args.file_bytes, args.seed)
+    total_bytes = sum(len(content) for content in workspace.values())
+
+    started = time.perf_counter()
+    index = TrigramIndex("u/c/")
+    for name, content in workspace.items():
+        index.set_file(name, 1, content)
+    encoded = index.to_bytes()
+    build_seconds = time.perf_counter() - started
+    # Searches load the index from its persisted form, as the repository does
+    index = TrigramIndex.from_bytes("u/c/", encoded)
+
+    print(f"workspace: {len(workspace)} files, {total_bytes / 1024 / 1024:.1f} MiB")
+    print(f"index: {len(encoded) / 1024 / 1024:.1f} MiB ({len(encoded) / total_bytes:.2f}x the text), built in {build_seconds:.2f}s")
+    shard_sizes = _shard_sizes(index, workspace)
+    print(
+        f"shards: {SEARCH_INDEX_SHARDS}, {sum(shard_sizes) / len(shard_sizes) / 1024:.1f} KiB on average, "
+        f"{max(shard_sizes) / 1024:.1f} KiB at most; a write rewrites one of them instead of the whole index"
+    )
+    for label, query, is_regex in QUERIES:
+        started = time.perf_counter()
+        full_matches, full_bytes = _full_scan(workspace, query, is_regex)
+        full_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        indexed_matches, indexed_bytes = _indexed_scan(workspace, index, query, is_regex)
+        indexed_seconds = time.perf_counter() - started
+
+        if full_matches != indexed_matches:
+            raise RuntimeError(f"Index changed the results for {query!r}")
+        print(
+            f"{label:>16}: {len(full_matches):5d} matches | "
+            f"full scan {full_bytes / 1024 / 1024:8.1f} MiB {full_seconds * 1000:8.1f} ms | "
+            f"indexed {indexed_bytes / 1024 / 1024:8.1f} MiB {indexed_seconds * 1000:8.1f} ms"
+        )
+
+    if args.local_root:
+        _local_backend_runs(args.local_root, workspace, args.writes)
+
+
+if __name__ == "__main__":
+    main()
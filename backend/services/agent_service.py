@@ -1,17 +1,33 @@
-import re
+import asyncio
+import base64
+import json
 import posixpath
 from urllib.parse import unquote
 
-from typing import Any, Optional
+from typing import Any, AsyncIterator, Optional
 
 from fastapi import HTTPException, status
 
+from core.background_jobs import BackgroundJob, BackgroundJobRegistry
+from core.executors import ExecutorSaturated, executor_stats
+from models.requests.agent import AgentBatchOperation
+from repository.session_workspace import SessionClosed
+from repository.storage_backend import PreconditionFailed
 from repository.storage_repository import StorageRepository
+from utils.search_replace import apply_search_replace_blocks, parse_search_replace_blocks
+
+DEFAULT_SEARCH_PAGE_SIZE = 50
+# Byte-range reads in a batch without an explicit cap; the read endpoint passes its configured limit
+DEFAULT_RANGE_READ_MAX_BYTES = 4 * 1024 * 1024
+
+# Batch operations that only read; consecutive ones run concurrently
+BATCH_READ_OPERATIONS = frozenset({"read", "list", "tree", "search_paths", "search_content", "search_file", "grep"})
 
 
 class AgentService:
-    def __init__(self, storage_repository: StorageRepository) -> None:
+    def __init__(self, storage_repository: StorageRepository, jobs: BackgroundJobRegistry | None = None) -> None:
         self._storage_repository = storage_repository
+        self._jobs = jobs
 
     def _normalize_path(self, path: str) -> str:
         decoded_path = unquote(path)
@@ -43,85 +59,469 @@ class AgentService:
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"File not found: {decoded_path}"
             ) from exc
+        except ExecutorSaturated:
+            raise
         except Exception as exc:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail=f"Error reading file: {str(exc)}"
             ) from exc
 
+    async def read_file_range(self, path: str, offset: int, length: Optional[int], max_length: int) -> dict[str, Any]:
+        decoded_path = self._normalize_path(path)
+
+        if offset < 0 or (length is not None and length <= 0):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="offset must be >= 0 and length must be > 0",
+            )
+        length = min(length or max_length, max_length)
+
+        try:
+            content, size = await self._storage_repository.read_file_range_from_storage(decoded_path, offset, length)
+        except FileNotFoundError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"File not found: {decoded_path}"
+            ) from exc
+        except ExecutorSaturated:
+            raise
+        except Exception as exc:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Error reading file: {str(exc)}"
+            ) from exc
+
+        # A range may cut a multi-byte character or hit binary data; base64 keeps it lossless
+        try:
+            text, encoding = content.decode("utf-8"), "utf-8"
+        except UnicodeDecodeError:
+            text, encoding = base64.b64encode(content).decode("ascii"), "base64"
+
+        return {
+            "content": text,
+            "encoding": encoding,
+            "offset": offset,
+            "length": len(content),
+            "size": size,
+        }
+
     async def list_directory(self, path: str) -> list[str]:
         decoded_path = self._normalize_path(path)
         return await self._storage_repository.list_directory_from_storage(decoded_path)
 
-    async def list_directory_as_tree(self, path: str) -> str:
+    async def list_directory_as_tree(
+        self,
+        path: str,
+        max_depth: Optional[int] = None,
+        max_entries: Optional[int] = None,
+        ignore: Optional[list[str]] = None,
+    ) -> str:
         decoded_path = self._normalize_path(path)
-        return await self._storage_repository.list_directory_as_tree_from_storage(decoded_path)
+        return await self._storage_repository.list_directory_as_tree_from_storage(decoded_path, max_depth, max_entries, ignore)
 
     async def create_file_or_folder(self, path: str) -> None:
         decoded_path = self._normalize_path(path)
-        return await self._storage_repository.create_directory_file_from_storage(decoded_path)
+        try:
+            return await self._storage_repository.create_directory_file_from_storage(decoded_path)
+        except SessionClosed as exc:
+            raise self._session_closed_conflict(decoded_path) from exc
 
-    async def delete_file_or_folder(self, path: str, recursive: Optional[bool] = False) -> None:
+    async def delete_file_or_folder(self, path: str) -> int:
         decoded_path = self._normalize_path(path)
-        return await self._storage_repository.delete_directory_file_from_storage(decoded_path, recursive)
+        try:
+            return await self._storage_repository.delete_directory_file_from_storage(decoded_path)
+        except SessionClosed as exc:
+            raise self._session_closed_conflict(decoded_path) from exc
+
+    def start_delete_job(self, path: str) -> dict[str, Any]:
+        decoded_path = self._normalize_path(path)
+        if not decoded_path.strip('/'):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Refusing to delete the bucket root"
+            )
+
+        async def _delete(job: BackgroundJob) -> dict[str, Any]:
+            deleted = await self._storage_repository.delete_directory_file_from_storage(decoded_path, job.advance)
+            return {"deleted": deleted}
+
+        return self._require_jobs().start("delete", decoded_path, _delete).to_dict()
+
+    def get_job(self, job_id: str) -> dict[str, Any]:
+        job = self._require_jobs().get(job_id)
+        if job is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Job not found: {job_id}"
+            )
+        return job.to_dict()
+
+    def _session_closed_conflict(self, path: str) -> HTTPException:
+        # The turn's session was closed for flushing while this change was on its way. Writing around the
+        # session could land before the flush and lose to the session's older copy, so the caller retries.
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"The agent session was closed before {path} was changed, retry without the session"
+        )
+
+    def _require_jobs(self) -> BackgroundJobRegistry:
+        if self._jobs is None:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Background jobs are not available"
+            )
+        return self._jobs
+
+    async def copy_path(self, source: str, destination: str, overwrite: bool = False, move: bool = False) -> int:
+        decoded_source = self._normalize_path(source)
+        decoded_destination = self._normalize_path(destination)
+        if not decoded_source.strip('/') or not decoded_destination.strip('/'):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Refusing to copy from or onto the bucket root"
+            )
+
+        action = "move" if move else "copy"
+        try:
+            copied = await self._storage_repository.copy_path_from_storage(decoded_source, decoded_destination, overwrite, move)
+        except ValueError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(exc)
+            ) from exc
+        except SessionClosed as exc:
+            raise self._session_closed_conflict(decoded_destination) from exc
+        except PreconditionFailed as exc:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=(
+                    f"Cannot {action} {source} to {destination}: the destination already exists "
+                    "or the source changed during the operation"
+                )
+            ) from exc
+
+        if copied == 0:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"File or folder not found: {source}"
+            )
+        return copied
 
     async def rewrite_file(self, path: str, content: str) -> None:
         decoded_path = self._normalize_path(path)
-        return await self._storage_repository.rewrite_file_from_storage(decoded_path, content)
+        try:
+            return await self._storage_repository.rewrite_file_from_storage(decoded_path, content)
+        except SessionClosed as exc:
+            raise self._session_closed_conflict(decoded_path) from exc
 
-    async def edit_file(self, path: str, search_replace_blocks: str) -> None:
+    async def append_file(self, path: str, content: str) -> int:
         decoded_path = self._normalize_path(path)
-        
-        # 1. Read current content
+        if not decoded_path or decoded_path.endswith('/'):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Cannot append to a directory: {path}"
+            )
         try:
-            content_bytes = await self._storage_repository.read_file_from_storage(decoded_path, None, None, None)
-            content_str = content_bytes.decode("utf-8")
-        except Exception as exc:
+            return await self._storage_repository.append_file_from_storage(decoded_path, content)
+        except SessionClosed as exc:
+            raise self._session_closed_conflict(decoded_path) from exc
+        except PreconditionFailed as exc:
             raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"File not found or unreadable in string format: {decoded_path}"
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"File kept changing while appending, retry the append: {decoded_path}"
             ) from exc
 
-        # 2. Parse blocks
-        
-        pattern = re.compile(
-            r"(?:^|\n)(.*?)\n>>>>>\n(.*?)\n<<<<<", 
-            re.DOTALL
-        )
-        
-        blocks = pattern.findall(search_replace_blocks)
-            
-        new_content = content_str
-        
-        for search_block, replace_block in blocks:
-            # 3. Apply edit
-            
-            # Count occurrences
-            count = new_content.count(search_block)
-            
-            if count == 0:
-                # Skip if block not found
-                continue
-            if count > 1:
+    async def edit_file(self, path: str, search_replace_blocks: str) -> None:
+        decoded_path = self._normalize_path(path)
+
+        blocks = parse_search_replace_blocks(search_replace_blocks)
+
+        def _apply_blocks(content_bytes: bytes) -> bytes:
+            # Runs again on the fresh content if the file changes before the write lands
+            try:
+                content_str = content_bytes.decode("utf-8")
+            except UnicodeDecodeError as exc:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"File not found or unreadable in string format: {decoded_path}"
+                ) from exc
+            try:
+                return apply_search_replace_blocks(content_str, blocks).encode("utf-8")
+            except ValueError as exc:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Search block found multiple times ({count}), ambiguous edit:\n{search_block}"
-                )
-            
-            new_content = new_content.replace(search_block, replace_block)
+                    detail=str(exc)
+                ) from exc
 
-        # 4. Write back
-        await self._storage_repository.rewrite_file_from_storage(decoded_path, new_content)
+        try:
+            await self._storage_repository.update_file_from_storage(decoded_path, _apply_blocks)
+        except SessionClosed as exc:
+            raise self._session_closed_conflict(decoded_path) from exc
+        except FileNotFoundError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"File not found or unreadable in string format: {decoded_path}"
+            ) from exc
+        except PreconditionFailed as exc:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail=f"File kept changing while it was being edited, retry the edit: {decoded_path}"
+            ) from exc
 
     async def search_file_paths(self, query: str, path: str, include_pattern: bool = False) -> list[str]:
         decoded_path = self._normalize_path(path)
         decoded_query = unquote(query)
         return await self._storage_repository.fuzzy_filename_search_from_storage(decoded_query, include_pattern, decoded_path)
 
-    async def grep_file_content(self, query: str, path: str, is_regex: bool = False, page: int | None = None) -> list[str]:
+    def _decode_search_cursor(self, cursor: str | None) -> str | None:
+        if cursor is None:
+            return None
+        try:
+            start_after = base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True).decode("utf-8")
+        except ValueError:
+            start_after = ""
+        if not start_after:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid search cursor"
+            )
+        return start_after
+
+    def _encode_search_cursor(self, last_match: str) -> str:
+        return base64.urlsafe_b64encode(last_match.encode("utf-8")).decode("ascii").rstrip("=")
+
+    def _search_window(self, page: int | None, page_size: int | None, cursor: str | None) -> tuple[int | None, int | None, str | None]:
+        # Returns (page, page_size, start_after); a cursor replaces page-number paging
+        start_after = self._decode_search_cursor(cursor)
+        if page_size is None and (page is not None or cursor is not None):
+            page_size = DEFAULT_SEARCH_PAGE_SIZE
+        if start_after is not None:
+            page = None
+        return page, page_size, start_after
+
+    async def grep_file_content(
+        self,
+        query: str,
+        path: str,
+        is_regex: bool = False,
+        page: int | None = None,
+        page_size: int | None = None,
+        cursor: str | None = None,
+    ) -> tuple[list[str], str | None]:
+        decoded_path = self._normalize_path(path)
+        page, page_size, start_after = self._search_window(page, page_size, cursor)
+        results = await self._storage_repository.fuzzy_file_content_search_from_storage(
+            query, is_regex, decoded_path, page, page_size, start_after
+        )
+        # A full page may have more after it; the scan stopped at its last match
+        next_cursor = None
+        if page_size is not None and len(results) == page_size:
+            next_cursor = self._encode_search_cursor(results[-1])
+        return results, next_cursor
+
+    async def stream_file_content(
+        self,
+        query: str,
+        path: str,
+        is_regex: bool = False,
+        page: int | None = None,
+        page_size: int | None = None,
+        cursor: str | None = None,
+    ) -> AsyncIterator[bytes]:
+        # Validated eagerly so a bad cursor is a 400, not a broken stream
         decoded_path = self._normalize_path(path)
-        return await self._storage_repository.fuzzy_file_content_search_from_storage(query, is_regex, decoded_path, page)
+        page, page_size, start_after = self._search_window(page, page_size, cursor)
+        skip = (max(page or 1, 1) - 1) * page_size if page_size is not None else 0
+
+        async def _stream() -> AsyncIterator[bytes]:
+            matches = self._storage_repository.iter_file_content_search_from_storage(
+                query, is_regex, decoded_path, start_after
+            )
+            skipped = 0
+            sent: list[str] = []
+            try:
+                async for name in matches:
+                    if skipped < skip:
+                        skipped += 1
+                        continue
+                    sent.append(name)
+                    yield (json.dumps({"file": name}) + "\n").encode("utf-8")
+                    if page_size is not None and len(sent) == page_size:
+                        # Page is full: stop scanning instead of draining the folder
+                        break
+            except Exception as exc:
+                if not sent:
+                    # Nothing went out yet: the caller still answers with a proper error status
+                    raise
+                # The 200 is already on the wire; end with a record the client can resume from
+                next_cursor = self._encode_search_cursor(sent[-1])
+                yield (json.dumps({"done": False, "error": str(exc), "count": len(sent), "next_cursor": next_cursor}) + "\n").encode("utf-8")
+                return
+            finally:
+                await matches.aclose()
+
+            next_cursor = None
+            if page_size is not None and len(sent) == page_size:
+                next_cursor = self._encode_search_cursor(sent[-1])
+            yield (json.dumps({"done": True, "count": len(sent), "next_cursor": next_cursor}) + "\n").encode("utf-8")
+
+        # The first line is produced before the response starts, so a saturated storage
+        # backend is answered with 503 and Retry-After rather than a truncated 200
+        stream = _stream()
+        first = await anext(stream)
+
+        async def _primed() -> AsyncIterator[bytes]:
+            yield first
+            async for chunk in stream:
+                yield chunk
+
+        return _primed()
 
     async def search_file_offset(self, query: str, path: str, is_regex: bool = False) -> list[dict[str, Any]]:
         decoded_path = self._normalize_path(path)
-        return await self._storage_repository.search_file_offset_from_storage(query, decoded_path, is_regex)
\ No newline at end of file
+        return await self._storage_repository.search_file_offset_from_storage(query, decoded_path, is_regex)
+
+    async def grep_folder(
+        self,
+        query: str,
+        path: str,
+        is_regex: bool = False,
+        context_lines: int = 0,
+        max_matches_per_file: int = 50,
+        max_total_matches: int = 500,
+    ) -> tuple[list[dict[str, Any]], bool]:
+        decoded_path = self._normalize_path(path)
+        return await self._storage_repository.grep_folder_from_storage(
+            query, is_regex, decoded_path, context_lines, max_matches_per_file, max_total_matches
+        )
+
+    async def rescan_workspace(self, path: str) -> int:
+        decoded_path = self._normalize_path(path)
+        try:
+            return await self._storage_repository.rescan_workspace_manifest(decoded_path)
+        except ValueError as exc:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(exc)
+            ) from exc
+
+    def get_storage_stats(self) -> dict[str, Any]:
+        return {**self._storage_repository.stats(), "executors": executor_stats()}
+
+    async def execute_batch(
+        self,
+        operations: list[AgentBatchOperation],
+        stop_on_error: bool = False,
+        range_read_max_bytes: int | None = None,
+    ) -> list[dict[str, Any]]:
+        """Run operations in order, overlapping each run of consecutive reads.
+
+        A write waits for every earlier operation and finishes before any later
+        one starts, so reads after it observe it. ``range_read_max_bytes`` caps
+        byte-range reads like the standalone read endpoint does.
+        """
+
+        results: list[dict[str, Any]] = []
+        failed = False
+        position = 0
+        while position < len(operations):
+            if stop_on_error and failed:
+                for index in range(position, len(operations)):
+                    results.append(self._batch_result(index, operations[index], "skipped", status.HTTP_424_FAILED_DEPENDENCY))
+                break
+
+            end = position + 1
+            if operations[position].op in BATCH_READ_OPERATIONS:
+                while end < len(operations) and operations[end].op in BATCH_READ_OPERATIONS:
+                    end += 1
+
+            group = await asyncio.gather(
+                *(self._run_batch_operation(index, operations[index], range_read_max_bytes) for index in range(position, end))
+            )
+            results.extend(group)
+            failed = failed or any(result["status"] == "error" for result in group)
+            position = end
+
+        return results
+
+    async def _run_batch_operation(self, index: int, operation: AgentBatchOperation, range_read_max_bytes: int | None) -> dict[str, Any]:
+        try:
+            output = await self._dispatch_batch_operation(operation, range_read_max_bytes)
+        except HTTPException as exc:
+            return self._batch_result(index, operation, "error", exc.status_code, error=str(exc.detail))
+        except ExecutorSaturated as exc:
+            return self._batch_result(index, operation, "error", status.HTTP_503_SERVICE_UNAVAILABLE, error=str(exc))
+        except Exception as exc:
+            # One failing operation must not fail the whole batch
+            return self._batch_result(index, operation, "error", status.HTTP_500_INTERNAL_SERVER_ERROR, error=f"Operation failed: {str(exc)}")
+        return self._batch_result(index, operation, "success", status.HTTP_200_OK, result=output)
+
+    def _batch_result(
+        self,
+        index: int,
+        operation: AgentBatchOperation,
+        outcome: str,
+        status_code: int,
+        result: dict[str, Any] | None = None,
+        error: str | None = None,
+    ) -> dict[str, Any]:
+        return {
+            "index": index,
+            "op": operation.op,
+            "path": operation.path,
+            "status": outcome,
+            "status_code": status_code,
+            "result": result,
+            "error": error,
+        }
+
+    def _require_batch_field(self, operation: AgentBatchOperation, field: str) -> Any:
+        value = getattr(operation, field)
+        if value is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Operation {operation.op} requires {field}"
+            )
+        return value
+
+    async def _dispatch_batch_operation(self, operation: AgentBatchOperation, range_read_max_bytes: int | None) -> dict[str, Any]:
+        path = operation.path
+        if operation.op == "read":
+            if operation.offset is not None or operation.length is not None:
+                max_length = range_read_max_bytes or DEFAULT_RANGE_READ_MAX_BYTES
+                return await self.read_file_range(path, operation.offset or 0, operation.length, max_length)
+            return {"content": await self.read_file(path, operation.start_line, operation.end_line, None)}
+        if operation.op == "list":
+            return {"items": await self.list_directory(path)}
+        if operation.op == "tree":
+            return {"tree": await self.list_directory_as_tree(path, operation.max_depth, operation.max_entries, operation.ignore)}
+        if operation.op == "create":
+            await self.create_file_or_folder(path)
+            return {"message": f"URI {path} successfully created."}
+        if operation.op == "rewrite":
+            await self.rewrite_file(path, self._require_batch_field(operation, "content"))
+            return {"message": f"Change successfully made to {path}."}
+        if operation.op == "edit":
+            await self.edit_file(path, self._require_batch_field(operation, "search_replace_blocks"))
+            return {"message": f"Change successfully made to {path}."}
+        if operation.op == "delete":
+            await self.delete_file_or_folder(path)
+            return {"message": f"URI {path} successfully deleted."}
+        if operation.op in ("copy", "move"):
+            destination = self._require_batch_field(operation, "destination")
+            count = await self.copy_path(path, destination, operation.overwrite, operation.op == "move")
+            return {"message": f"{count} object(s) {'moved' if operation.op == 'move' else 'copied'} from {path} to {destination}."}
+        if operation.op == "search_paths":
+            query = self._require_batch_field(operation, "query")
+            return {"matches": await self.search_file_paths(query, path, operation.include_pattern)}
+        if operation.op == "search_content":
+            query = self._require_batch_field(operation, "query")
+            files, _ = await self.grep_file_content(query, path, operation.is_regex)
+            return {"files": files}
+        if operation.op == "search_file":
+            query = self._require_batch_field(operation, "query")
+            return {"matches": await self.search_file_offset(query, path, operation.is_regex)}
+        query = self._require_batch_field(operation, "query")
+        files, truncated = await self.grep_folder(query, path, operation.is_regex)
+        return {"files": files, "truncated": truncated}
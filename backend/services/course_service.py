@@ -1,3 +1,4 @@
+import asyncio
 from datetime import datetime, timezone
 from typing import Any
 
@@ -8,6 +9,8 @@ import io
 from pypdf import PdfReader
 
 from config.settings import get_settings
+from core.executors import ExecutorSaturated
+from core.session_workspaces import SessionWorkspaceRegistry
 from models.course import CourseModel
 from models.message import MessageModel, Role
 from models.user import UserModel
@@ -22,10 +25,12 @@ class CourseService:
         repository: CourseRepository,
         storage_repository: StorageRepository,
         message_repository: MessageRepository,
+        sessions: SessionWorkspaceRegistry | None = None,
     ) -> None:
         self._repository = repository
         self._storage_repository = storage_repository
         self._message_repository = message_repository
+        self._sessions = sessions
     
     async def create_course(self, user: UserModel, name: str, files: list[UploadFile]) -> CourseModel:
         
@@ -71,6 +76,8 @@ class CourseService:
                             content=content_to_upload,
                             content_type=content_type,
                         )
+                    except ExecutorSaturated:
+                        raise
                     except Exception as e:
                         print(f"Failed to convert PDF {file.filename} to text: {e}")
                         # Fallback or re-raise? For now, return empty string or error message
@@ -87,6 +94,8 @@ class CourseService:
                         content_type=file.content_type or "application/octet-stream",
                     )
                     
+            except ExecutorSaturated:
+                raise
             except Exception as exc:
                 print(f"Failed to upload {file.filename}: {exc}")
                 raise HTTPException(
@@ -174,13 +183,28 @@ class CourseService:
                     "SESSION_ID": course_id
                 }
 
+                # Serve the agent's file operations for this turn from a write-back workspace
+                session_opened = False
+                if self._sessions is not None:
+                    try:
+                        await self._sessions.open(course_id, f"{user.id}/{course_id}/", self._storage_repository)
+                        session_opened = True
+                    except Exception as e:
+                        print(f"Failed to open session workspace, agent works on storage directly: {e}")
+
                 # Send to Agent API
+                new_messages = []
+                conflict_message = None
                 async with httpx.AsyncClient() as client:
-                    response = await client.post(
-                        f"{settings.agent_backend_url}/chat", 
-                        json=payload, 
-                        timeout=60.0 
-                    )
+                    try:
+                        response = await client.post(
+                            f"{settings.agent_backend_url}/chat", 
+                            json=payload, 
+                            timeout=60.0 
+                        )
+                    finally:
+                        if session_opened:
+                            conflict_message = await self._close_session(course_id)
                     
                     if response.status_code != 200:
                         # something is error
@@ -207,7 +231,15 @@ class CourseService:
                                 toolName=msg_data.get("toolName"),
                                 createdAt=datetime.now(timezone.utc)
                             )
-                            await self._message_repository.create_message(course_id, new_msg)
+                            new_messages.append(new_msg)
+
+                # The conflict report follows the reply it concerns
+                if conflict_message is not None:
+                    new_messages.append(conflict_message)
+
+                # One commit for the whole reply instead of a transaction per message
+                if new_messages:
+                    await self._message_repository.append_messages(course_id, new_messages)
                         
             except Exception as e:
                 # Log error but don't fail the user request
@@ -215,9 +247,43 @@ class CourseService:
 
         return user_message
 
-    async def get_messages_by_course_id(self, course_id: str, user: UserModel) -> list[MessageModel]:
-        # 1. Verify course ownership
-        course = await self._repository.get_course_by_id(course_id)
+    async def _close_session(self, course_id: str) -> MessageModel | None:
+        # Flush failures keep the journal for the next recovery; they must not fail the turn.
+        # Files the agent lost to concurrent writes are reported to the user as part of the turn.
+        try:
+            result = await self._sessions.close(course_id)
+        except Exception as e:
+            print(f"Failed to flush session workspace of course {course_id}: {e}")
+            return None
+        if result is None or not result["conflicts"]:
+            return None
+
+        lines = ["Some files were changed by someone else while the agent worked on them; their version was kept:"]
+        for name in result["conflicts"]:
+            copy = result["conflict_copies"].get(name)
+            kept = f"the agent's version is in {copy}" if copy is not None else "the agent had deleted it"
+            lines.append(f"- {name}: {kept}")
+        return MessageModel(
+            id="",
+            index=0,
+            course_id=course_id,
+            role=Role.ASSISTANT,
+            content="\n".join(lines),
+            createdAt=datetime.now(timezone.utc)
+        )
+
+    async def get_messages_by_course_id(
+        self,
+        course_id: str,
+        user: UserModel,
+        limit: int | None = None,
+        before_index: int | None = None,
+        after_index: int | None = None,
+        course: CourseModel | None = None,
+    ) -> tuple[list[MessageModel], bool]:
+        # 1. Verify course ownership; a caller that already loaded the course passes it in
+        if course is None:
+            course = await self._repository.get_course_by_id(course_id)
 
         if not course:
             raise HTTPException(
@@ -231,7 +297,44 @@ class CourseService:
                 detail="You do not have permission to perform this action on this course.",
             )
         
-        return await self._message_repository.get_all_messages_by_course_id(course_id)
+        return await self._message_repository.get_messages_page(course_id, limit, before_index, after_index)
+
+    async def get_messages_etag(
+        self,
+        course_id: str,
+        user: UserModel,
+        limit: int | None = None,
+        before_index: int | None = None,
+        after_index: int | None = None,
+    ) -> tuple[CourseModel, str]:
+        """The verified course and a weak ETag of one page of its conversation.
+
+        The tag changes whenever messages are added, and differs between
+        queries, so a tag taken for one page never validates another. Pass
+        the course on to ``get_messages_by_course_id`` to skip a second lookup.
+        """
+
+        # Two reads issued concurrently; the count is only used once ownership is confirmed
+        course, message_count = await asyncio.gather(
+            self._repository.get_course_by_id(course_id),
+            self._message_repository.get_message_count(course_id),
+        )
+
+        if not course:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Course with ID {course_id} not found.",
+            )
+            
+        if course.owner_id != user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="You do not have permission to perform this action on this course.",
+            )
+
+        # If-None-Match lists tags separated by commas, so the tag itself must not contain one
+        query = ":".join("" if value is None else str(value) for value in (limit, before_index, after_index))
+        return course, f'W/"{message_count}:{query}"'
 
     async def get_course_markdown_files(self, course_id: str, user: UserModel) -> list[str]:
         # 1. Verify course (and ownership)
@@ -0,0 +1,186 @@
+"""In-memory stand-in for the parts of ``firestore.AsyncClient`` the repositories use.
+
+Transactions are optimistic like Firestore's: a commit aborts when a document
+read in the transaction changed since, and ``firestore.async_transactional``
+retries it. Every call yields to the event loop, so concurrent writers interleave.
+"""
+
+import asyncio
+import copy
+import itertools
+from typing import Any, AsyncIterator
+
+from google.api_core.exceptions import Aborted
+from google.cloud import firestore
+
+
+class FakeFirestore:
+    def __init__(self) -> None:
+        # (collection, document ID) -> (data, version)
+        self.documents: dict[tuple[str, str], tuple[dict[str, Any], int]] = {}
+        self.commits = 0
+        self._versions = itertools.count(1)
+        self._ids = itertools.count(1)
+
+    def collection(self, name: str) -> "_Query":
+        return _Query(self, name)
+
+    def transaction(self, **_: Any) -> "_Transaction":
+        return _Transaction(self)
+
+    def batch(self) -> "_Batch":
+        return _Batch(self)
+
+    def _apply(self, writes: list[tuple[str, "_DocumentReference", dict[str, Any]]]) -> None:
+        self.commits += 1
+        for kind, ref, data in writes:
+            current = copy.deepcopy(self.documents[ref.key][0]) if kind == "update" and ref.key in self.documents else {}
+            for field, value in data.items():
+                if isinstance(value, firestore.Increment):
+                    value = current.get(field, 0) + value.value
+                current[field] = copy.deepcopy(value)
+            self.documents[ref.key] = (current, next(self._versions))
+
+
+class _DocumentReference:
+    def __init__(self, client: FakeFirestore, collection: str, document_id: str) -> None:
+        self._client = client
+        self.id = document_id
+        self.key = (collection, document_id)
+
+    async def get(self, transaction: "_Transaction | None" = None) -> "_Snapshot":
+        await asyncio.sleep(0)
+        data, version = self._client.documents.get(self.key, (None, 0))
+        if transaction is not None:
+            transaction.reads.setdefault(self.key, version)
+        return _Snapshot(self, data)
+
+    async def set(self, data: dict[str, Any]) -> None:
+        await asyncio.sleep(0)
+        self._client._apply([("set", self, data)])
+
+
+class _Snapshot:
+    def __init__(self, reference: _DocumentReference, data: dict[str, Any] | None) -> None:
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> dict[str, Any] | None:
+        return copy.deepcopy(self._data)
+
+
+class _Query:
+    def __init__(self, client: FakeFirestore, collection: str) -> None:
+        self._client = client
+        self._collection = collection
+        self._filters: list[Any] = []
+        self._order: tuple[str, str] | None = None
+        self._start_after: dict[str, Any] | None = None
+        self._end_before: dict[str, Any] | None = None
+        self._limit: int | None = None
+
+    def document(self, document_id: str | None = None) -> _DocumentReference:
+        return _DocumentReference(self._client, self._collection, document_id or f"doc{next(self._client._ids)}")
+
+    def _copy(self, **changes: Any) -> "_Query":
+        query = copy.copy(self)
+        query._filters = list(self._filters)
+        for name, value in changes.items():
+            setattr(query, name, value)
+        return query
+
+    def where(self, filter: Any) -> "_Query":
+        assert filter.op_string == "=="
+        return self._copy(_filters=self._filters + [filter])
+
+    def order_by(self, field: str, direction: str = firestore.Query.ASCENDING) -> "_Query":
+        return self._copy(_order=(field, direction))
+
+    def start_after(self, values: dict[str, Any]) -> "_Query":
+        return self._copy(_start_after=values)
+
+    def end_before(self, values: dict[str, Any]) -> "_Query":
+        return self._copy(_end_before=values)
+
+    def limit(self, count: int) -> "_Query":
+        return self._copy(_limit=count)
+
+    async def stream(self, transaction: Any = None) -> AsyncIterator[_Snapshot]:
+        await asyncio.sleep(0)
+        matches = [
+            (document_id, data)
+            for (collection, document_id), (data, _) in sorted(self._client.documents.items())
+            if collection == self._collection and all(data.get(f.field_path) == f.value for f in self._filters)
+        ]
+        if self._order is not None:
+            field, direction = self._order
+            descending = direction == firestore.Query.DESCENDING
+            matches = [match for match in matches if field in match[1]]
+            matches.sort(key=lambda match: match[1][field], reverse=descending)
+
+            def _after(data: dict[str, Any], cursor: dict[str, Any]) -> bool:
+                return data[field] < cursor[field] if descending else data[field] > cursor[field]
+
+            if self._start_after is not None:
+                matches = [match for match in matches if _after(match[1], self._start_after)]
+            if self._end_before is not None:
+                matches = [match for match in matches if _after(self._end_before, match[1])]
+        if self._limit is not None:
+            matches = matches[:self._limit]
+        for document_id, data in matches:
+            yield _Snapshot(_DocumentReference(self._client, self._collection, document_id), data)
+
+
+class _Batch:
+    def __init__(self, client: FakeFirestore) -> None:
+        self._client = client
+        self.writes: list[tuple[str, _DocumentReference, dict[str, Any]]] = []
+
+    def set(self, ref: _DocumentReference, data: dict[str, Any]) -> None:
+        self.writes.append(("set", ref, data))
+
+    def update(self, ref: _DocumentReference, data: dict[str, Any]) -> None:
+        self.writes.append(("update", ref, data))
+
+    async def commit(self) -> None:
+        await asyncio.sleep(0)
+        self._client._apply(self.writes)
+        self.writes = []
+
+
+class _Transaction(_Batch):
+    # The attributes and hooks ``firestore.async_transactional`` drives
+    _read_only = False
+    _max_attempts = 5
+
+    def __init__(self, client: FakeFirestore) -> None:
+        super().__init__(client)
+        self._id: object | None = None
+        self.reads: dict[tuple[str, str], int] = {}
+
+    @property
+    def in_progress(self) -> bool:
+        return self._id is not None
+
+    def _clean_up(self) -> None:
+        self._id = None
+        self.writes = []
+        self.reads = {}
+
+    async def _begin(self, retry_id: object | None = None) -> None:
+        self._id = object()
+
+    async def _rollback(self) -> None:
+        self._clean_up()
+
+    async def _commit(self) -> list[Any]:
+        await asyncio.sleep(0)
+        for key, version in self.reads.items():
+            if self._client.documents.get(key, (None, 0))[1] != version:
+                self._clean_up()
+                raise Aborted("Transaction lost a race with a concurrent write")
+        self._client._apply(self.writes)
+        self._clean_up()
+        return []
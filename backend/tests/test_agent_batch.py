@@ -0,0 +1,51 @@
+import asyncio
+
+from models.requests.agent import AgentBatchOperation
+from repository.local_backend import LocalStorageBackend
+from repository.storage_repository import StorageRepository
+from services.agent_service import AgentService
+
+
+def test_batch_reads_byte_ranges_and_tree_honours_ignore(tmp_path):
+
+    async def scenario() -> None:
+        repository = StorageRepository(LocalStorageBackend(str(tmp_path)))
+        await repository.rewrite_file_from_storage("user/course/notes.md", "0123456789")
+        await repository.rewrite_file_from_storage("user/course/build/out.md", "generated")
+        service = AgentService(repository)
+
+        results = await service.execute_batch(
+            [
+                AgentBatchOperation(op="read", path="user/course/notes.md", offset=2, length=5),
+                AgentBatchOperation(op="read", path="user/course/notes.md", offset=8),
+                AgentBatchOperation(op="tree", path="user/course/", ignore=["build"]),
+            ],
+            range_read_max_bytes=4,
+        )
+
+        assert [result["status"] for result in results] == ["success"] * 3
+        assert results[0]["result"] == {"content": "2345", "encoding": "utf-8", "offset": 2, "length": 4, "size": 10}
+        assert results[1]["result"]["content"] == "89"
+        assert "notes.md" in results[2]["result"]["tree"]
+        assert "build" not in results[2]["result"]["tree"]
+
+    asyncio.run(scenario())
+
+
+def test_batch_delete_removes_a_folder_with_its_content(tmp_path):
+
+    async def scenario() -> None:
+        repository = StorageRepository(LocalStorageBackend(str(tmp_path)))
+        await repository.rewrite_file_from_storage("user/course/build/a.md", "a")
+        await repository.rewrite_file_from_storage("user/course/build/b.md", "b")
+        await repository.rewrite_file_from_storage("user/course/notes.md", "n")
+        service = AgentService(repository)
+
+        # Older clients still send the former ``recursive`` flag; it is accepted and has no effect
+        operation = AgentBatchOperation.model_validate({"op": "delete", "path": "user/course/build", "recursive": False})
+        results = await service.execute_batch([operation])
+
+        assert results[0]["status"] == "success"
+        assert await repository.list_directory_from_storage("user/course/") == ["notes.md"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,94 @@
+import asyncio
+
+from core.blob_cache import BlobContentCache
+from core.storage_metrics import StorageRoundTripCounter
+from repository.local_backend import LocalStorageBackend
+from repository.storage_repository import StorageRepository
+
+
+def _cache(revalidate_seconds: float = 0.0) -> BlobContentCache:
+    return BlobContentCache(max_bytes=1024 * 1024, max_entry_bytes=64 * 1024, revalidate_seconds=revalidate_seconds)
+
+
+def test_hit_inside_the_window_and_miss_without_an_entry():
+
+    cache = _cache(revalidate_seconds=60.0)
+    assert cache.get("bucket", "a.md") is None
+
+    cache.put("bucket", "a.md", 1, b"one")
+    assert cache.get("bucket", "a.md") == (b"one", 1)
+    assert cache.stats()["hits"] == 1
+
+
+def test_zero_window_always_asks_for_the_generation():
+
+    cache = _cache()
+    cache.put("bucket", "a.md", 1, b"one")
+    assert cache.get("bucket", "a.md") is None
+    assert cache.get_generation("bucket", "a.md") == 1
+    assert cache.revalidate("bucket", "a.md", 1) == b"one"
+
+
+def test_generation_change_drops_the_entry():
+
+    cache = _cache()
+    cache.put("bucket", "a.md", 1, b"one")
+    assert cache.revalidate("bucket", "a.md", 2) is None
+    assert cache.get_generation("bucket", "a.md") is None
+
+
+def test_older_generation_does_not_replace_a_newer_one():
+
+    cache = _cache(revalidate_seconds=60.0)
+    cache.put("bucket", "a.md", 2, b"two")
+    cache.put("bucket", "a.md", 1, b"one")
+    assert cache.get("bucket", "a.md") == (b"two", 2)
+
+
+def test_write_from_another_instance_is_read_at_once(tmp_path):
+
+    async def scenario() -> None:
+        backend = LocalStorageBackend(str(tmp_path))
+        reader = StorageRepository(backend, cache=_cache(), metrics=StorageRoundTripCounter())
+        writer = StorageRepository(backend, cache=_cache(), metrics=StorageRoundTripCounter())
+
+        await writer.rewrite_file_from_storage("user/course/a.md", "one\n")
+        assert await reader.read_file_from_storage_string("user/course/a.md", None, None, None) == "one\n"
+        # Served from the cache after a metadata check
+        assert await reader.read_file_from_storage_string("user/course/a.md", None, None, None) == "one\n"
+        assert reader.stats()["cache"]["revalidations"] == 1
+
+        await writer.rewrite_file_from_storage("user/course/a.md", "two\n")
+        assert await reader.read_file_from_storage_string("user/course/a.md", None, None, None) == "two\n"
+
+    asyncio.run(scenario())
+
+
+def test_write_through_the_repository_replaces_the_cached_bytes(tmp_path):
+
+    async def scenario() -> None:
+        cache = _cache(revalidate_seconds=60.0)
+        repository = StorageRepository(LocalStorageBackend(str(tmp_path)), cache=cache)
+
+        await repository.rewrite_file_from_storage("user/course/a.md", "one\n")
+        assert await repository.read_file_from_storage_string("user/course/a.md", None, None, None) == "one\n"
+        await repository.rewrite_file_from_storage("user/course/a.md", "two\n")
+        assert cache.get(repository._namespace, "user/course/a.md")[0] == b"two\n"
+
+        await repository.delete_directory_file_from_storage("user/course/a.md")
+        assert cache.get_generation(repository._namespace, "user/course/a.md") is None
+
+    asyncio.run(scenario())
+
+
+def test_uploaded_bytes_are_primed_in_the_cache(tmp_path):
+
+    async def scenario() -> None:
+        cache = _cache(revalidate_seconds=60.0)
+        repository = StorageRepository(LocalStorageBackend(str(tmp_path)), cache=cache)
+
+        await repository.upload_file_bytes("user/course/slides.md", b"# Slides\n", "text/markdown")
+        assert cache.get(repository._namespace, "user/course/slides.md")[0] == b"# Slides\n"
+        assert await repository.list_directory_from_storage("user/course/") == ["slides.md"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,77 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from repository.local_backend import LocalStorageBackend
+from repository.storage_repository import StorageRepository
+from services.agent_service import AgentService
+
+
+async def _workspace(tmp_path) -> StorageRepository:
+    repository = StorageRepository(LocalStorageBackend(str(tmp_path)))
+    for number in range(7):
+        content = "needle\n" if number != 3 else "haystack\n"
+        await repository.rewrite_file_from_storage(f"user/course/f{number}.md", content)
+    return repository
+
+
+async def _stream_records(service: AgentService, **kwargs) -> list[dict]:
+    stream = await service.stream_file_content("needle", "user/course/", **kwargs)
+    return [json.loads(line) async for line in stream]
+
+
+def test_stream_resumes_from_its_cursor(tmp_path):
+
+    async def scenario() -> None:
+        service = AgentService(await _workspace(tmp_path))
+
+        pages, cursor = [], None
+        while True:
+            records = await _stream_records(service, page_size=2, cursor=cursor)
+            pages.append([record["file"] for record in records if "file" in record])
+            cursor = records[-1]["next_cursor"]
+            assert records[-1]["done"] is True
+            if cursor is None:
+                break
+
+        assert pages == [
+            ["user/course/f0.md", "user/course/f1.md"],
+            ["user/course/f2.md", "user/course/f4.md"],
+            ["user/course/f5.md", "user/course/f6.md"],
+            [],
+        ]
+
+    asyncio.run(scenario())
+
+
+def test_page_numbers_and_cursors_select_the_same_matches(tmp_path):
+
+    async def scenario() -> None:
+        service = AgentService(await _workspace(tmp_path))
+
+        first, cursor = await service.grep_file_content("needle", "user/course/", page_size=4)
+        assert first == ["user/course/f0.md", "user/course/f1.md", "user/course/f2.md", "user/course/f4.md"]
+        by_cursor, _ = await service.grep_file_content("needle", "user/course/", page_size=4, cursor=cursor)
+        by_page, _ = await service.grep_file_content("needle", "user/course/", page=2, page_size=4)
+        assert by_cursor == by_page == ["user/course/f5.md", "user/course/f6.md"]
+
+        # The repository iterator resumes strictly after the decoded name
+        matches = service._storage_repository.iter_file_content_search_from_storage(
+            "needle", False, "user/course/", service._decode_search_cursor(cursor)
+        )
+        assert [name async for name in matches] == by_cursor
+
+    asyncio.run(scenario())
+
+
+def test_invalid_cursor_is_a_400(tmp_path):
+
+    async def scenario() -> None:
+        service = AgentService(await _workspace(tmp_path))
+        with pytest.raises(HTTPException) as raised:
+            await service.stream_file_content("needle", "user/course/", cursor="***")
+        assert raised.value.status_code == 400
+
+    asyncio.run(scenario())
@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime, timezone
+
+from fastapi import Request
+from fastapi.testclient import TestClient
+
+from app import create_app
+from controllers.course_controller import get_course_service
+from models.message import MessageModel, Role
+from repository.course_repository import CourseRepository
+from repository.message_repository import MessageRepository
+from services.course_service import CourseService
+from tests.firestore_fake import FakeFirestore
+
+
+def _client_for(user_id: str) -> tuple[TestClient, CourseRepository, MessageRepository]:
+    firestore_client = FakeFirestore()
+    courses = CourseRepository(firestore_client, collection="course")
+    messages = MessageRepository(firestore_client)
+
+    app = create_app()
+    app.dependency_overrides[get_course_service] = lambda: CourseService(courses, None, messages, None)
+
+    @app.get("/_login")
+    async def _login(request: Request) -> dict:
+        now = datetime.now(timezone.utc).isoformat()
+        request.session["user"] = {
+            "id": user_id, "provider_id": user_id, "provider": "google", "email": f"{user_id}@example.com",
+            "created_at": now, "updated_at": now,
+        }
+        return {}
+
+    client = TestClient(app, base_url="https://testserver")
+    client.get("/_login")
+    return client, courses, messages
+
+
+def _message(content: str) -> MessageModel:
+    return MessageModel(id="", index=0, course_id="", role=Role.USER, content=content, createdAt=datetime.now(timezone.utc))
+
+
+def test_unchanged_page_is_answered_with_304_after_one_course_lookup():
+    client, courses, messages = _client_for("owner")
+    course = asyncio.run(courses.create_course("owner", "Course"))
+    asyncio.run(messages.append_messages(course.id, [_message("one"), _message("two")]))
+
+    lookups = []
+    get_course_by_id = courses.get_course_by_id
+
+    async def _counted_get_course_by_id(course_id):
+        lookups.append(course_id)
+        return await get_course_by_id(course_id)
+
+    courses.get_course_by_id = _counted_get_course_by_id
+
+    response = client.get(f"/api/v1/course/{course.id}/message", params={"since_index": 0})
+    assert response.status_code == 200
+    assert [message["content"] for message in response.json()["messages"]] == ["two"]
+    assert len(lookups) == 1
+    etag = response.headers["etag"]
+
+    response = client.get(f"/api/v1/course/{course.id}/message", params={"since_index": 0}, headers={"If-None-Match": etag})
+    assert response.status_code == 304 and response.headers["etag"] == etag
+
+    # A tag taken for one query does not validate another
+    response = client.get(f"/api/v1/course/{course.id}/message", params={"limit": 1}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+
+def test_etag_changes_after_an_append():
+    client, courses, messages = _client_for("owner")
+    course = asyncio.run(courses.create_course("owner", "Course"))
+    asyncio.run(messages.create_message(course.id, _message("one")))
+
+    etag = client.get(f"/api/v1/course/{course.id}/message").headers["etag"]
+    asyncio.run(messages.append_messages(course.id, [_message("two"), _message("three")]))
+
+    response = client.get(f"/api/v1/course/{course.id}/message", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert [message["index"] for message in response.json()["messages"]] == [0, 1, 2]
+
+
+def test_messages_of_another_users_course_are_forbidden():
+    client, courses, _ = _client_for("intruder")
+    course = asyncio.run(courses.create_course("owner", "Course"))
+
+    assert client.get(f"/api/v1/course/{course.id}/message").status_code == 403
+    assert client.get("/api/v1/course/missing/message").status_code == 404
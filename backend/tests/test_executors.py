@@ -0,0 +1,67 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from core.executors import ExecutorSaturated, InstrumentedExecutor, executor_saturated_handler, run_blocking
+
+
+def test_full_queue_turns_requests_away():
+
+    executor = InstrumentedExecutor("storage", max_workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario() -> None:
+        running = asyncio.ensure_future(executor.run(release.wait))
+        while executor.stats()["running"] == 0:
+            await asyncio.sleep(0.01)
+        queued = asyncio.ensure_future(executor.run(lambda: "queued"))
+        await asyncio.sleep(0)
+
+        with pytest.raises(ExecutorSaturated) as raised:
+            await executor.run(lambda: "rejected")
+        assert raised.value.retry_after >= 1
+
+        # A later step of an admitted request still waits in line
+        resumed = asyncio.ensure_future(executor.resume(lambda: "resumed"))
+        release.set()
+        assert await asyncio.gather(running, queued, resumed) == [True, "queued", "resumed"]
+
+    asyncio.run(scenario())
+    stats = executor.stats()
+    assert stats["rejected"] == 1 and stats["completed"] == 3 and stats["queued"] == 0
+
+
+def test_saturation_is_answered_with_503_and_retry_after():
+
+    executor = InstrumentedExecutor("storage", max_workers=1, max_queue=0)
+    app = FastAPI()
+    app.add_exception_handler(ExecutorSaturated, executor_saturated_handler)
+
+    @app.get("/work")
+    async def work() -> dict:
+        return {"result": await run_blocking(executor, lambda: "done")}
+
+    response = TestClient(app).get("/work")
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert "overloaded" in response.json()["detail"]
+
+
+def test_async_slots_work_on_every_event_loop():
+
+    executor = InstrumentedExecutor("firestore", max_workers=1, max_queue=10)
+
+    async def scenario() -> list[int]:
+        async def _call(number: int) -> int:
+            await asyncio.sleep(0.01)
+            return number
+
+        # Contended, so the slot semaphore has to wait on the running loop
+        return await asyncio.gather(*(executor.run_async(lambda number=number: _call(number)) for number in range(3)))
+
+    assert asyncio.run(scenario()) == [0, 1, 2]
+    assert asyncio.run(scenario()) == [0, 1, 2]
+    assert executor.stats()["completed"] == 6
@@ -0,0 +1,27 @@
+from utils.glob_pattern import compile_glob, narrow_listing_prefix
+
+
+def test_compile_glob_matches_like_fnmatch():
+
+    glob = compile_glob("user/course/*.md")
+    assert glob.matches("user/course/notes.md")
+    # "*" also crosses folders, as fnmatch does
+    assert glob.matches("user/course/week1/notes.md")
+    assert not glob.matches("user/course/notes.txt")
+    assert glob.literal_prefix == "user/course/"
+    assert glob.match_glob == "user/course/**.md"
+
+
+def test_patterns_gcs_reads_differently_are_not_pushed_down():
+
+    assert compile_glob("user/course/?.md").match_glob is None
+    assert compile_glob("user/course/[ab].md").match_glob is None
+    assert compile_glob("user/course/[ab].md").literal_prefix == "user/course/"
+    assert compile_glob("user/course/notes.md").literal_prefix == "user/course/notes.md"
+
+
+def test_narrow_listing_prefix():
+
+    assert narrow_listing_prefix("user/course/", compile_glob("user/course/week*/*.md")) == "user/course/week"
+    assert narrow_listing_prefix("user/course/week1/", compile_glob("user/course/*.md")) == "user/course/week1/"
+    assert narrow_listing_prefix("user/other/", compile_glob("user/course/*.md")) is None
@@ -0,0 +1,26 @@
+from utils.line_index import build_line_index, decode_line_index, encode_line_index, line_window_to_byte_range
+
+
+def _window(text: str, start_line: int | None, end_line: int | None) -> str:
+    content = text.encode("utf-8")
+    begin, end = line_window_to_byte_range(build_line_index(content), len(content), start_line, end_line)
+    return content[begin:end].decode("utf-8")
+
+
+def test_window_matches_splitting_the_text():
+
+    for text in ["", "one", "one\n", "one\ntwo\nthree", "one\ntwo\nthree\n", "\n\n", "é\nü\n"]:
+        lines = text.split("\n")
+        for start_line in (None, 0, 1, 2, 3, 5):
+            for end_line in (None, 0, 1, 2, 3, 10, -1):
+                start = start_line - 1 if start_line else 0
+                expected = "\n".join(lines[start:end_line])
+                assert _window(text, start_line, end_line) == expected, (text, start_line, end_line)
+
+
+def test_sidecar_round_trip():
+
+    offsets = build_line_index(b"a\nbb\nccc")
+    assert list(offsets) == [0, 2, 5]
+    assert decode_line_index(encode_line_index(offsets, 42)) == (42, offsets)
+    assert decode_line_index(b"not an index") is None
@@ -0,0 +1,113 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from models.message import MessageModel, Role
+from repository import message_repository
+from repository.message_repository import MessageRepository
+from tests.firestore_fake import FakeFirestore
+
+
+def _messages(label: str, count: int) -> list[MessageModel]:
+    now = datetime.now(timezone.utc)
+    return [
+        MessageModel(id="", index=0, course_id="", role=Role.TOOL, content=f"{label}{number}", createdAt=now)
+        for number in range(count)
+    ]
+
+
+def _visible_indexes(client: FakeFirestore) -> list[int]:
+    return sorted(data["index"] for (collection, _), (data, _) in client.documents.items() if collection == "message")
+
+
+def test_interleaved_appends_only_ever_expose_a_prefix(monkeypatch):
+    # Three messages per commit, so thirty messages take ten commits
+    monkeypatch.setattr(message_repository, "_MAX_WRITES_PER_COMMIT", 4)
+    client = FakeFirestore()
+    repository = MessageRepository(client)
+
+    snapshots = []
+    apply = client._apply
+
+    def _recording_apply(writes):
+        apply(writes)
+        snapshots.append(_visible_indexes(client))
+
+    client._apply = _recording_apply
+
+    async def _after_first_chunk(append):
+        # Starts once the long append is partly visible, so it runs between its commits
+        while not _visible_indexes(client):
+            await asyncio.sleep(0)
+        return await append
+
+    async def scenario() -> tuple[list[MessageModel], list[MessageModel], MessageModel]:
+        return await asyncio.gather(
+            repository.append_messages("course", _messages("long", 30)),
+            _after_first_chunk(repository.append_messages("course", _messages("short", 2))),
+            _after_first_chunk(repository.create_message("course", _messages("single", 1)[0])),
+        )
+
+    long, short, single = asyncio.run(scenario())
+
+    # A poller asking for messages after the last index it saw never skips one committed later
+    for indexes in snapshots:
+        assert indexes == list(range(len(indexes)))
+    assert [message.index for message in long] == list(range(long[0].index, long[0].index + 30))
+    assert [message.index for message in short] == [short[0].index, short[0].index + 1]
+    assert sorted([message.index for message in long + short] + [single.index]) == list(range(33))
+
+    assert asyncio.run(repository.get_message_count("course")) == 33
+    page, has_more = asyncio.run(repository.get_messages_page("course", limit=5, after_index=long[-1].index))
+    assert [message.index for message in page] == [index for index in range(33) if index > long[-1].index][:5]
+    assert not has_more
+
+
+def test_failed_chunk_releases_the_counter(monkeypatch):
+    monkeypatch.setattr(message_repository, "_MAX_WRITES_PER_COMMIT", 4)
+    client = FakeFirestore()
+    repository = MessageRepository(client)
+
+    async def failing_chunk(*args, **kwargs):
+        raise RuntimeError("commit failed")
+
+    monkeypatch.setattr(repository, "_commit_leased_chunk", failing_chunk)
+    with pytest.raises(RuntimeError):
+        asyncio.run(repository.append_messages("course", _messages("long", 10)))
+
+    # The reserved range stays unused, and the next writer does not wait for the lease to expire
+    message = asyncio.run(asyncio.wait_for(repository.create_message("course", _messages("single", 1)[0]), timeout=5))
+    assert message.index == 10
+    assert asyncio.run(repository.get_message_count("course")) == 4
+
+
+def test_counter_is_seeded_from_messages_written_before_it_existed():
+    client = FakeFirestore()
+    repository = MessageRepository(client)
+    for index in range(3):
+        message = _messages("old", 1)[0].model_dump()
+        client.documents[("message", f"old{index}")] = ({**message, "id": f"old{index}", "course_id": "course", "index": index}, 1)
+
+    assert asyncio.run(repository.get_message_count("course")) == 3
+    assert asyncio.run(repository.create_message("course", _messages("new", 1)[0])).index == 3
+    assert asyncio.run(repository.get_message_count("course")) == 4
+    assert asyncio.run(repository.get_message_count("empty")) == 0
+
+
+def test_pages_walk_back_from_the_newest_message():
+    client = FakeFirestore()
+    repository = MessageRepository(client)
+    asyncio.run(repository.append_messages("course", _messages("m", 7)))
+    asyncio.run(repository.append_messages("other", _messages("x", 2)))
+
+    def _page(**kwargs) -> tuple[list[int], bool]:
+        messages, has_more = asyncio.run(repository.get_messages_page("course", **kwargs))
+        return [message.index for message in messages], has_more
+
+    assert _page(limit=3) == ([4, 5, 6], True)
+    assert _page(limit=3, before_index=4) == ([1, 2, 3], True)
+    assert _page(limit=3, before_index=1) == ([0], False)
+    assert _page(limit=3, after_index=4) == ([5, 6], False)
+    assert _page(after_index=1, before_index=4) == ([2, 3], False)
+    assert _page() == (list(range(7)), False)
@@ -0,0 +1,67 @@
+import asyncio
+from array import array
+
+from repository.local_backend import LocalStorageBackend
+from repository.search_index import TrigramIndex, content_trigrams, required_trigrams
+from repository.storage_repository import StorageRepository
+
+
+def _trigrams(*runs: str) -> array:
+    return array("I", sorted({trigram for run in runs for trigram in content_trigrams(run.encode("utf-8"))}))
+
+
+def test_substring_query_requires_all_its_trigrams():
+
+    assert required_trigrams("needle", False) == content_trigrams(b"needle")
+
+
+def test_regex_requires_only_literal_runs_every_match_contains():
+
+    assert required_trigrams(r"foo(bar|baz)qux", True) == _trigrams("foo", "qux")
+    assert required_trigrams(r"^import\s+os$", True) == _trigrams("import")
+    # "b+" contributes one mandatory "b" to both neighbouring runs
+    assert required_trigrams(r"xab+cy", True) == _trigrams("xab", "bcy")
+    assert required_trigrams(r"colou?r", True) == _trigrams("colo")
+    assert required_trigrams(r"(?i)needle", True) is None
+    assert required_trigrams(r"(unbalanced", True) is None
+
+
+def test_index_rules_out_files_and_unknown_generations():
+
+    index = TrigramIndex("user/course/")
+    index.set_file("user/course/a.md", 1, b"apple pie")
+    restored = TrigramIndex.from_bytes("user/course/", index.to_bytes())
+
+    assert restored.may_match("user/course/a.md", 1, required_trigrams("apple", False)) is True
+    assert restored.may_match("user/course/a.md", 1, required_trigrams("banana", False)) is False
+    assert restored.may_match("user/course/a.md", 2, required_trigrams("apple", False)) is None
+    assert restored.may_match("user/course/b.md", 1, required_trigrams("apple", False)) is None
+
+
+def test_search_downloads_only_files_the_index_cannot_rule_out(tmp_path):
+
+    async def scenario() -> None:
+        backend = LocalStorageBackend(str(tmp_path))
+        repository = StorageRepository(backend)
+        for name, content in (("a.md", "apple pie\n"), ("b.md", "banana split\n"), ("c.md", "cherry tart\n")):
+            await repository.rewrite_file_from_storage(f"user/course/{name}", content)
+
+        downloaded = []
+        read = backend.read
+
+        def _recording_read(name, *args, **kwargs):
+            if name.startswith("user/"):
+                downloaded.append(name)
+            return read(name, *args, **kwargs)
+
+        backend.read = _recording_read
+
+        # The first query downloads every file and indexes them on the way
+        assert await repository.fuzzy_file_content_search_from_storage("pie", True, "user/course/", None) == ["user/course/a.md"]
+        assert sorted(downloaded) == ["user/course/a.md", "user/course/b.md", "user/course/c.md"]
+
+        downloaded.clear()
+        assert await repository.fuzzy_file_content_search_from_storage("banan[a]", True, "user/course/", None) == ["user/course/b.md"]
+        assert downloaded == ["user/course/b.md"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,36 @@
+import random
+
+import pytest
+
+from utils import search_replace
+from utils.search_replace import _AhoCorasick, _first_two_occurrences, apply_search_replace_blocks, parse_search_replace_blocks
+
+
+def test_automaton_agrees_with_str_find():
+
+    generator = random.Random(7)
+    text = "".join(generator.choice("abc\n") for _ in range(2000))
+    patterns = ["", "a", "ab", "abc", "bca", "cc", "aaa", "\nab", "cab\nc", "abcabcabcabc"]
+    patterns += ["".join(generator.choice("abc") for _ in range(generator.randint(1, 6))) for _ in range(50)]
+
+    found = _AhoCorasick(patterns).first_two_occurrences(text)
+    assert found == [_first_two_occurrences(text, pattern) for pattern in patterns]
+
+
+def test_automaton_counts_overlapping_occurrences_once():
+
+    # "aa" occurs at 0, 1 and 2 in "aaaa"; str.count sees two, starting at 0 and 2
+    assert _AhoCorasick(["aa", "aaa"]).first_two_occurrences("aaaa") == [[0, 2], [0]]
+
+
+def test_many_blocks_take_the_automaton_path(monkeypatch):
+
+    monkeypatch.setattr(search_replace, "_AUTOMATON_MIN_BLOCKS", 2)
+    content = "alpha\nbeta\ngamma\n"
+    blocks = parse_search_replace_blocks("alpha\n>>>>>\nALPHA\n<<<<<\ngamma\n>>>>>\nGAMMA\n<<<<<\nmissing\n>>>>>\nx\n<<<<<")
+    assert apply_search_replace_blocks(content, blocks) == "ALPHA\nbeta\nGAMMA\n"
+
+    with pytest.raises(ValueError, match="multiple times"):
+        apply_search_replace_blocks("a a", [("a", "b"), ("zzz", "y")])
+    with pytest.raises(ValueError, match="overlap"):
+        apply_search_replace_blocks("abcd", [("abc", "x"), ("bcd", "y")])
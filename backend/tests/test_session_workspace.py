@@ -0,0 +1,92 @@
+import asyncio
+
+from fastapi import HTTPException
+
+from core.storage_metrics import StorageRoundTripCounter
+from repository.local_backend import LocalStorageBackend
+from repository.storage_repository import StorageRepository
+from services.agent_service import AgentService
+
+
+def test_large_text_file_written_through_session(tmp_path):
+
+    async def scenario() -> None:
+        repository = StorageRepository(
+            LocalStorageBackend(str(tmp_path / "storage")),
+            line_index_min_bytes=1024,
+            metrics=StorageRoundTripCounter(),
+        )
+        workspace = repository.open_session_workspace("course", "user/course/", str(tmp_path / "spool"))
+        session = repository.for_session(workspace)
+
+        content = "".join(f"line {number}\n" for number in range(1000))
+        await session.rewrite_file_from_storage("user/course/notes.md", content)
+        window = await session.read_file_from_storage_string("user/course/notes.md", 10, 12, None)
+        assert window.startswith("line 9")
+
+        workspace.close()
+        result = await repository.flush_session_workspace(workspace)
+        assert result["written"] == 1 and not result["conflicts"]
+
+        # The flush leaves an index of the committed generation for line-window reads
+        window = await repository.read_file_from_storage_string("user/course/notes.md", 10, 12, None)
+        assert window.startswith("line 9")
+
+    asyncio.run(scenario())
+
+
+def test_flush_keeps_the_session_version_of_a_conflicting_file(tmp_path):
+
+    async def scenario() -> None:
+        repository = StorageRepository(LocalStorageBackend(str(tmp_path / "storage")), metrics=StorageRoundTripCounter())
+        await repository.rewrite_file_from_storage("user/course/notes.md", "original\n")
+        workspace = repository.open_session_workspace("course", "user/course/", str(tmp_path / "spool"))
+        session = repository.for_session(workspace)
+
+        await session.rewrite_file_from_storage("user/course/notes.md", "from the agent\n")
+        await repository.rewrite_file_from_storage("user/course/notes.md", "from the user\n")
+
+        workspace.close()
+        result = await repository.flush_session_workspace(workspace)
+        assert result["conflicts"] == ["user/course/notes.md"]
+        copy = result["conflict_copies"]["user/course/notes.md"]
+        assert copy.startswith("user/course/notes.conflict-") and copy.endswith(".md")
+
+        assert await repository.read_file_from_storage_string("user/course/notes.md", None, None, None) == "from the user\n"
+        assert await repository.read_file_from_storage_string(copy, None, None, None) == "from the agent\n"
+        listing = await repository.fuzzy_file_content_search_from_storage("from the agent", False, "user/course/", None)
+        assert listing == [copy]
+
+    asyncio.run(scenario())
+
+
+def test_write_racing_close_is_applied_or_refused_with_409(tmp_path):
+
+    async def scenario() -> None:
+        repository = StorageRepository(LocalStorageBackend(str(tmp_path / "storage")), metrics=StorageRoundTripCounter())
+        workspace = repository.open_session_workspace("course", "user/course/", str(tmp_path / "spool"))
+        service = AgentService(repository.for_session(workspace))
+
+        async def _rewrite(number: int) -> int:
+            try:
+                await service.rewrite_file(f"user/course/f{number}.md", f"{number}\n")
+            except HTTPException as exc:
+                return exc.status_code
+            return 200
+
+        # Closes the session from another thread while the writes run on the storage executor
+        closer = asyncio.get_running_loop().run_in_executor(None, workspace.close)
+        statuses = await asyncio.gather(*(_rewrite(number) for number in range(20)))
+        await closer
+        statuses.append(await _rewrite(20))
+        assert set(statuses) <= {200, 409} and statuses[-1] == 409
+
+        result = await repository.flush_session_workspace(workspace)
+        assert result["written"] == statuses.count(200)
+        for number, code in enumerate(statuses):
+            if code == 200:
+                assert await repository.read_file_from_storage_string(f"user/course/f{number}.md", None, None, None) == f"{number}\n"
+        listing = await repository.list_directory_from_storage("user/course/")
+        assert sorted(listing) == sorted(f"f{number}.md" for number, code in enumerate(statuses) if code == 200)
+
+    asyncio.run(scenario())
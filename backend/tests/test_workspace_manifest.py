@@ -0,0 +1,88 @@
+import asyncio
+
+from core.blob_cache import BlobContentCache
+from repository.local_backend import LocalStorageBackend
+from repository.storage_backend import PreconditionFailed
+from repository.storage_repository import MANIFEST_PREFIX, StorageRepository
+
+
+def _repository(backend: LocalStorageBackend) -> StorageRepository:
+    cache = BlobContentCache(max_bytes=1024 * 1024, max_entry_bytes=64 * 1024, revalidate_seconds=0.0)
+    return StorageRepository(backend, cache=cache)
+
+
+def _stored_names(backend: LocalStorageBackend, prefix: str) -> list[str]:
+    return sorted(blob.name[len(prefix):] for blobs, _ in backend.list_pages(prefix) for blob in blobs)
+
+
+def test_concurrent_writes_from_two_instances_all_reach_the_listing(tmp_path):
+
+    async def scenario() -> None:
+        backend = LocalStorageBackend(str(tmp_path))
+        first, second = _repository(backend), _repository(backend)
+        await first.rewrite_file_from_storage("user/course/seed.md", "seed\n")
+        # Builds the manifest, so the writes below update it instead of skipping it
+        assert await first.list_directory_from_storage("user/course/") == ["seed.md"]
+
+        await asyncio.gather(*(
+            (first if i % 2 else second).rewrite_file_from_storage(f"user/course/f{i:02d}.md", f"{i}\n")
+            for i in range(24)
+        ))
+
+        expected = _stored_names(backend, "user/course/")
+        assert len(expected) == 25
+        assert sorted(await first.list_directory_from_storage("user/course/")) == expected
+        assert sorted(await second.list_directory_from_storage("user/course/")) == expected
+
+    asyncio.run(scenario())
+
+
+def test_listing_is_rebuilt_after_updates_run_out_of_retries(tmp_path):
+
+    async def scenario() -> None:
+        backend = LocalStorageBackend(str(tmp_path))
+        repository = _repository(backend)
+        await repository.rewrite_file_from_storage("user/course/a.md", "a\n")
+        assert await repository.list_directory_from_storage("user/course/") == ["a.md"]
+
+        write = backend.write
+
+        def contended_write(name, data, content_type, if_generation_match=None):
+            if name.startswith(MANIFEST_PREFIX) and if_generation_match:
+                raise PreconditionFailed(name)
+            return write(name, data, content_type, if_generation_match)
+
+        backend.write = contended_write
+        await repository.rewrite_file_from_storage("user/course/b.md", "b\n")
+        backend.write = write
+        assert len(_stored_names(backend, f"{MANIFEST_PREFIX}user/course/")) == 15
+
+        # The contended shard was dropped instead of left behind without b.md
+        assert sorted(await repository.list_directory_from_storage("user/course/")) == ["a.md", "b.md"]
+        assert len(_stored_names(backend, f"{MANIFEST_PREFIX}user/course/")) == 16
+
+    asyncio.run(scenario())
+
+
+def test_manifest_is_rebuilt_from_storage(tmp_path):
+
+    async def scenario() -> None:
+        backend = LocalStorageBackend(str(tmp_path))
+        repository = _repository(backend)
+        await repository.rewrite_file_from_storage("user/course/a.md", "a\n")
+        assert await repository.list_directory_from_storage("user/course/") == ["a.md"]
+
+        # Written around the repository, so no shard knows about it until a rescan
+        backend.write("user/course/notes/b.md", b"b\n", "text/markdown")
+        assert await repository.list_directory_from_storage("user/course/") == ["a.md"]
+
+        assert await repository.rescan_workspace_manifest("user/course/") == 2
+        assert sorted(await repository.list_directory_from_storage("user/course/")) == ["a.md", "notes/"]
+
+        # A missing shard makes the next read rebuild the whole manifest
+        backend.write("user/course/c.md", b"c\n", "text/markdown")
+        shards = _stored_names(backend, f"{MANIFEST_PREFIX}user/course/")
+        backend.delete(f"{MANIFEST_PREFIX}user/course/{shards[0]}")
+        assert sorted(await repository.list_directory_from_storage("user/course/")) == ["a.md", "c.md", "notes/"]
+
+    asyncio.run(scenario())
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import fnmatch
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+_WILDCARDS = "*?["
+# Characters GCS match_glob gives a meaning that fnmatch does not, or whose fnmatch meaning differs
+_NOT_PUSHABLE = set("?[]{}\\")
+
+
+@dataclass(frozen=True)
+class CompiledGlob:
+    """An fnmatch pattern prepared for matching full blob names.
+
+    ``literal_prefix`` is the part before the first wildcard: every match starts
+    with it, so listings can be narrowed to it. ``match_glob`` is the equivalent
+    GCS ``match_glob`` expression, or None when the pattern cannot be expressed
+    exactly and has to be filtered client-side only.
+    """
+
+    pattern: re.Pattern[str]
+    literal_prefix: str
+    match_glob: str | None
+
+    def matches(self, name: str) -> bool:
+        return self.pattern.match(name) is not None
+
+
+@lru_cache(maxsize=256)
+def compile_glob(query: str) -> CompiledGlob:
+    # Same semantics as fnmatch.fnmatch on POSIX: case-sensitive, and "*" also matches "/"
+    pattern = re.compile(fnmatch.translate(query))
+
+    cut = min((query.index(char) for char in _WILDCARDS if char in query), default=len(query))
+    literal_prefix = query[:cut]
+
+    match_glob = None
+    if not _NOT_PUSHABLE & set(query):
+        # GCS "*" stops at "/", "**" does not; collapse runs of stars so each becomes one "**"
+        match_glob = re.sub(r"\*+", "**", query)
+
+    return CompiledGlob(pattern=pattern, literal_prefix=literal_prefix, match_glob=match_glob)
+
+
+def narrow_listing_prefix(prefix: str, glob: CompiledGlob) -> str | None:
+    """The longest prefix to list for names under ``prefix`` matching ``glob``; None if none can match."""
+
+    if glob.literal_prefix.startswith(prefix):
+        return glob.literal_prefix
+    if prefix.startswith(glob.literal_prefix):
+        return prefix
+    return None
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import struct
+import sys
+from array import array
+
+# Sidecar layout: magic, source generation, typecode, then the line-start offsets
+_MAGIC = b"LIDX1"
+_HEADER = struct.Struct("<5sQc")
+
+
+def build_line_index(content: bytes) -> array:
+    """Return the byte offset at which every line of ``content`` starts."""
+
+    typecode = "I" if len(content) < 2**32 else "Q"
+    offsets = array(typecode, [0])
+    position = content.find(b"\n")
+    while position != -1:
+        offsets.append(position + 1)
+        position = content.find(b"\n", position + 1)
+    return offsets
+
+
+def encode_line_index(offsets: array, generation: int) -> bytes:
+
+    body = array(offsets.typecode, offsets)
+    if sys.byteorder != "little":
+        body.byteswap()
+    return _HEADER.pack(_MAGIC, generation, offsets.typecode.encode("ascii")) + body.tobytes()
+
+
+def decode_line_index(data: bytes) -> tuple[int, array] | None:
+    """Return ``(source_generation, offsets)`` or None if the sidecar is unreadable."""
+
+    if len(data) < _HEADER.size:
+        return None
+    magic, generation, typecode = _HEADER.unpack_from(data)
+    if magic != _MAGIC or typecode not in (b"I", b"Q"):
+        return None
+
+    offsets = array(typecode.decode("ascii"))
+    body = data[_HEADER.size:]
+    if len(body) % offsets.itemsize:
+        return None
+    offsets.frombytes(body)
+    if sys.byteorder != "little":
+        offsets.byteswap()
+    return generation, offsets
+
+
+def line_window_to_byte_range(
+    offsets: array,
+    size: int,
+    start_line: int | None,
+    end_line: int | None,
+) -> tuple[int, int]:
+    """Map a 1-based ``start_line..end_line`` window to a half-open byte range.
+
+    Mirrors ``"\\n".join(text.split("\\n")[start:end])``: the newline that
+    terminates the last selected line is not part of the range.
+    """
+
+    line_count = len(offsets)
+    start = (start_line - 1) if start_line is not None and start_line > 0 else 0
+    end = end_line if end_line is not None else line_count
+    start, end, _ = slice(start, end).indices(line_count)
+
+    if end <= start:
+        return 0, 0
+
+    begin = offsets[start]
+    finish = offsets[end] - 1 if end < line_count else size
+    return begin, max(begin, finish)
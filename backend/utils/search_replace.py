@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import re
+from collections import deque
+
+_BLOCK_PATTERN = re.compile(r"(?:^|\n)(.*?)\n>>>>>\n(.*?)\n<<<<<", re.DOTALL)
+
+# A str.find per block runs in C and costs about 1/300 of a Python-level automaton step per
+# character, so the single-pass automaton only wins once an edit carries hundreds of blocks
+_AUTOMATON_MIN_BLOCKS = 256
+
+
+def parse_search_replace_blocks(text: str) -> list[tuple[str, str]]:
+    """Split ``SEARCH\\n>>>>>\\nREPLACE\\n<<<<<`` blocks into (search, replace) pairs."""
+
+    return _BLOCK_PATTERN.findall(text)
+
+
+def apply_search_replace_blocks(content: str, blocks: list[tuple[str, str]]) -> str:
+    """Apply every block to ``content`` in a single pass and return the edited text.
+
+    All blocks are located in the original content first. A search text that
+    does not occur is skipped; one that occurs more than once, or whose
+    occurrence overlaps another block's, makes the edit ambiguous and raises
+    ValueError. The result is assembled with one join instead of one full
+    copy of the file per block.
+    """
+
+    if len(blocks) >= _AUTOMATON_MIN_BLOCKS:
+        occurrences = _AhoCorasick([search for search, _ in blocks]).first_two_occurrences(content)
+    else:
+        occurrences = [_first_two_occurrences(content, search) for search, _ in blocks]
+
+    spans: list[tuple[int, int, int]] = []
+    for number, (search, _) in enumerate(blocks):
+        starts = occurrences[number]
+        if not starts:
+            # Same as before: a block that is not found is skipped
+            continue
+        if len(starts) > 1:
+            raise ValueError(
+                f"Search block found multiple times ({content.count(search)}), ambiguous edit:\n{search}"
+            )
+        spans.append((starts[0], starts[0] + len(search), number))
+
+    spans.sort()
+    for (previous_start, previous_end, previous), (start, _, current) in zip(spans, spans[1:]):
+        if start < previous_end or start == previous_start:
+            raise ValueError(
+                f"Search blocks overlap, ambiguous edit:\n{blocks[previous][0]}\n---\n{blocks[current][0]}"
+            )
+
+    pieces: list[str] = []
+    position = 0
+    for start, end, number in spans:
+        pieces.append(content[position:start])
+        pieces.append(blocks[number][1])
+        position = end
+    pieces.append(content[position:])
+    return "".join(pieces)
+
+
+def _first_two_occurrences(content: str, search: str) -> list[int]:
+    # Non-overlapping occurrences, like str.count; two are enough to call a block ambiguous
+    first = content.find(search)
+    if first < 0:
+        return []
+    second = content.find(search, first + max(len(search), 1))
+    return [first] if second < 0 else [first, second]
+
+
+class _AhoCorasick:
+    """Automaton that finds every occurrence of many patterns in one scan of the text."""
+
+    def __init__(self, patterns: list[str]) -> None:
+        self._patterns = patterns
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        # Pattern numbers ending at each state, including those reached through fail links
+        self._output: list[list[int]] = [[]]
+
+        for number, pattern in enumerate(patterns):
+            state = 0
+            for character in pattern:
+                next_state = self._goto[state].get(character)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][character] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = next_state
+            self._output[state].append(number)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for character, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and character not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(character, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def first_two_occurrences(self, text: str) -> list[list[int]]:
+        """Start offsets of the first two non-overlapping occurrences of each pattern."""
+
+        found: list[list[int]] = [[] for _ in self._patterns]
+        # An empty pattern occurs at every offset
+        for number, pattern in enumerate(self._patterns):
+            if not pattern:
+                found[number] = _first_two_occurrences(text, pattern)
+
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+        for index, character in enumerate(text):
+            while state and character not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(character, 0)
+            for number in output[state]:
+                starts = found[number]
+                if len(starts) == 2:
+                    continue
+                start = index + 1 - len(self._patterns[number])
+                if not starts or start >= starts[0] + len(self._patterns[number]):
+                    starts.append(start)
+        return found